@@ -0,0 +1,121 @@
+"""Bit planes packed into 64-bit words.
+
+The MNS of the Anoto codec is at most 64 bits long, so that every cyclic
+rotation of it fits a single machine word. Along the direction the MNS
+is repeated, a row of the y-plane (a column of the x-plane) is nothing
+but the MNS rotated by the offset of that row, hence a packed row of
+any length is a sequence of precomputed rotation words.
+
+BitboardEngine uses this representation to encode regions word-wise and
+to locate partial sequences in the MNS by masked comparison of packed
+codes with all rotations. It is selected per codec, see
+AnotoCodec.use_engine.
+"""
+
+import numpy as np
+
+
+def pack_words(bits: np.ndarray) -> np.ndarray:
+    """Packs (...,K) binary sequences with K <= 64 into uint64 words.
+
+    Element i of a sequence becomes bit i of the word.
+    """
+    bits = np.asarray(bits)
+    K = bits.shape[-1]
+    if K > 64:
+        raise ValueError(f"Cannot pack sequences longer than 64, got {K}")
+    padded = np.zeros(bits.shape[:-1] + (64,), dtype=np.uint8)
+    padded[..., :K] = bits
+    return np.packbits(padded, axis=-1, bitorder="little").view("<u8")[..., 0]
+
+
+def unpack_words(words: np.ndarray, count: int) -> np.ndarray:
+    """Unpacks (...,C) uint64 words into (...,count) int8 bits, word after word."""
+    words = np.ascontiguousarray(words, dtype="<u8")
+    bits = np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little")
+    return bits[..., :count].astype(np.int8)
+
+
+class BitboardEngine:
+    """Encodes and matches the MNS using packed uint64 bit planes."""
+
+    def __init__(self, mns: np.ndarray) -> None:
+        """Initialize the engine.
+
+        Params:
+            mns: binary main number sequence of at most 64 elements
+        """
+        mns = np.asarray(mns, dtype=np.int8)
+        m = len(mns)
+        if m > 64:
+            raise ValueError(f"MNS of length {m} does not fit a 64-bit word")
+        self.mns_length = m
+        # rotations[r] holds the 64 elements following location r cyclically
+        idx = (np.arange(m)[:, None] + np.arange(64)[None, :]) % m
+        self.rotations = pack_words(mns[idx])
+
+    def pack_runs(self, offsets: np.ndarray, length: int) -> np.ndarray:
+        """Packs runs of the MNS repeated cyclically.
+
+        Params:
+            offsets: (N,) MNS locations at which runs start
+            length: number of elements per run
+
+        Returns:
+            words: (N,ceil(length/64)) uint64 words
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        starts = 64 * np.arange(-(-length // 64), dtype=np.int64)
+        return self.rotations[(offsets[:, None] + starts[None, :]) % self.mns_length]
+
+    def encode(
+        self,
+        xroll: np.ndarray,
+        yroll: np.ndarray,
+        origin: tuple[int, int],
+    ) -> np.ndarray:
+        """Generates the (H,W,2) bitmatrix of a region from MNS offsets.
+
+        Params:
+            xroll: (W,) MNS offsets of the region's columns
+            yroll: (H,) MNS offsets of the region's rows
+            origin: (x,y) position of the top-left corner of the region
+
+        Returns:
+            bits: (H,W,2) matrix of encoded position coordinates
+        """
+        x0, y0 = int(origin[0]), int(origin[1])
+        H, W = len(yroll), len(xroll)
+        # x-plane is packed along columns, y-plane along rows
+        xplane = self.pack_runs(np.asarray(xroll) + y0, H)
+        yplane = self.pack_runs(np.asarray(yroll) + x0, W)
+        m = np.empty((H, W, 2), dtype=np.int8)
+        m[..., 0] = unpack_words(xplane, H).T
+        m[..., 1] = unpack_words(yplane, W)
+        return m
+
+    def locate(self, seqs: np.ndarray, chunk_size: int = 2**14) -> np.ndarray:
+        """Locates (...,K) binary sequences in the cyclic MNS.
+
+        Params:
+            seqs: (...,K) binary sequences with K <= 64
+            chunk_size: number of sequences compared at once
+
+        Returns:
+            locs: (...) first MNS location of each sequence or -1 if the
+                sequence does not occur.
+        """
+        seqs = np.asarray(seqs)
+        K = seqs.shape[-1]
+        codes = pack_words(seqs).reshape(-1)
+        mask = np.uint64((1 << K) - 1) if K < 64 else np.uint64(2**64 - 1)
+        masked = self.rotations & mask
+        locs = np.empty(len(codes), dtype=np.int64)
+        for start in range(0, len(codes), chunk_size):
+            c = codes[start : start + chunk_size]
+            hit = c[:, None] == masked[None, :]
+            first = hit.argmax(-1)
+            locs[start : start + chunk_size] = np.where(
+                hit[np.arange(len(c)), first], first, -1
+            )
+        return locs.reshape(seqs.shape[:-1])
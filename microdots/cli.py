@@ -0,0 +1,304 @@
+"""Command-line interface for bulk encoding and decoding.
+
+Usage:
+    microdots encode --shape 3564 2523 --section 10 2 page.npy
+    microdots preview --shape 3564 2523 --section 10 2 preview/
+    microdots decode windows.npy results.npy --jobs 4 --sections
+    microdots validate --stop 1000000 --jobs 4 --checkpoint v.json
+    microdots serve /tmp/microdots.sock
+    microdots bench
+
+All bulk data is exchanged through .npy files which are memory-mapped,
+so that inputs and outputs larger than memory can be processed. Decoding
+results are stored as structured array (see results.result_dtype).
+Sections are -1 unless requested.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import daemon, defaults, helpers, preview
+from .codec import DecodeStatus
+from .results import result_dtype
+
+CODECS = {
+    "anoto_6x6": defaults.anoto_6x6,
+    "anoto_6x6_a4_fixed": defaults.anoto_6x6_a4_fixed,
+}
+
+
+def _load_windows(path: str, key: str = None) -> np.ndarray:
+    """Memory-maps .npy files; .npz members are loaded into memory."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return data[key if key is not None else data.files[0]]
+    return np.load(path, mmap_mode="r")
+
+
+def cmd_encode(args) -> int:
+    codec = CODECS[args.codec]
+    H, W = args.shape
+    ext = os.path.splitext(args.output)[1].lower()
+    if ext == ".pgm":
+        with open(args.output, "wb") as f:
+            f.write(f"P5\n{W * args.cell} {H * args.cell}\n255\n".encode())
+            for y0 in range(0, H, args.strip):
+                h = min(args.strip, H - y0)
+                bits = codec.encode_region((0, y0), (h, W), section=args.section)
+                img = preview.render_dots(helpers.bits_to_num(bits), args.cell)
+                f.write(img.tobytes())
+        return 0
+
+    shape = (H, W) if args.symbols else (H, W, 2)
+    dtype = np.uint8 if args.symbols else np.int8
+    out = np.lib.format.open_memmap(args.output, mode="w+", dtype=dtype, shape=shape)
+    for y0 in range(0, H, args.strip):
+        h = min(args.strip, H - y0)
+        bits = codec.encode_region((0, y0), (h, W), section=args.section)
+        out[y0 : y0 + h] = helpers.bits_to_num(bits) if args.symbols else bits
+    out.flush()
+    return 0
+
+
+def cmd_preview(args) -> int:
+    codec = CODECS[args.codec]
+    shape = tuple(args.shape)
+    strips = preview.page_strips(codec, shape, section=args.section, strip=args.strip)
+    pyr = preview.build_pyramid(
+        args.output, strips, shape=shape, cell=args.cell, tile_size=args.tile
+    )
+    print(json.dumps({"levels": pyr.num_levels, "shape": list(pyr.shape)}))
+    return 0
+
+
+def _decode_chunk(
+    codec_name: str,
+    path: str,
+    key: str,
+    output: str,
+    start: int,
+    stop: int,
+    sections: bool,
+    rotation: bool,
+):
+    codec = CODECS[codec_name]
+    windows = _load_windows(path, key)[start:stop]
+    if windows.ndim == 3:
+        windows = helpers.num_to_bits(np.asarray(windows, dtype=np.uint8))
+    out = np.load(output, mmap_mode="r+")
+    res = codec.decode_batch(
+        windows, out=out[start:stop], sections=sections, rotation=rotation
+    )
+    out.flush()
+    return int((res["status"] == DecodeStatus.OK).sum())
+
+
+def cmd_decode(args) -> int:
+    windows = _load_windows(args.input, args.key)
+    if windows.ndim not in (3, 4):
+        print(
+            f"Expected (B,N,M,2) bits or (B,N,M) symbols, got {windows.shape}",
+            file=sys.stderr,
+        )
+        return 2
+    B = len(windows)
+    out = np.lib.format.open_memmap(args.output, "w+", dtype=result_dtype(), shape=(B,))
+    del out
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, key = args.input, args.key
+        if path.endswith(".npz"):
+            # Members of .npz files cannot be memory-mapped. Convert once, so
+            # that chunks do not reload the whole member.
+            path, key = os.path.join(tmp, "windows.npy"), None
+            np.save(path, windows)
+        del windows
+
+        chunks = [(b, min(b + args.chunk, B)) for b in range(0, B, args.chunk)]
+        opts = (args.sections, args.rotation)
+        jobs = [(args.codec, path, key, args.output, b, e, *opts) for b, e in chunks]
+        t0 = time.perf_counter()
+        if args.jobs <= 1:
+            num_ok = sum(_decode_chunk(*j) for j in jobs)
+        else:
+            with ProcessPoolExecutor(max_workers=args.jobs) as ex:
+                num_ok = sum(ex.map(_decode_chunk, *zip(*jobs))) if jobs else 0
+        elapsed = time.perf_counter() - t0
+    print(
+        json.dumps(
+            {"windows": B, "ok": num_ok, "failed": B - num_ok, "seconds": elapsed}
+        )
+    )
+    return 0 if num_ok == B else 1
+
+
+def cmd_validate(args) -> int:
+    from .validation import validate_codec
+
+    def progress(n, total):
+        print(f"\r{n}/{total}", end="", file=sys.stderr)
+
+    report = validate_codec(
+        CODECS[args.codec],
+        start=args.start,
+        stop=args.stop,
+        section=args.section,
+        chunk_size=args.chunk,
+        max_workers=0 if args.jobs is not None and args.jobs <= 1 else args.jobs,
+        checkpoint=args.checkpoint,
+        progress=progress if args.progress else None,
+    )
+    if args.progress:
+        print(file=sys.stderr)
+    print(
+        json.dumps(
+            {
+                "ok": report.ok,
+                "checked": report.num_checked,
+                "failed": report.num_failed,
+                "collisions": report.num_collisions,
+                "first_collisions": report.collisions[:10],
+                "first_unreachable": report.unreachable[:10],
+            }
+        )
+    )
+    return 0 if report.ok else 1
+
+
+def cmd_bench(args) -> int:
+    codec = CODECS[args.codec]
+    H, W = args.shape
+    t0 = time.perf_counter()
+    page = codec.encode_region((0, 0), (H, W), section=(10, 2))
+    t_encode = time.perf_counter() - t0
+
+    rng = np.random.default_rng(0)
+    ys = rng.integers(0, H - codec.mns_order, args.windows)
+    xs = rng.integers(0, W - codec.mns_order, args.windows)
+    k = np.arange(codec.mns_order)
+    windows = page[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+
+    t0 = time.perf_counter()
+    xy, _ = codec.decode_positions(windows)
+    t_batch = time.perf_counter() - t0
+    n_single = min(args.windows, 1000)
+    t0 = time.perf_counter()
+    for w in windows[:n_single]:
+        codec.decode_position(w)
+    t_single = time.perf_counter() - t0
+    if not np.all(xy == np.stack((xs, ys), -1)):
+        print("Batch decoding returned wrong positions", file=sys.stderr)
+        return 1
+
+    print(
+        json.dumps(
+            {
+                "encode_page_seconds": t_encode,
+                "decode_batch_windows_per_second": args.windows / t_batch,
+                "decode_single_windows_per_second": n_single / t_single,
+            }
+        )
+    )
+    return 0
+
+
+def cmd_serve(args) -> int:
+    server = daemon.DecodeServer(
+        CODECS[args.codec],
+        args.socket,
+        max_batch=args.max_batch,
+        max_delay=args.max_delay,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="microdots", description="Bulk encoding and decoding of Anoto patterns."
+    )
+    parser.add_argument(
+        "--codec",
+        choices=sorted(CODECS),
+        default="anoto_6x6_a4_fixed",
+        help="codec embodiment",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("encode", help="encode a page strip-wise")
+    p.add_argument("output", help=".npy bitmatrix/symbols or .pgm image")
+    p.add_argument("--shape", type=int, nargs=2, metavar=("H", "W"), required=True)
+    p.add_argument("--section", type=int, nargs=2, metavar=("U", "V"), default=(0, 0))
+    p.add_argument(
+        "--symbols", action="store_true", help="store (H,W) symbols, a byte per dot"
+    )
+    p.add_argument("--strip", type=int, default=1024, help="rows per strip")
+    p.add_argument("--cell", type=int, default=6, help="pixels per dot in images")
+    p.set_defaults(func=cmd_encode)
+
+    p = sub.add_parser("preview", help="build a tiled preview pyramid of a page")
+    p.add_argument("output", help="output directory")
+    p.add_argument("--shape", type=int, nargs=2, metavar=("H", "W"), required=True)
+    p.add_argument("--section", type=int, nargs=2, metavar=("U", "V"), default=(0, 0))
+    p.add_argument("--strip", type=int, default=1024, help="rows per strip")
+    p.add_argument("--cell", type=int, default=8, help="pixels per dot of leaf tiles")
+    p.add_argument("--tile", type=int, default=256, help="pixels per tile side")
+    p.set_defaults(func=cmd_preview)
+
+    p = sub.add_parser("decode", help="decode a stack of windows")
+    p.add_argument("input", help=".npy or .npz of (B,N,M,2) bits or (B,N,M) symbols")
+    p.add_argument("output", help=".npy of (B,) structured results")
+    p.add_argument("--key", default=None, help="array name in .npz inputs")
+    p.add_argument("--sections", action="store_true", help="also decode sections")
+    p.add_argument("--rotation", action="store_true", help="also decode rotations")
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes, at most 1 decodes in-process",
+    )
+    p.add_argument("--chunk", type=int, default=65536, help="windows per task")
+    p.set_defaults(func=cmd_decode)
+
+    p = sub.add_parser("validate", help="validate the codec's address space")
+    p.add_argument("--start", type=int, default=0)
+    p.add_argument("--stop", type=int, default=None)
+    p.add_argument("--section", type=int, default=0)
+    p.add_argument(
+        "--jobs", type=int, default=None, help="at most 1 validates in-process"
+    )
+    p.add_argument("--chunk", type=int, default=2**18)
+    p.add_argument("--checkpoint", default=None)
+    p.add_argument("--progress", action="store_true")
+    p.set_defaults(func=cmd_validate)
+
+    p = sub.add_parser("bench", help="benchmark encoding and decoding")
+    p.add_argument("--shape", type=int, nargs=2, default=(356, 252))
+    p.add_argument("--windows", type=int, default=100000)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("serve", help="serve batched decoding on a Unix socket")
+    p.add_argument("socket", help="path of the Unix domain socket")
+    p.add_argument("--max-batch", type=int, default=2**16, help="frames per batch")
+    p.add_argument("--max-delay", type=float, default=0.002, help="batching delay [s]")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    args = make_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
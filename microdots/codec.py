@@ -1,9 +1,22 @@
+import enum
+import hashlib
+import os
+
 import numpy as np
 
 from microdots import helpers
 
-from . import integer
+from . import integer, packed, results, sparse
+from .bitboard import BitboardEngine
 from .exceptions import DecodingError
+from .instrumentation import CodecInstrumentation
+from .window_cache import WindowCache
+from .window_index import WindowIndex
+
+
+"""Maximum number of candidate locations (windows x templates x rows) that
+error correction expands at once."""
+CORRECTION_CHUNK_SIZE = 2**20
 
 
 def _make_cyclic(seq: np.ndarray, order: int) -> np.ndarray:
@@ -12,6 +25,88 @@ def _make_cyclic(seq: np.ndarray, order: int) -> np.ndarray:
     return np.concatenate((seq, seq[: order - 1]))
 
 
+def _window_weights(order: int, base: int) -> np.ndarray:
+    """Returns the weights that pack a window of symbols into an integer code."""
+    return base ** np.arange(order, dtype=np.int64)
+
+
+def _make_window_lut(seq_cyclic: np.ndarray, order: int, base: int) -> np.ndarray:
+    """Returns a lookup table from packed window code to the position of
+    the first occurrence of the window in the cyclic sequence. Codes of
+    windows not present in the sequence map to -1."""
+    view = np.lib.stride_tricks.sliding_window_view(seq_cyclic, order)
+    codes = view.astype(np.int64) @ _window_weights(order, base)
+    lut = np.full(base**order, -1, dtype=np.int32)
+    ucodes, first = np.unique(codes, return_index=True)
+    lut[ucodes] = first
+    return lut
+
+
+def _make_neighbour_table(
+    mns: np.ndarray, length: int, max_errors: int
+) -> tuple[np.ndarray, list[int]]:
+    """Returns a (max_errors+1,2**length,N) table that lists for each Hamming
+    distance d and packed code the MNS locations whose partial sequence of
+    the given length differs from the code in exactly d bits. Entries are
+    padded with -1. Also returns the number of used columns per distance."""
+    m = len(mns)
+    view = np.asarray(mns)[(np.arange(m)[:, None] + np.arange(length)) % m]
+    mns_codes = view.astype(np.int64) @ _window_weights(length, 2)
+    codes = np.arange(2**length, dtype=np.int64)
+    x = codes[:, None] ^ mns_codes[None, :]
+    dist = np.zeros(x.shape, dtype=np.int64)
+    for b in range(length):
+        dist += (x >> b) & 1
+
+    widths = [max(int((dist == d).sum(-1).max()), 1) for d in range(max_errors + 1)]
+    table = np.full((max_errors + 1, len(codes), max(widths)), -1, dtype=np.int32)
+    for d in range(max_errors + 1):
+        for c in codes:
+            locs = np.flatnonzero(dist[c] == d)
+            table[d, c, : len(locs)] = locs
+    return table, widths
+
+
+def _make_correction_templates(
+    rows: int, widths: list[int], max_errors: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Enumerates all ways to distribute at most max_errors bit errors
+    over the rows of a window.
+
+    Returns:
+        dists: (P,rows) Hamming distance assumed for each row
+        slots: (P,rows) index into the neighbour table row for each row
+        total: (P,) total number of corrected bits
+    """
+    dists, slots = [], []
+
+    def rec(row, remaining, d, j):
+        if row == rows:
+            dists.append(list(d))
+            slots.append(list(j))
+            return
+        for dr in range(remaining + 1):
+            for jr in range(widths[dr]):
+                rec(row + 1, remaining - dr, d + [dr], j + [jr])
+
+    rec(0, max_errors, [], [])
+    dists = np.array(dists, dtype=np.int64)
+    slots = np.array(slots, dtype=np.int64)
+    return dists, slots, dists.sum(-1)
+
+
+class DecodeStatus(enum.IntEnum):
+    """Per-window outcome of batch decoding."""
+
+    OK = 0
+    MNS_NOT_FOUND = 1
+    DELTA_OUT_OF_RANGE = 2
+    SNS_NOT_FOUND = 3
+    AMBIGUOUS = 4
+    INSUFFICIENT_DATA = 5
+    ROTATION_UNDETERMINED = 6
+
+
 class AnotoCodec:
     """A generalized implementation of the Anoto coding.
 
@@ -35,6 +130,9 @@ class AnotoCodec:
         sns: list[list[int]],
         pfactors: list[int],
         delta_range: tuple[int, int],
+        index_budget: int = None,
+        index_cache: str = None,
+        engine: str = "numpy",
     ) -> None:
         """Initialize the Anoto codec.
 
@@ -49,6 +147,13 @@ class AnotoCodec:
                 on both ends.
             pfactors: the sequence of prime factors to decompose
                 difference values into.
+            index_budget: optional memory budget in bytes of a window index.
+                If given and all windows of the codec fit the budget, decoding
+                becomes a table lookup (see build_index).
+            index_cache: optional .npz file to load the window index from or
+                store it to.
+            engine: internal representation used by encoding and batch
+                MNS matching, see use_engine.
         """
         self.mns = np.asarray(mns, dtype=np.int8)
         self.mns_length = len(self.mns)
@@ -63,6 +168,152 @@ class AnotoCodec:
         self.num_basis = integer.NumberBasis(pfactors)
         self.crt = integer.CRT(self.sns_lengths)
         self.delta_range = delta_range
+        self.instrumentation: CodecInstrumentation = None
+
+        # Lookup tables for vectorized decoding
+        self.mns_weights = _window_weights(self.mns_order, 2)
+        self.mns_lut = _make_window_lut(self.mns_cyclic, self.mns_order, 2)
+        self.sns_alphabets = [
+            max(int(p), int(s.max()) + 1) for p, s in zip(pfactors, self.sns)
+        ]
+        self.sns_weights = [
+            _window_weights(self.sns_order, a) for a in self.sns_alphabets
+        ]
+        self.sns_luts = [
+            _make_window_lut(s, self.sns_order, a)
+            for s, a in zip(self.sns_cyclic, self.sns_alphabets)
+        ]
+        self.sns_prefix_sums = [
+            np.concatenate(([0], np.cumsum(s, dtype=np.int64))) for s in self.sns
+        ]
+
+        self._correction_tables = {}
+        self._packed_tables: dict[tuple[int, int], packed.PackedWindowTables] = {}
+
+        self.bitboard: BitboardEngine = None
+        self.use_engine(engine)
+
+        self.window_index: WindowIndex = None
+        if index_budget is not None:
+            self.build_index(index_budget, cache=index_cache)
+
+        self.window_cache: WindowCache = None
+
+    def fingerprint(self) -> str:
+        """Returns a hash identifying the sequences and parameters of the codec."""
+        h = hashlib.sha1()
+        h.update(self.mns.tobytes())
+        for s in self.sns:
+            h.update(s.tobytes())
+        h.update(np.asarray(self.num_basis.bases, dtype=np.int64).tobytes())
+        h.update(repr(tuple(int(d) for d in self.delta_range)).encode())
+        return h.hexdigest()
+
+    @property
+    def engine(self) -> str:
+        return "numpy" if self.bitboard is None else "bitboard"
+
+    def use_engine(self, engine: str) -> None:
+        """Selects the internal representation of bit planes.
+
+        Params:
+            engine: 'numpy' stores one bit per int8 and matches partial
+                sequences by table lookups. 'bitboard' stores bit planes as
+                packed uint64 words and matches partial sequences by masked
+                word comparisons (see bitboard.BitboardEngine). It requires
+                an MNS of at most 64 bits. Both produce identical results.
+        """
+        if engine == "numpy":
+            self.bitboard = None
+        elif engine == "bitboard":
+            self.bitboard = BitboardEngine(self.mns)
+        else:
+            raise ValueError(f"Unknown engine '{engine}'")
+
+    def build_index(self, budget: int, cache: str = None) -> bool:
+        """Precomputes a mapping from complete windows to positions.
+
+        For small codecs, such as the 4x4 mini embodiment, all windows can
+        be enumerated. Afterwards, decode_position and decode_positions look
+        up windows instead of searching the MNS and SNS. Windows missing from
+        the index are decoded the regular way.
+
+        Params:
+            budget: maximum memory of the index in bytes
+            cache: optional .npz file. If it exists and matches this codec, the
+                index is loaded from it, otherwise the built index is stored.
+
+        Returns:
+            success: True if the index fits the budget and is in use.
+        """
+        fp = self.fingerprint()
+        index = None
+        if cache is not None and os.path.exists(cache):
+            index = WindowIndex.load(cache, fp)
+            if index is not None and index.nbytes > budget:
+                index = None
+        if index is None:
+            index = WindowIndex.build(self, budget)
+            if index is not None and cache is not None:
+                index.save(cache, fp)
+        self.window_index = index
+        return index is not None
+
+    def enable_cache(self, max_size: int = 4096) -> WindowCache:
+        """Turns on caching of decoded windows in decode_batch.
+
+        Windows repeated within a batch are decoded once, windows seen in
+        earlier batches are looked up (see window_cache.WindowCache). Scalar
+        decoding such as decode_position bypasses the cache.
+
+        Params:
+            max_size: maximum number of cached windows
+
+        Returns:
+            cache: the attached cache, which also exposes hit/miss counters.
+        """
+        self.window_cache = WindowCache(max_size)
+        return self.window_cache
+
+    def disable_cache(self) -> None:
+        """Turns off caching of decoded windows."""
+        self.window_cache = None
+
+    def enable_instrumentation(
+        self, instrumentation: CodecInstrumentation = None
+    ) -> CodecInstrumentation:
+        """Turns on collection of stage timings and failure counts.
+
+        Params:
+            instrumentation: optional instrumentation instance to use. If not
+                given, a new instance with default histogram buckets is created.
+
+        Returns:
+            instrumentation: the attached instrumentation instance.
+        """
+        if instrumentation is None:
+            instrumentation = CodecInstrumentation()
+        self.instrumentation = instrumentation
+        return instrumentation
+
+    def disable_instrumentation(self) -> None:
+        """Turns off instrumentation. Decoding runs uninstrumented afterwards."""
+        self.instrumentation = None
+
+    def snapshot_instrumentation(self) -> dict:
+        """Returns a snapshot of the collected instrumentation data.
+
+        See CodecInstrumentation.snapshot for the layout. Raises a
+        RuntimeError when instrumentation is not enabled.
+        """
+        if self.instrumentation is None:
+            raise RuntimeError("Instrumentation is not enabled.")
+        return self.instrumentation.snapshot()
+
+    def reset_instrumentation(self) -> None:
+        """Clears the collected instrumentation data, if enabled."""
+        if self.instrumentation is not None:
+            self.instrumentation.reset()
 
     def encode_bitmatrix(
         self, shape: tuple[int, int], section: tuple[int, int] = (0, 0)
@@ -76,6 +327,9 @@ class AnotoCodec:
         Returns
             bits: (H,W,2) matrix of encoded position coordinates.
         """
+        if self.bitboard is not None:
+            return self.encode_region((0, 0), shape, section=section)
+
         # Find nearest multiples of MNS length for ease of generation
         mshape = (
             int(self.mns_length * np.ceil(shape[0] / self.mns_length)),
@@ -100,6 +354,177 @@ class AnotoCodec:
 
         return m[: shape[0], : shape[1]]
 
+    def encode_region(
+        self,
+        origin: tuple[int, int],
+        shape: tuple[int, int],
+        section: tuple[int, int] = (0, 0),
+    ) -> np.ndarray:
+        """Generates the (H,W,2) bitmatrix of a region anywhere in a section.
+
+        Equivalent to encode_bitmatrix(...)[y:y+H, x:x+W] but without encoding
+        the pattern from the origin of the section. The MNS offsets of the
+        region's columns and rows are computed in closed form.
+
+        Params:
+            origin: (x,y) position of the top-left corner of the region
+            shape: (H,W) region shape
+            section: section coordinates to use
+
+        Returns
+            bits: (H,W,2) matrix of encoded position coordinates.
+        """
+        x0, y0 = int(origin[0]), int(origin[1])
+        H, W = int(shape[0]), int(shape[1])
+        M = self.mns_length
+        xs = x0 + np.arange(W, dtype=self.crt.dtype)
+        ys = y0 + np.arange(H, dtype=self.crt.dtype)
+        # Column x holds the MNS rolled by the offset of x, likewise for rows.
+        xroll = self._integrate_rolls(xs, first_roll=section[0] % M)
+        yroll = self._integrate_rolls(ys, first_roll=section[1] % M)
+        if self.bitboard is not None:
+            return self.bitboard.encode(xroll, yroll, (x0 % M, y0 % M))
+        xs, ys = (xs % M).astype(np.int64), (ys % M).astype(np.int64)
+        m = np.empty((H, W, 2), dtype=np.int8)
+        m[..., 0] = self.mns[(xroll[None, :] + ys[:, None]) % M]
+        m[..., 1] = self.mns[(yroll[:, None] + xs[None, :]) % M]
+        return m
+
+    def encode_sections(
+        self,
+        shape: tuple[int, int],
+        sections,
+        origin: tuple[int, int] = (0, 0),
+    ):
+        """Lazily generates the (H,W,2) bitmatrices of a region for many
+        sections.
+
+        A section only adds a constant offset to the MNS rolls of all columns
+        and rows. The rolls and the resulting MNS indices of the region are
+        therefore computed once, and each page is a gather from the MNS
+        rotated by the section's offsets.
+
+        Params:
+            shape: (H,W) region shape
+            sections: iterable of section coordinates (u,v)
+            origin: (x,y) position of the top-left corner of the region
+
+        Returns
+            pages: generator of (H,W,2) bitmatrices, one per section, equal to
+                encode_region(origin, shape, section)
+        """
+        x0, y0 = int(origin[0]), int(origin[1])
+        H, W = int(shape[0]), int(shape[1])
+        M = self.mns_length
+        xs = x0 + np.arange(W, dtype=self.crt.dtype)
+        ys = y0 + np.arange(H, dtype=self.crt.dtype)
+        xroll = self._integrate_rolls(xs)
+        yroll = self._integrate_rolls(ys)
+        xs, ys = (xs % M).astype(np.int64), (ys % M).astype(np.int64)
+        xidx = (xroll[None, :] + ys[:, None]) % M
+        yidx = (yroll[:, None] + xs[None, :]) % M
+        # Slices of two MNS periods are the MNS rotated by a section offset
+        mns2 = np.concatenate((self.mns, self.mns))
+        for u, v in sections:
+            m = np.empty((H, W, 2), dtype=np.int8)
+            np.take(mns2[u % M : u % M + M], xidx, out=m[..., 0])
+            np.take(mns2[v % M : v % M + M], yidx, out=m[..., 1])
+            yield m
+
+    def encode_points(
+        self, xy: np.ndarray, section: tuple[int, int] = (0, 0)
+    ) -> np.ndarray:
+        """Generates the bits of individual dots.
+
+        Params:
+            xy: (N,2) non-negative (x,y) positions
+            section: section coordinates to use
+
+        Returns
+            bits: (N,2) bits of the dots
+        """
+        xy = np.asarray(xy, dtype=self.crt.dtype).reshape(-1, 2)
+        m = self.mns_length
+        xroll = self._integrate_rolls(xy[:, 0], first_roll=section[0] % m)
+        yroll = self._integrate_rolls(xy[:, 1], first_roll=section[1] % m)
+        xy = (xy % m).astype(np.int64)
+        return np.stack(
+            (self.mns[(xroll + xy[:, 1]) % m], self.mns[(yroll + xy[:, 0]) % m]), -1
+        )
+
+    def encode_strip(
+        self, x0: int, width: int, rows: int = None, section: int = 0
+    ) -> np.ndarray:
+        """Generates the x-plane of a strip for one-dimensional encoders.
+
+        Linear rails and tapes only require the x-coordinate, which is carried
+        by the x-plane alone (see decode_linear_position). Since every column
+        is the MNS repeated cyclically, a strip of mns_order rows suffices.
+
+        Params:
+            x0: x-position of the strip's first column
+            width: number of columns
+            rows: number of rows. Defaults to the order of the MNS.
+            section: section coordinate u to use
+
+        Returns
+            bits: (rows,width) matrix of x-plane bits. Equal to
+                encode_region((x0,0), (rows,width), (section,0))[..., 0]
+        """
+        rows = self.mns_order if rows is None else int(rows)
+        M = self.mns_length
+        xs = int(x0) + np.arange(int(width), dtype=self.crt.dtype)
+        xroll = self._integrate_rolls(xs, first_roll=section % M)
+        return self.mns[(xroll[None, :] + np.arange(rows)[:, None]) % M]
+
+    def encode_sparse(
+        self,
+        shape: tuple[int, int],
+        regions: np.ndarray = None,
+        mask: np.ndarray = None,
+        section: tuple[int, int] = (0, 0),
+        origin: tuple[int, int] = (0, 0),
+        tile_size: int = 256,
+    ) -> "sparse.SparsePattern":
+        """Encodes only the covered parts of a (H,W) page.
+
+        Coverage is the union of the given regions and mask. Tiles not
+        intersecting the coverage are skipped, and only the bounding box of
+        covered dots is encoded within each remaining tile.
+
+        Params:
+            shape: (H,W) page shape
+            regions: optional (R,4) half-open rectangles (x0,y0,x1,y1) in page
+                coordinates
+            mask: optional (MH,MW) coarse boolean mask. Each cell covers a
+                block of ceil(H/MH) x ceil(W/MW) dots.
+            section: section coordinates to use
+            origin: (x,y) position of the page's top-left dot
+            tile_size: side length of tiles
+
+        Returns
+            pattern: the encoded tiles
+        """
+        pattern = sparse.SparsePattern(shape, tile_size)
+        for key, (x0, y0), cov in sparse.coverage_tiles(
+            pattern.shape, pattern.tile_size, regions=regions, mask=mask
+        ):
+            rows = np.flatnonzero(cov.any(1))
+            cols = np.flatnonzero(cov.any(0))
+            if len(rows) == 0:
+                continue
+            r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            cov = cov[r0:r1, c0:c1]
+            bits = self.encode_region(
+                (origin[0] + x0 + c0, origin[1] + y0 + r0),
+                (r1 - r0, c1 - c0),
+                section=section,
+            )
+            pattern.tiles[key] = sparse.SparseTile(
+                (x0 + int(c0), y0 + int(r0)), bits, None if cov.all() else cov
+            )
+        return pattern
+
     def _next_roll(self, pos: int, prev_roll: int) -> int:
         """Computes and returns the MNS offset for the next postion
         given the previous offset."""
@@ -122,6 +547,32 @@ class AnotoCodec:
             r += self._delta(i)
         return (first_roll + r) % self.mns_length
 
+    def _integrate_rolls(self, pos: np.ndarray, first_roll: int = 0) -> np.ndarray:
+        """Vectorized and closed-form variant of _integrate_roll.
+
+        Since the SNS are cyclic, the sum of all differences up to pos can be
+        computed from the number of complete SNS cycles and prefix sums of the
+        SNS, which makes this method O(1) per position.
+
+        Params:
+            pos: (N,) array of non-negative positions
+            first_roll: MNS offset at position zero
+
+        Returns:
+            rolls: (N,) array of MNS offsets
+        """
+        m = self.mns_length
+        pos = np.asarray(pos, dtype=self.crt.dtype)
+        r = (pos % m).astype(np.int64) * (self.delta_range[0] % m)
+        for b, length, prefix in zip(
+            self.num_basis.bases, self.sns_lengths, self.sns_prefix_sums
+        ):
+            q = (pos // length % m).astype(np.int64)
+            rem = (pos % length).astype(np.int64)
+            cycles = q * (prefix[-1] % m) + prefix[rem]
+            r = (r + int(b) % m * (cycles % m)) % m
+        return (first_roll + r) % m
+
     def _delta(self, pos: int):
         """Computes the difference value between pos and pos+1."""
 
@@ -160,22 +611,21 @@ class AnotoCodec:
         # to locate partial sequences in the MNS
         def check_rot(rotbits):
             M = rotbits.shape[0]
-            xcol_correct = 0
-            yrow_correct = 0
-
-            for i in range(M):
-                xcol = self.mns_cyclic_bytes.find(rotbits[:, i, 0].tobytes())
-                yrow = self.mns_cyclic_bytes.find(rotbits[i, :, 1].tobytes())
-                xcol_correct += 1 if xcol >= 0 else 0
-                yrow_correct += 1 if yrow >= 0 else 0
-
+            xcol_correct = (self._locate_mns_runs(rotbits[:, :, 0].T) >= 0).sum()
+            yrow_correct = (self._locate_mns_runs(rotbits[:, :, 1]) >= 0).sum()
             return xcol_correct >= M // 2 and yrow_correct >= M // 2
 
+        instr = self.instrumentation
+        if instr is not None:
+            instr.record_call("decode_rotation")
+
         for k in range(4):
             rotbits = helpers.rot90(bits, k=k)
             if check_rot(rotbits):
                 return (4 - k) % 4
 
+        if instr is not None:
+            instr.record_failure("rotation_undetermined")
         raise DecodingError("Failed to determine pattern orientation.")
 
     def decode_position(self, bits: np.ndarray) -> tuple[int, int]:
@@ -196,6 +646,14 @@ class AnotoCodec:
         # in case a bigger matrix is given
         bits = bits[: self.mns_order, : self.mns_order].astype(np.int8)
 
+        if self.instrumentation is not None:
+            self.instrumentation.record_call("decode_position")
+
+        if self.window_index is not None:
+            x, y = self._lookup_index(np.stack((bits[..., 0].T, bits[..., 1])))
+            if x >= 0 and y >= 0:
+                return (x, y)
+
         x = self._decode_position_along_direction(bits[..., 0].T)
         y = self._decode_position_along_direction(bits[..., 1])
 
@@ -213,6 +671,82 @@ class AnotoCodec:
                 f" but got {bits.shape}"
             )
 
+    def _assert_batch_shape(self, bits: np.ndarray, min_size: int = None):
+        if bits.ndim != 4:
+            raise DecodingError(f"Excepted a (B,M,N,2) matrix, but got {bits.shape}")
+        self._assert_bitmatrix_shape(
+            np.empty(bits.shape[1:], dtype=np.int8), min_size=min_size
+        )
+
+    def _x_plane(self, bits: np.ndarray, ndim: int) -> np.ndarray:
+        """Returns the (...,N,K) x-plane of (...,N,K) or (...,N,K,2) bits."""
+        bits = np.asarray(bits)
+        if bits.ndim == ndim + 1 and bits.shape[-1] == 2:
+            bits = bits[..., 0]
+        if bits.ndim != ndim:
+            raise DecodingError(f"Excepted a (N,K) x-plane, but got {bits.shape}")
+        if min(bits.shape[-2:]) < self.mns_order:
+            raise DecodingError(
+                f"Excepted at least a ({self.mns_order},{self.mns_order}) x-plane,"
+                f" but got {bits.shape}"
+            )
+        return bits
+
+    def decode_linear_position(self, bits: np.ndarray) -> int:
+        """Decodes the x-coordinate from the x-plane of a window.
+
+        One-dimensional counterpart of decode_position for strips generated by
+        encode_strip. Only the x-direction is decoded, which halves both the
+        bits to observe and the decoding cost. A single column yields just an
+        MNS offset, hence at least mns_order columns are required.
+
+        Params:
+            bits: (N,K) x-plane or (N,K,2) bitmatrix. N,K need to be greater
+                than or equal to the order of the MNS.
+
+        Returns:
+            x: position wrt to the section coordinate system
+        """
+        bits = self._x_plane(bits, 2)
+        M = self.mns_order
+        bits = bits[:M, :M].astype(np.int8)
+
+        if self.instrumentation is not None:
+            self.instrumentation.record_call("decode_linear_position")
+
+        if self.window_index is not None:
+            x = self._lookup_index(bits.T)
+            if x >= 0:
+                return int(x)
+        return self._decode_position_along_direction(bits.T)
+
+    def decode_linear_positions(
+        self, bits: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes x-coordinates from a batch of x-planes.
+
+        Vectorized counterpart of decode_linear_position. When more than
+        mns_order columns are given, the surplus columns have to continue the
+        sequences found, which rejects misreads at no extra lookups.
+
+        Params:
+            bits: (B,N,K) x-planes or (B,N,K,2) bitmatrices. N,K need to be
+                greater than or equal to the order of the MNS.
+
+        Returns:
+            x: (B,) positions. Set to -1 for windows that fail to decode.
+            status: (B,) array of DecodeStatus values
+        """
+        bits = self._x_plane(bits, 3)
+        if len(bits) == 0:
+            return np.zeros(0, dtype=self.crt.dtype), np.zeros(0, dtype=np.uint8)
+        M = self.mns_order
+        # Columns of the x-plane carry the MNS
+        seqs = bits[:, :M].transpose(0, 2, 1).astype(np.int8)
+        if seqs.shape[1] == M:
+            return self._decode_positions_along_direction(seqs)
+        return self._decode_locs(self._locate_mns(seqs))
+
     def decode_section(self, bits: np.ndarray, pos: tuple[int, int]) -> tuple[int, int]:
         """Computes the section coordinates from an observed bits matrix.
 
@@ -232,16 +766,25 @@ class AnotoCodec:
             bits[0, : self.mns_order, 1].astype(np.int8).tobytes()
         )
 
+        instr = self.instrumentation
+        if instr is not None:
+            instr.record_call("decode_section")
+
         if (px_mns < 0) or (py_mns < 0):
+            if instr is not None:
+                instr.record_failure("mns_not_found")
             raise DecodingError("Failed to find partial sequence in MNS.")
 
-        # As _integrate_roll is expensive, decode_section should be called rarely.
-        sx = self._integrate_roll(pos[0], first_roll=0)
-        sy = self._integrate_roll(pos[1], first_roll=0)
+        # Closed-form integration, as positions may be arbitrarily large.
+        if instr is not None:
+            t0 = instr.clock()
+        sx, sy = (int(r) for r in self._integrate_rolls([pos[0], pos[1]]))
+        if instr is not None:
+            instr.record("integrate_roll", instr.clock() - t0)
 
         return (
-            (px_mns - pos[1] - sx) % self.mns_length,
-            (py_mns - pos[0] - sy) % self.mns_length,
+            (px_mns - int(pos[1]) - sx) % self.mns_length,
+            (py_mns - int(pos[0]) - sy) % self.mns_length,
         )
 
     def _decode_position_along_direction(self, bits: np.ndarray) -> int:
@@ -259,31 +802,855 @@ class AnotoCodec:
         Returns:
             pos: position along the direction up to an unknown section tile.
         """
+        if self.instrumentation is not None:
+            return self._decode_position_along_direction_timed(bits)
 
-        # Compute the mns_order locations in the MNS via byte matching
-        locs = np.array(
-            [self.mns_cyclic_bytes.find(s.tobytes()) for s in bits], dtype=np.int32
-        )
+        locs = self._find_mns_locations(bits)
+        if (locs < 0).any():
+            raise DecodingError("Failed to find at least one partial sequence in MNS")
+        deltae = self._mns_deltae(locs)
+        if deltae is None:
+            raise DecodingError("At least one delta value is not within required range")
+        coeffs = self._project_deltae(deltae)
+        ps = self._find_sns_locations(coeffs)
+        return self.crt.solve(ps)
+
+    def _decode_position_along_direction_timed(self, bits: np.ndarray) -> int:
+        """Runs the stages of _decode_position_along_direction while recording
+        their timings and failures with the attached instrumentation."""
+        instr = self.instrumentation
+        clock = instr.clock
 
+        t0 = clock()
+        locs = self._find_mns_locations(bits)
+        t1 = clock()
+        instr.record("mns_search", t1 - t0)
         if (locs < 0).any():
+            instr.record_failure("mns_not_found")
             raise DecodingError("Failed to find at least one partial sequence in MNS")
 
-        # Compute the 5 differences modulo the length of MNS
+        deltae = self._mns_deltae(locs)
+        t2 = clock()
+        instr.record("delta_check", t2 - t1)
+        if deltae is None:
+            instr.record_failure("delta_out_of_range")
+            raise DecodingError("At least one delta value is not within required range")
+
+        coeffs = self._project_deltae(deltae)
+        t3 = clock()
+        instr.record("project", t3 - t2)
+
+        ps = self._find_sns_locations(coeffs)
+        t4 = clock()
+        instr.record("sns_search", t4 - t3)
+
+        p = self.crt.solve(ps)
+        instr.record("crt_solve", clock() - t4)
+        return p
+
+    def _find_mns_locations(self, bits: np.ndarray) -> np.ndarray:
+        """Locates the rows of a (M,M) matrix in the MNS via byte matching.
+        Rows not found are reported as -1."""
+        return np.array(
+            [self.mns_cyclic_bytes.find(s.tobytes()) for s in bits], dtype=np.int32
+        )
+
+    def _mns_deltae(self, locs: np.ndarray) -> np.ndarray:
+        """Returns the differences of consecutive MNS locations modulo the
+        length of MNS, or None if at least one is out of the delta range."""
         deltae = np.remainder(locs[1:] - locs[:-1], self.mns_length)
         if not np.logical_and(
             deltae >= self.delta_range[0], deltae <= self.delta_range[1]
         ).all():
-            raise DecodingError("At least one delta value is not within required range")
+            return None
+        return deltae
 
-        # Find 5 a1...a4 coefficients by integer division
-        deltae -= self.delta_range[0]
-        coeffs = self.num_basis.project(deltae).astype(
-            np.int8
-        )  # (mns_order-1,num_sns) array
+    def _project_deltae(self, deltae: np.ndarray) -> np.ndarray:
+        """Returns the (mns_order-1,num_sns) coefficients of differences."""
+        return self.num_basis.project(deltae - self.delta_range[0]).astype(np.int8)
 
-        # Find the locations of unique sns_order substring coefficients, these
-        # are the remainders to the unknown location.
-        ps = [s.find(a.tobytes()) for s, a in zip(self.sns_cyclic_bytes, coeffs.T)]
+    def _find_sns_locations(self, coeffs: np.ndarray) -> list[int]:
+        """Locates the unique sns_order substrings of coefficients in the SNS.
+        These are the remainders to the unknown location."""
+        return [s.find(a.tobytes()) for s, a in zip(self.sns_cyclic_bytes, coeffs.T)]
 
-        p = self.crt.solve(ps)
-        return p
+    def _lookup_index(self, windows: np.ndarray):
+        """Looks up windows in the window index, timed if instrumented."""
+        if self.instrumentation is None:
+            return self.window_index.lookup(windows)
+        t0 = self.instrumentation.clock()
+        res = self.window_index.lookup(windows)
+        self.instrumentation.record("index_lookup", self.instrumentation.clock() - t0)
+        return res
+
+    def decode_positions(self, bits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes a batch of (B,N,M,2) bitmatrices into 2D locations.
+
+        This is the vectorized counterpart of decode_position. Instead of
+        raising a DecodingError, the outcome of each window is reported
+        as DecodeStatus.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices. N,M need to be greater than
+                or equal to order of MNS.
+
+        Returns:
+            xy: (B,2) array of (x,y) locations wrt to section coordinate system.
+                Locations of windows that fail to decode are set to -1.
+            status: (B,) array of DecodeStatus values. If both directions fail,
+                the status of the x-direction is reported.
+        """
+        bits = np.asarray(bits)
+        self._assert_batch_shape(bits)
+        if len(bits) == 0:
+            return (
+                np.zeros((0, 2), dtype=self.crt.dtype),
+                np.zeros(0, dtype=np.uint8),
+            )
+        bits = bits[:, : self.mns_order, : self.mns_order].astype(np.int8)
+
+        x, xstatus = self._decode_positions_along_direction(
+            bits[..., 0].transpose(0, 2, 1)
+        )
+        y, ystatus = self._decode_positions_along_direction(bits[..., 1])
+
+        status = np.where(xstatus != DecodeStatus.OK, xstatus, ystatus)
+        xy = np.stack((x, y), -1)
+        xy[status != DecodeStatus.OK] = -1
+        return xy, status
+
+    def decode_sections(
+        self, bits: np.ndarray, xy: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Computes section coordinates for a batch of observed bitmatrices.
+
+        This is the vectorized counterpart of decode_section. The MNS offsets
+        of the positions are integrated in closed form (see _integrate_rolls),
+        so the cost does not depend on the magnitude of the positions.
+
+        Params:
+            bits: (B,N,M,2) batch of observed bits
+            xy: (B,2) position coordinates as returned by decode_positions
+
+        Returns:
+            uv: (B,2) section coordinates. Set to -1 for failed windows.
+            status: (B,) array of DecodeStatus values. Windows with negative
+                positions are reported as MNS_NOT_FOUND.
+        """
+        bits = np.asarray(bits)
+        M = self.mns_order
+        px = self._locate_mns(bits[:, :M, 0, 0])
+        py = self._locate_mns(bits[:, 0, :M, 1])
+        return self._decode_sections_from_locs(px, py, xy)
+
+    def _decode_sections_from_locs(
+        self, px: np.ndarray, py: np.ndarray, xy: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Computes section coordinates from the (B,) MNS locations of the
+        first column of the x-plane and the first row of the y-plane. See
+        decode_sections."""
+        xy = np.asarray(xy, dtype=self.crt.dtype)
+        failed = (px < 0) | (py < 0) | (xy < 0).any(-1)
+        pos = np.where(failed[:, None], 0, xy)
+        sx = self._integrate_rolls(pos[:, 0])
+        sy = self._integrate_rolls(pos[:, 1])
+        pos = (pos % self.mns_length).astype(np.int64)
+        uv = np.stack(
+            (
+                (px - pos[:, 1] - sx) % self.mns_length,
+                (py - pos[:, 0] - sy) % self.mns_length,
+            ),
+            -1,
+        )
+        uv[failed] = -1
+        status = np.where(
+            failed, DecodeStatus.MNS_NOT_FOUND, DecodeStatus.OK
+        ).astype(np.uint8)
+        return uv, status
+
+    def _decode_positions_along_direction(
+        self, bits: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Vectorized variant of _decode_position_along_direction.
+
+        Byte matching is replaced by lookups of packed window codes into
+        precomputed tables, so that all windows are processed at once. If a
+        window index is available, only windows missing from it are decoded
+        this way.
+
+        Params:
+            bits: (B,M,M) batch of matrices where M equals the order of the MNS.
+                Like in _decode_position_along_direction, the MNS is assumed
+                to be repeated along rows of each matrix.
+
+        Returns:
+            pos: (B,) array of positions along the direction. Positions of
+                windows that fail to decode are set to -1.
+            status: (B,) array of DecodeStatus values.
+        """
+        if self.window_index is not None:
+            pos = self.window_index.lookup(bits)
+            status = np.full(len(pos), DecodeStatus.OK, dtype=np.uint8)
+            missing = pos < 0
+            if missing.any():
+                pos[missing], status[missing] = self._decode_positions_by_search(
+                    bits[missing]
+                )
+            return pos, status
+        return self._decode_positions_by_search(bits)
+
+    def _decode_codes_along_direction(
+        self, codes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Variant of _decode_positions_along_direction taking (B,M) packed
+        codes of the partial sequences instead of (B,M,M) bits. Element k of
+        a partial sequence is bit k of its code."""
+        codes = codes.astype(np.int64)
+        locs = self.mns_lut[codes].astype(np.int64)
+        if self.window_index is not None:
+            pos = self.window_index.lookup_codes(codes @ self.window_index.row_weights)
+            status = np.full(len(pos), DecodeStatus.OK, dtype=np.uint8)
+            missing = pos < 0
+            if missing.any():
+                pos[missing], status[missing] = self._decode_locs(locs[missing])
+            return pos, status
+        return self._decode_locs(locs)
+
+    def _decode_positions_by_search(
+        self, bits: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes (B,M,M) matrices via MNS, SNS lookups and the CRT.
+        See _decode_positions_along_direction."""
+        locs = self._locate_mns(bits)  # (B,M)
+        return self._decode_locs(locs)
+
+    def _locate_mns(self, seqs: np.ndarray) -> np.ndarray:
+        """Returns the MNS locations of (...,n) partial sequences, where n is
+        the order of the MNS, or -1 for sequences not found."""
+        if self.bitboard is not None:
+            return self.bitboard.locate(seqs)
+        return self.mns_lut[seqs.astype(np.int64) @ self.mns_weights]
+
+    def _decode_locs(self, locs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes positions from (B,C) locations of partial sequences in the
+        MNS. Negative locations denote partial sequences not found.
+
+        C is usually the order of the MNS. For C larger than the order, the
+        surplus difference values must continue the SNS substrings found,
+        otherwise SNS_NOT_FOUND is reported.
+        """
+        B, C = locs.shape
+        status = np.full(B, DecodeStatus.OK, dtype=np.uint8)
+        status[(locs < 0).any(-1)] = DecodeStatus.MNS_NOT_FOUND
+
+        deltae = np.remainder(locs[:, 1:] - locs[:, :-1], self.mns_length)
+        inrange = np.logical_and(
+            deltae >= self.delta_range[0], deltae <= self.delta_range[1]
+        ).all(-1)
+        status[~inrange & (status == DecodeStatus.OK)] = (
+            DecodeStatus.DELTA_OUT_OF_RANGE
+        )
+
+        ok = status == DecodeStatus.OK
+        deltae = np.where(ok[:, None], deltae - self.delta_range[0], 0)
+        coeffs = self.num_basis.project(deltae.reshape(-1)).reshape(
+            B, C - 1, -1
+        )  # (B,C-1,num_sns)
+
+        ps = np.stack(
+            [
+                lut[coeffs[:, : self.sns_order, i] @ w]
+                for i, (lut, w) in enumerate(zip(self.sns_luts, self.sns_weights))
+            ],
+            -1,
+        ).astype(np.int64)
+        status[(ps < 0).any(-1) & ok] = DecodeStatus.SNS_NOT_FOUND
+
+        if C - 1 > self.sns_order:
+            # Surplus coefficients have to match the SNS following ps
+            k = np.arange(self.sns_order, C - 1)
+            for i, (seq, length) in enumerate(zip(self.sns, self.sns_lengths)):
+                expected = seq[(ps[:, i : i + 1] + k[None, :]) % length]
+                consistent = (expected == coeffs[:, self.sns_order :, i]).all(-1)
+                status[~consistent & (status == DecodeStatus.OK)] = (
+                    DecodeStatus.SNS_NOT_FOUND
+                )
+
+        ok = status == DecodeStatus.OK
+        ps[~ok] = 0
+        pos = self.crt.solve(ps).astype(self.crt.dtype)
+        pos[~ok] = -1
+        return pos, status
+
+    def decode_positions_corrected(
+        self, bits: np.ndarray, max_errors: int = 1
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decodes a batch of bitmatrices while correcting bit errors.
+
+        Per direction, each partial sequence is matched to all MNS substrings
+        within Hamming distance max_errors using precomputed neighbour tables.
+        Every distribution of at most max_errors corrections over the rows of
+        a window is then checked for consistency by the delta range and SNS
+        lookups. The consistent candidates with the fewest corrections are
+        kept; if they do not agree on the position, the window is reported
+        as AMBIGUOUS.
+
+        Windows are first decoded without correction; only windows failing
+        to do so are expanded into correction candidates, in chunks of at most
+        CORRECTION_CHUNK_SIZE locations.
+
+        Unlike decode_positions, the whole window is used. A window of exactly
+        the order of the MNS carries no redundancy, so that an erroneous
+        window usually coincides with another valid window. Correction is
+        therefore refused for such windows. Each additional row and column
+        adds redundancy: longer partial sequences of the MNS and surplus
+        difference values that have to continue the SNS substrings. Windows
+        of 8x8 for the 6x6 embodiments allow reliable correction of single
+        errors.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices. N,M need to be greater than
+                or equal to order of MNS. Since neighbour tables are indexed by
+                packed partial sequences, N,M should not exceed 16.
+            max_errors: maximum number of bit errors to correct per direction.
+                Requires N,M greater than the order of MNS, unless zero.
+
+        Returns:
+            xy: (B,2) array of (x,y) locations. Set to -1 for failed windows.
+            status: (B,) array of DecodeStatus values.
+            corrections: (B,2) number of corrected bits per direction
+        """
+        bits = np.asarray(bits)
+        self._assert_batch_shape(bits)
+        if max_errors > 0 and min(bits.shape[1:3]) <= self.mns_order:
+            raise ValueError(
+                "Error correction requires windows larger than the order of MNS."
+            )
+        if len(bits) == 0:
+            return (
+                np.zeros((0, 2), dtype=self.crt.dtype),
+                np.zeros(0, dtype=np.uint8),
+                np.zeros((0, 2), dtype=np.int64),
+            )
+        bits = bits.astype(np.int8)
+
+        x, xstatus, xcorr = self._decode_positions_corrected_along_direction(
+            bits[..., 0].transpose(0, 2, 1), max_errors
+        )
+        y, ystatus, ycorr = self._decode_positions_corrected_along_direction(
+            bits[..., 1], max_errors
+        )
+
+        status = np.where(xstatus != DecodeStatus.OK, xstatus, ystatus)
+        xy = np.stack((x, y), -1)
+        corrections = np.stack((xcorr, ycorr), -1)
+        xy[status != DecodeStatus.OK] = -1
+        return xy, status, corrections
+
+    def _decode_positions_corrected_along_direction(
+        self, bits: np.ndarray, max_errors: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Error correcting variant of _decode_positions_along_direction.
+
+        Params:
+            bits: (B,C,R) matrices with the MNS along rows. C,R need to be
+                greater than or equal to the order of the MNS.
+            max_errors: maximum number of bit errors to correct
+
+        Returns:
+            pos: (B,) array of positions, -1 for failed windows
+            status: (B,) array of DecodeStatus values
+            corrections: (B,) number of corrected bits, -1 for failed windows
+        """
+        B, C, R = bits.shape
+        key = (C, R, max_errors)
+        if key not in self._correction_tables:
+            table, widths = _make_neighbour_table(self.mns, R, max_errors)
+            templates = _make_correction_templates(C, widths, max_errors)
+            self._correction_tables[key] = (table, templates)
+        table, (dists, slots, total) = self._correction_tables[key]
+
+        codes = bits.astype(np.int64) @ _window_weights(R, 2)  # (B,C)
+        # The first template assumes no errors, i.e. the plain decode
+        pos, status = self._decode_locs(table[0, codes, 0])
+        corrections = np.where(status == DecodeStatus.OK, 0, -1)
+        if max_errors == 0:
+            return np.where(status == DecodeStatus.OK, pos, -1), status, corrections
+
+        # Failed windows report the status of the uncorrected decode, unless
+        # a consistent candidate is found
+        P = len(total)
+        failed = np.flatnonzero(status != DecodeStatus.OK)
+        step = max(CORRECTION_CHUNK_SIZE // (P * C), 1)
+        for b in range(0, len(failed), step):
+            idx = failed[b : b + step]
+            n = len(idx)
+            # (n,P,C) candidate locations of every row for every template
+            locs = table[dists[None], codes[idx, None, :], slots[None]]
+            cpos, cstatus = self._decode_locs(locs.reshape(n * P, C))
+            cpos = cpos.reshape(n, P)
+            valid = cstatus.reshape(n, P) == DecodeStatus.OK
+
+            # Keep consistent candidates with the fewest corrections
+            cost = np.where(valid, total[None], np.iinfo(np.int64).max)
+            best = cost.min(-1)
+            found = best <= max_errors
+            atbest = valid & (cost == best[:, None])
+            bpos = cpos[np.arange(n), np.argmax(atbest, -1)]
+            agree = np.all(~atbest | (cpos == bpos[:, None]), -1)
+
+            ok = found & agree
+            status[idx[found & ~agree]] = DecodeStatus.AMBIGUOUS
+            status[idx[ok]] = DecodeStatus.OK
+            pos[idx[ok]] = bpos[ok]
+            corrections[idx[ok]] = best[ok]
+
+        ok = status == DecodeStatus.OK
+        return np.where(ok, pos, -1), status, corrections
+
+    def decode_positions_masked(
+        self, bits: np.ndarray, mask: np.ndarray, max_candidates: int = 64
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Decodes a batch of bitmatrices with missing dots.
+
+        Per direction, each partial sequence is compared against all MNS
+        substrings of the same length on its observed bits only, which yields
+        a set of candidate locations per row. Every run of consecutive rows of
+        the order of the MNS (all runs inside larger windows) whose candidate
+        combinations number at most max_candidates is then decoded for all
+        combinations at once. Combinations failing the delta range or SNS
+        lookups are rejected. Each remaining candidate position is verified
+        against all rows of the window, whose MNS offsets follow from the
+        position. The verified positions have to agree, otherwise AMBIGUOUS
+        is reported.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices. N,M need to be greater than
+                or equal to order of MNS. Values of missing dots are ignored.
+            mask: (B,N,M) or (B,N,M,2) validity mask. True marks observed dots
+                (or bits).
+            max_candidates: maximum number of candidate combinations tried
+                per run of rows
+
+        Returns:
+            xy: (B,2) array of (x,y) locations of the windows' top-left dots.
+                Set to -1 for failed windows.
+            status: (B,) array of DecodeStatus values. INSUFFICIENT_DATA is
+                reported when no run has few enough candidate combinations.
+        """
+        bits = np.asarray(bits)
+        self._assert_batch_shape(bits)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim == 3:
+            mask = np.repeat(mask[..., None], 2, -1)
+        if mask.shape != bits.shape:
+            raise DecodingError(
+                f"Expected mask of shape {bits.shape[:3]}, but got {mask.shape}"
+            )
+        if len(bits) == 0:
+            return (
+                np.zeros((0, 2), dtype=self.crt.dtype),
+                np.zeros(0, dtype=np.uint8),
+            )
+        bits = bits.astype(np.int8)
+
+        x, xstatus = self._decode_positions_masked_along_direction(
+            bits[..., 0].transpose(0, 2, 1),
+            mask[..., 0].transpose(0, 2, 1),
+            max_candidates,
+        )
+        y, ystatus = self._decode_positions_masked_along_direction(
+            bits[..., 1], mask[..., 1], max_candidates
+        )
+
+        status = np.where(xstatus != DecodeStatus.OK, xstatus, ystatus)
+        xy = np.stack((x, y), -1)
+        xy[status != DecodeStatus.OK] = -1
+        return xy, status
+
+    def _decode_positions_masked_along_direction(
+        self, bits: np.ndarray, known: np.ndarray, max_candidates: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Erasure-aware variant of _decode_positions_along_direction.
+
+        Params:
+            bits: (B,C,R) matrices with the MNS along rows. C,R need to be
+                greater than or equal to the order of the MNS.
+            known: (B,C,R) mask of observed bits
+            max_candidates: maximum number of candidate combinations per run
+
+        Returns:
+            pos: (B,) positions of the first row, -1 for failed windows
+            status: (B,) array of DecodeStatus values
+        """
+        B, C, R = bits.shape
+        M = self.mns_order
+        m = self.mns_length
+        L = int(self.crt.L)
+
+        # Wildcard-aware match of every row against all MNS substrings
+        subs = self.mns[(np.arange(m)[:, None] + np.arange(R)) % m]  # (m,R)
+        match = (~known[:, :, None, :] | (bits[:, :, None, :] == subs)).all(-1)
+        counts = match.sum(-1)  # (B,C)
+        width = min(m, max_candidates)
+        # Candidate locations per row, padded with -1
+        order = np.argsort(~match, axis=-1, kind="stable")[..., :width]
+        cands = np.where(np.take_along_axis(match, order, -1), order, -1)
+
+        t = np.arange(max_candidates)
+        found_b, found_p = [], []
+        first_status = np.full(B, DecodeStatus.INSUFFICIENT_DATA, dtype=np.uint8)
+        for s in range(C - M + 1):
+            n = np.maximum(counts[:, s : s + M], 1)
+            # Clip before the product to avoid overflows
+            total = np.prod(np.minimum(n, max_candidates + 1), -1)
+            tried = (total <= max_candidates) & (counts[:, s : s + M] > 0).all(-1)
+            radix = np.cumprod(
+                np.concatenate((np.ones((B, 1), dtype=np.int64), n[:, :-1]), -1), -1
+            )
+            digits = (t[None, :, None] // radix[:, None, :]) % n[:, None, :]
+            use = tried[:, None] & (t[None, :] < total[:, None])  # (B,T)
+            bidx, tidx = np.nonzero(use)
+            if len(bidx) == 0:
+                continue
+            rows = s + np.arange(M)
+            locs = cands[bidx[:, None], rows[None, :], digits[bidx, tidx]]
+            p, st = self._decode_locs(locs)
+
+            # Remember the outcome of the first tried combination per window
+            fb, fst = bidx[tidx == 0], st[tidx == 0]
+            unset = first_status[fb] == DecodeStatus.INSUFFICIENT_DATA
+            first_status[fb[unset]] = fst[unset]
+
+            ok = st == DecodeStatus.OK
+            found_b.append(bidx[ok])
+            found_p.append((p[ok] - s) % L)
+
+        pos = np.full(B, -1, dtype=self.crt.dtype)
+        agree = np.ones(B, dtype=bool)
+        if found_b:
+            bp = np.stack((np.concatenate(found_b), np.concatenate(found_p)), -1)
+            if bp.dtype == object:
+                # np.unique does not support rows of Python integers
+                bp = np.array(sorted(set(map(tuple, bp.tolist()))), dtype=object)
+            else:
+                bp = np.unique(bp, axis=0)
+            bidx = bp[:, 0].astype(np.int64)
+            # Verify candidates on all rows: the MNS offsets of the rows follow
+            # from the position up to a common shift along the MNS.
+            rolls = self._integrate_rolls(bp[:, 1:2] + np.arange(C))  # (K,C)
+            shifted = (rolls[:, None, :] + np.arange(m)[None, :, None]) % m
+            rows = np.arange(C)[None, None, :]
+            consistent = match[bidx[:, None, None], rows, shifted].all(-1).any(-1)
+            b, p = bidx[consistent], bp[consistent, 1]
+            pos[b] = p
+            agree[b[pos[b] != p]] = False
+
+        found = pos >= 0
+        status = np.where(
+            found,
+            np.where(agree, DecodeStatus.OK, DecodeStatus.AMBIGUOUS),
+            first_status,
+        ).astype(np.uint8)
+        status[(counts == 0).any(-1) & ~found] = DecodeStatus.MNS_NOT_FOUND
+        pos[status != DecodeStatus.OK] = -1
+        return pos, status
+
+    def decode_positions_consensus(
+        self, bits: np.ndarray, min_votes: int = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decodes a batch of large windows by voting over all sub-windows.
+
+        Every contained sub-window of the order of the MNS is decoded in a
+        single vectorized pass. Each result is offset by its sub-window origin,
+        so that all sub-windows vote for the position of the top-left dot.
+        Votes are counted per direction, since directions decode independently.
+
+        Sub-windows sharing a corrupted row or column may agree on the same
+        wrong position. By default, a strict majority of sub-windows therefore
+        has to agree, which rejects almost all such positions.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices. N,M need to be greater than
+                or equal to order of MNS.
+            min_votes: minimum number of sub-windows per direction that have to
+                agree on the consensus position. Defaults to a strict majority.
+
+        Returns:
+            xy: (B,2) consensus locations of the top-left dots. Set to -1 for
+                failed windows.
+            status: (B,) array of DecodeStatus values. AMBIGUOUS is reported
+                when different positions receive the same maximum number of
+                votes or fewer than min_votes agree.
+            confidence: (B,) fraction of sub-windows that agree with the
+                consensus, minimum over both directions.
+        """
+        bits = np.asarray(bits)
+        self._assert_batch_shape(bits)
+        B, N, W = bits.shape[:3]
+        if B == 0:
+            return (
+                np.zeros((0, 2), dtype=self.crt.dtype),
+                np.zeros(0, dtype=np.uint8),
+                np.zeros(0, dtype=np.float64),
+            )
+        M = self.mns_order
+        L = int(self.crt.L)
+
+        # (B,N-M+1,W-M+1,2,M,M) views of all sub-windows
+        sub = np.lib.stride_tricks.sliding_window_view(bits, (M, M), axis=(1, 2))
+        ny, nx = sub.shape[1:3]
+        K = ny * nx
+        if min_votes is None:
+            min_votes = K // 2 + 1
+        sub = sub.transpose(0, 1, 2, 4, 5, 3).reshape(B * K, M, M, 2)
+        xs, xst = self._decode_positions_along_direction(
+            sub[..., 0].transpose(0, 2, 1).astype(np.int8)
+        )
+        ys, yst = self._decode_positions_along_direction(sub[..., 1].astype(np.int8))
+
+        oy, ox = np.meshgrid(np.arange(ny), np.arange(nx), indexing="ij")
+        votes = []
+        for p, st, off in [(xs, xst, ox), (ys, yst, oy)]:
+            p = p.reshape(B, K)
+            valid = st.reshape(B, K) == DecodeStatus.OK
+            p = np.sort(np.where(valid, (p - off.reshape(1, K)) % L, -1), -1)
+            # Count votes as runs of equal positions in each sorted row
+            newrun = np.ones((B, K), dtype=bool)
+            newrun[:, 1:] = p[:, 1:] != p[:, :-1]
+            run = np.cumsum(newrun.reshape(-1)) - 1
+            value = p[newrun]
+            counts = np.where(value >= 0, np.bincount(run), 0)
+            starts = run[::K]  # first run of each window
+            nbest = np.maximum.reduceat(counts, starts)
+            nruns = len(counts)
+            atbest = counts == np.repeat(nbest, np.diff(np.r_[starts, nruns]))
+            best = np.maximum.reduceat(np.where(atbest, np.arange(nruns), 0), starts)
+            winner = value[best]
+            tie = np.add.reduceat(atbest, starts) > 1
+            first = st.reshape(B, K)[:, 0]
+            status = np.where(
+                nbest == 0,
+                np.where(first != DecodeStatus.OK, first, DecodeStatus.AMBIGUOUS),
+                np.where(
+                    tie | (nbest < min_votes), DecodeStatus.AMBIGUOUS, DecodeStatus.OK
+                ),
+            ).astype(np.uint8)
+            votes.append((winner, status, nbest / K))
+
+        (x, xstatus, xconf), (y, ystatus, yconf) = votes
+        status = np.where(xstatus != DecodeStatus.OK, xstatus, ystatus)
+        xy = np.stack((x, y), -1)
+        xy[status != DecodeStatus.OK] = -1
+        return xy, status, np.minimum(xconf, yconf)
+
+    def decode_rotations(self, bits: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Determines the rotations of a batch of (B,N,M,2) bitmatrices.
+
+        This is the vectorized counterpart of decode_rotation, applying the
+        same acceptance criterion to all windows at once.
+
+        Returns:
+            rot: (B,) array of ccw rotations in 90° steps. -1 for windows whose
+                rotation could not be determined.
+            status: (B,) array of DecodeStatus values.
+        """
+        bits = np.asarray(bits)
+        self._assert_batch_shape(bits)
+        M = min(bits.shape[1], bits.shape[2])
+        bits = bits[:, :M, :M].astype(np.int8)
+
+        rot = np.full(len(bits), -1, dtype=np.int8)
+        for k in range(4):
+            todo = np.flatnonzero(rot < 0)
+            if len(todo) == 0:
+                break
+            rotbits = helpers.rot90(bits[todo], k=k)
+            xcols = self._locate_mns_runs(rotbits[..., 0].transpose(0, 2, 1)) >= 0
+            yrows = self._locate_mns_runs(rotbits[..., 1]) >= 0
+            ok = (xcols.sum(-1) >= M // 2) & (yrows.sum(-1) >= M // 2)
+            rot[todo[ok]] = (4 - k) % 4
+
+        status = np.where(
+            rot < 0, DecodeStatus.ROTATION_UNDETERMINED, DecodeStatus.OK
+        ).astype(np.uint8)
+        return rot, status
+
+    def _locate_mns_runs(self, seqs: np.ndarray) -> np.ndarray:
+        """Returns the MNS locations of the first element of (...,K) binary
+        sequences with K >= order of the MNS, or -1 for sequences that are no
+        substrings of the MNS. Substrings may wrap around the end of the MNS,
+        as the columns and rows of the pattern repeat the MNS cyclically."""
+        windows = np.lib.stride_tricks.sliding_window_view(seqs, self.mns_order, -1)
+        locs = self._locate_mns(windows)
+        steps = np.remainder(np.diff(locs, axis=-1), self.mns_length)
+        run = (locs >= 0).all(-1) & (steps == 1).all(-1)
+        return np.where(run, locs[..., 0], -1)
+
+    def decode_batch(
+        self,
+        bits: np.ndarray,
+        out: np.ndarray = None,
+        sections: bool = True,
+        rotation: bool = False,
+    ) -> np.ndarray:
+        """Decodes a batch of bitmatrices into columnar results.
+
+        Combines decode_rotations, decode_positions and decode_sections and
+        writes their outcome into the columns of a structured array (see
+        results.result_dtype) without creating per-window objects. With a
+        cache enabled (see enable_cache), only distinct windows not seen
+        before are decoded.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices
+            out: optional destination of B rows. Either a structured array
+                such as a memory-mapped .npy file or a view returned by
+                results.ResultWriter.reserve, or a dict of (B,) column arrays.
+                Columns not present in out are skipped.
+            sections: if True, decodes section coordinates. Otherwise u,v are
+                set to -1.
+            rotation: if True, determines the rotation of each window and
+                decodes the window in canonical orientation. Requires windows
+                large enough to determine rotations (see decode_rotation).
+                Otherwise, windows are assumed to be canonical and a rotation
+                of 0 is reported.
+
+        Returns:
+            out: the filled destination. Coordinates of windows that fail to
+                decode are set to -1 and the reason is given by 'status'. For
+                codecs with more than 2^63 positions (see integer.CRT), the
+                default destination has object position columns.
+        """
+        bits = np.asarray(bits)
+        if bits.ndim != 4:
+            raise DecodingError(f"Excepted a (B,M,N,2) matrix, but got {bits.shape}")
+        B = len(bits)
+        if out is None:
+            out = results.empty_results(B, position_dtype=self.crt.dtype)
+        if B == 0:
+            return out
+
+        if self.window_cache is None:
+            columns = self._decode_columns(bits, sections, rotation)
+        else:
+            columns = self.window_cache.decode(
+                lambda b: self._decode_columns(b, sections, rotation),
+                bits,
+                (bool(sections), bool(rotation)),
+                dtype=self.crt.dtype,
+            )
+        names = out.dtype.names if isinstance(out, np.ndarray) else out.keys()
+        for name in names:
+            if name in columns:
+                out[name][...] = columns[name]
+        return out
+
+    def decode_packed(
+        self,
+        buffer,
+        shape: tuple[int, int] = None,
+        out: np.ndarray = None,
+        sections: bool = True,
+    ) -> np.ndarray:
+        """Decodes packed frames of 2-bit symbols into columnar results.
+
+        Counterpart of decode_batch for frames as transmitted by pens (see
+        packed module). The buffer is viewed in place and the partial MNS
+        sequences are read from the packed bytes by table lookups, hence no
+        bitmatrices are created. Frames are assumed to be in canonical
+        orientation and a rotation of 0 is reported.
+
+        Params:
+            buffer: object supporting the buffer protocol (bytes, memoryview,
+                mmap, ...) holding one or more concatenated frames
+            shape: (N,M) shape of frames. Defaults to the order of the MNS.
+                Only the top-left window of a larger frame is decoded.
+            out: optional destination, see decode_batch
+            sections: if True, decodes section coordinates. Otherwise u,v are
+                set to -1.
+
+        Returns:
+            out: the filled destination, see decode_batch
+        """
+        if shape is None:
+            shape = (self.mns_order, self.mns_order)
+        shape = (int(shape[0]), int(shape[1]))
+        if shape not in self._packed_tables:
+            self._packed_tables[shape] = packed.PackedWindowTables(
+                shape, self.mns_order
+            )
+        tables = self._packed_tables[shape]
+        frames = packed.frame_view(buffer, shape)
+        B = len(frames)
+        if out is None:
+            out = results.empty_results(B, position_dtype=self.crt.dtype)
+        if B == 0:
+            return out
+
+        codes = tables.row_codes(frames)  # (B,2,M)
+        x, xstatus = self._decode_codes_along_direction(codes[:, 0])
+        y, ystatus = self._decode_codes_along_direction(codes[:, 1])
+        status = np.where(xstatus != DecodeStatus.OK, xstatus, ystatus)
+        xy = np.stack((x, y), -1)
+        if sections:
+            px = self.mns_lut[codes[:, 0, 0]].astype(np.int64)
+            py = self.mns_lut[codes[:, 1, 0]].astype(np.int64)
+            uv, sstatus = self._decode_sections_from_locs(px, py, xy)
+            status = np.where(status != DecodeStatus.OK, status, sstatus)
+        else:
+            uv = np.full((B, 2), -1, dtype=np.int64)
+
+        failed = status != DecodeStatus.OK
+        xy[failed] = -1
+        uv[failed] = -1
+        columns = {
+            "x": xy[:, 0],
+            "y": xy[:, 1],
+            "u": uv[:, 0],
+            "v": uv[:, 1],
+            "rotation": 0,
+            "status": status,
+        }
+        names = out.dtype.names if isinstance(out, np.ndarray) else out.keys()
+        for name in names:
+            if name in columns:
+                out[name][...] = columns[name]
+        return out
+
+    def _decode_columns(
+        self, bits: np.ndarray, sections: bool, rotation: bool
+    ) -> dict[str, np.ndarray]:
+        """Decodes a batch into the (B,) columns of decode_batch."""
+        B = len(bits)
+        if rotation:
+            rot, status = self.decode_rotations(bits)
+            M = min(bits.shape[1], bits.shape[2])
+            bits = bits[:, :M, :M].astype(np.int8)
+            for k in range(1, 4):
+                sel = rot == k
+                if sel.any():
+                    bits[sel] = helpers.rot90(bits[sel], k=-k)
+        else:
+            rot = np.zeros(B, dtype=np.int8)
+            status = np.zeros(B, dtype=np.uint8)
+
+        xy, pstatus = self.decode_positions(bits)
+        status = np.where(status != DecodeStatus.OK, status, pstatus)
+        if sections:
+            uv, sstatus = self.decode_sections(bits, xy)
+            status = np.where(status != DecodeStatus.OK, status, sstatus)
+        else:
+            uv = np.full((B, 2), -1, dtype=np.int64)
+
+        failed = status != DecodeStatus.OK
+        xy[failed] = -1
+        uv[failed] = -1
+        return {
+            "x": xy[:, 0],
+            "y": xy[:, 1],
+            "u": uv[:, 0],
+            "v": uv[:, 1],
+            "rotation": rot,
+            "status": status,
+        }
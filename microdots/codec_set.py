@@ -0,0 +1,151 @@
+"""Decoding windows of unknown codec embodiment.
+
+When printed stock of several codecs is in circulation, CodecSet decodes
+a batch of windows against all of them at once and reports which codec
+each window belongs to. A codec applies to a window if
+
+    - every row/column of the window is a substring of the codec's MNS,
+    - all difference values are within the codec's delta range,
+    - the coefficients are found in the SNS and, for windows larger than
+      the order of the MNS, the surplus coefficients continue the SNS.
+
+Partial sequences are located once per distinct MNS, so that codecs only
+differing in their SNS (such as anoto_6x6 and anoto_6x6_a4_fixed) share
+this step. Larger windows carry more redundancy and discriminate better.
+
+Example:
+    cs = CodecSet({"a4": defaults.anoto_6x6, "a4fixed": defaults.anoto_6x6_a4_fixed})
+    ids, xy, status = cs.decode_positions(windows)
+    names = [cs.names[i] if i >= 0 else None for i in ids]
+"""
+
+import numpy as np
+
+from .codec import AnotoCodec, DecodeStatus
+from .exceptions import DecodingError
+
+
+class CodecSet:
+    """Decodes batches of windows against several codecs."""
+
+    def __init__(self, codecs) -> None:
+        """Initialize the set.
+
+        Params:
+            codecs: list of codecs or mapping from names to codecs. Codec ids
+                reported by the methods of this class index into this list
+                or the mapping's insertion order.
+        """
+        if isinstance(codecs, dict):
+            self.names = list(codecs.keys())
+            self.codecs: list[AnotoCodec] = list(codecs.values())
+        else:
+            self.codecs = list(codecs)
+            self.names = [str(i) for i in range(len(self.codecs))]
+        if len(self.codecs) == 0:
+            raise ValueError("At least one codec is required.")
+        # Positions of codecs exceeding int64 are held in object arrays
+        self.position_dtype = np.result_type(*[c.crt.dtype for c in self.codecs])
+
+        # Codecs sharing the same MNS share MNS lookups
+        self.groups: dict[tuple[bytes, int], list[int]] = {}
+        for i, c in enumerate(self.codecs):
+            key = (c.mns.tobytes(), c.mns_order)
+            self.groups.setdefault(key, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.codecs)
+
+    def match(self, bits: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Decodes a batch of windows with every codec of the set.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices
+
+        Returns:
+            xy: (B,K,2) locations of the top-left dot per codec. -1 where the
+                codec does not apply.
+            status: (B,K) DecodeStatus per window and codec. Codecs whose MNS
+                order exceeds the window size report INSUFFICIENT_DATA.
+            applies: (B,K) boolean mask of codecs that decode the window
+        """
+        bits = np.asarray(bits)
+        if bits.ndim != 4 or bits.shape[-1] != 2:
+            raise DecodingError(f"Excepted a (B,M,N,2) matrix, but got {bits.shape}")
+        B, N, W = bits.shape[:3]
+        K = len(self.codecs)
+        xy = np.full((B, K, 2), -1, dtype=self.position_dtype)
+        status = np.full((B, K), DecodeStatus.INSUFFICIENT_DATA, dtype=np.uint8)
+
+        bits = bits.astype(np.int8)
+        # Columns of the x-plane and rows of the y-plane hold MNS substrings
+        seqs = (bits[..., 0].transpose(0, 2, 1), bits[..., 1])
+        for (_, order), ids in self.groups.items():
+            if min(N, W) < order:
+                continue
+            ref = self.codecs[ids[0]]
+            locs = [ref._locate_mns_runs(s) for s in seqs]
+            for i in ids:
+                (x, xst), (y, yst) = [self.codecs[i]._decode_locs(loc) for loc in locs]
+                st = np.where(xst != DecodeStatus.OK, xst, yst)
+                ok = st == DecodeStatus.OK
+                xy[ok, i] = np.stack((x, y), -1)[ok]
+                status[:, i] = st
+        return xy, status, status == DecodeStatus.OK
+
+    def decode_positions(
+        self, bits: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Determines the codec of each window and decodes its location.
+
+        Params:
+            bits: (B,N,M,2) batch of bitmatrices
+
+        Returns:
+            ids: (B,) index of the codec applying to each window. -1 if no
+                codec or more than one codec applies.
+            xy: (B,2) locations wrt to the section coordinate system of the
+                identified codec. -1 for windows without codec.
+            status: (B,) DecodeStatus values. AMBIGUOUS if several codecs
+                apply, otherwise the status of the first codec if none does.
+        """
+        xy, status, applies = self.match(bits)
+        B = len(xy)
+        count = applies.sum(-1)
+        ids = np.where(count == 1, np.argmax(applies, -1), -1)
+        res = np.full((B, 2), -1, dtype=self.position_dtype)
+        found = ids >= 0
+        res[found] = xy[found, ids[found]]
+
+        # Report the most informative failure among codecs that could be tried
+        tried = status != DecodeStatus.INSUFFICIENT_DATA
+        first = np.where(tried.any(-1), np.argmax(tried, -1), 0)
+        out = status[np.arange(B), first]
+        out = np.where(count > 1, DecodeStatus.AMBIGUOUS, out)
+        out = np.where(found, DecodeStatus.OK, out).astype(np.uint8)
+        return ids, res, out
+
+    def decode_sections(
+        self, bits: np.ndarray, ids: np.ndarray, xy: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Computes section coordinates using the codec identified per window.
+
+        Params:
+            bits: (B,N,M,2) batch of observed bits
+            ids: (B,) codec ids as returned by decode_positions
+            xy: (B,2) locations as returned by decode_positions
+
+        Returns:
+            uv: (B,2) section coordinates. -1 for windows without codec.
+            status: (B,) DecodeStatus values
+        """
+        bits = np.asarray(bits)
+        ids = np.asarray(ids)
+        xy = np.asarray(xy)
+        uv = np.full((len(ids), 2), -1, dtype=np.int64)
+        status = np.full(len(ids), DecodeStatus.MNS_NOT_FOUND, dtype=np.uint8)
+        for i, c in enumerate(self.codecs):
+            sel = np.flatnonzero(ids == i)
+            if len(sel) > 0:
+                uv[sel], status[sel] = c.decode_sections(bits[sel], xy[sel])
+        return uv, status
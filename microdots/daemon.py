@@ -0,0 +1,361 @@
+"""Local decode daemon.
+
+DecodeServer owns a codec and its lookup tables and serves decoding
+requests on a Unix domain socket. Requests of all connected clients are
+collected for a short delay and decoded as one batch per frame shape, so
+that many processes submitting small batches share a single codec and
+still benefit from vectorized decoding. DecodeClient is the counterpart
+used by these processes:
+
+    with DecodeServer(defaults.anoto_6x6_a4_fixed, "/tmp/microdots.sock"):
+        client = DecodeClient("/tmp/microdots.sock")
+        rows = client.decode(bits)  # (B,N,M,2) bits or packed frames
+
+The protocol is binary. A request is a REQUEST_HEADER followed by frames
+packed as in the packed module. A response is a RESPONSE_HEADER followed
+by the raw rows of the results (see results.result_dtype) or, on failure,
+a UTF-8 error message. All integers are little-endian.
+"""
+
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from . import packed, results
+from .exceptions import DecodingError
+
+"""Request: magic, request id, payload bytes, frame rows N, frame columns M,
+flags. N=M=0 selects frames of the codec's MNS order."""
+REQUEST_HEADER = struct.Struct("<4sIIBBB")
+REQUEST_MAGIC = b"MDQ1"
+
+"""Response: magic, request id, payload bytes, status (0 ok, 1 error)."""
+RESPONSE_HEADER = struct.Struct("<4sIIB")
+RESPONSE_MAGIC = b"MDR1"
+
+"""Request flag to decode section coordinates."""
+FLAG_SECTIONS = 1
+
+
+def _discard(sock: socket.socket, n: int) -> bool:
+    """Receives and drops n bytes. Returns False if the peer closed first."""
+    buf = bytearray(min(n, 2**16))
+    while n > 0:
+        k = sock.recv_into(buf, min(n, len(buf)))
+        if k == 0:
+            return False
+        n -= k
+    return True
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray:
+    """Receives exactly n bytes. Returns None if the peer closed first."""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        k = sock.recv_into(view[pos:])
+        if k == 0:
+            return None
+        pos += k
+    return buf
+
+
+class _Connection:
+    """A client connection whose responses are sent by the batcher."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def respond(self, request_id: int, payload, status: int = 0) -> None:
+        header = RESPONSE_HEADER.pack(
+            RESPONSE_MAGIC, request_id, len(payload), status
+        )
+        with self.lock:
+            try:
+                self.sock.sendall(header)
+                self.sock.sendall(payload)
+            except OSError:
+                pass  # client gone
+
+    def fail(self, request_id: int, message: str) -> None:
+        self.respond(request_id, message.encode("utf-8"), status=1)
+
+
+class _Request:
+    def __init__(self, conn, request_id, shape, sections, frames) -> None:
+        self.conn = conn
+        self.request_id = request_id
+        self.shape = shape
+        self.sections = sections
+        self.frames = frames
+
+
+class DecodeServer:
+    """Serves batched decoding on a Unix domain socket."""
+
+    def __init__(
+        self,
+        codec,
+        path: str,
+        max_batch: int = 2**16,
+        max_delay: float = 0.002,
+    ) -> None:
+        """Initialize the server and bind its socket.
+
+        Params:
+            codec: codec to decode with
+            path: file system path of the socket. Replaced if it exists.
+            max_batch: number of frames after which a batch is decoded
+                without waiting any longer. Requests of more frames are
+                rejected.
+            max_delay: seconds to wait for further requests after the first
+                request of a batch arrived
+        """
+        if codec.crt.dtype != np.int64:
+            raise ValueError("Codecs with more than 2^63 positions are not served")
+        self.codec = codec
+        self.path = path
+        self.max_batch = int(max_batch)
+        self.max_delay = float(max_delay)
+        self.row_bytes = results.result_dtype().itemsize
+        self.stats = {"requests": 0, "frames": 0, "batches": 0}
+
+        self._queue: queue.Queue = queue.Queue()
+        self._conns: set[socket.socket] = set()
+        self._threads: list[threading.Thread] = []
+        self._closed = threading.Event()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen()
+
+    def start(self) -> "DecodeServer":
+        """Starts accepting connections in background threads."""
+        for target in (self._accept_loop, self._batch_loop):
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def serve_forever(self) -> None:
+        """Serves until close is called or the process is interrupted."""
+        self.start()
+        try:
+            self._closed.wait()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops serving, closes all connections and removes the socket."""
+        if self._closed.is_set() and not self._threads:
+            return
+        self._closed.set()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        for conn in list(self._conns):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self) -> "DecodeServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                return
+            self._conns.add(sock)
+            threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+
+    def _read_loop(self, sock: socket.socket) -> None:
+        """Reads requests of a connection and queues them for decoding."""
+        conn = _Connection(sock)
+        try:
+            while True:
+                header = _recv_exact(sock, REQUEST_HEADER.size)
+                if header is None:
+                    return
+                magic, rid, nbytes, N, M, flags = REQUEST_HEADER.unpack(header)
+                if magic != REQUEST_MAGIC:
+                    return  # not a client of ours, drop the connection
+                if N == 0 and M == 0:
+                    N = M = self.codec.mns_order
+                # Validate before receiving, so that the payload size is bounded
+                error = None
+                if min(N, M) < self.codec.mns_order:
+                    error = f"Frames of shape {(N, M)} are too small"
+                elif nbytes > self.max_batch * packed.frame_nbytes((N, M)):
+                    error = f"Request exceeds {self.max_batch} frames"
+                elif nbytes % packed.frame_nbytes((N, M)) != 0:
+                    error = f"Payload does not hold whole {(N, M)} frames"
+                if error is not None:
+                    # Skip the payload to stay in sync with the client
+                    if not _discard(sock, nbytes):
+                        return
+                    conn.fail(rid, error)
+                    continue
+                frames = _recv_exact(sock, nbytes)
+                if frames is None:
+                    return
+                self._queue.put(
+                    _Request(conn, rid, (N, M), bool(flags & FLAG_SECTIONS), frames)
+                )
+        except OSError:
+            return
+        finally:
+            self._conns.discard(sock)
+            sock.close()
+
+    def _batch_loop(self) -> None:
+        """Collects queued requests into batches and decodes them."""
+        while True:
+            req = self._queue.get()
+            if req is None:
+                return
+            pending = [req]
+            count = len(req.frames) // packed.frame_nbytes(req.shape)
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while count < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    req = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if req is None:
+                    stop = True
+                    break
+                pending.append(req)
+                count += len(req.frames) // packed.frame_nbytes(req.shape)
+            self._decode(pending)
+            if stop:
+                return
+
+    def _decode(self, requests: list[_Request]) -> None:
+        """Decodes requests as one batch per frame shape and flags."""
+        groups: dict[tuple, list[_Request]] = {}
+        for req in requests:
+            groups.setdefault((req.shape, req.sections), []).append(req)
+
+        for (shape, sections), reqs in groups.items():
+            try:
+                rows = self.codec.decode_packed(
+                    b"".join(r.frames for r in reqs), shape, sections=sections
+                )
+            except Exception as e:
+                for r in reqs:
+                    r.conn.fail(r.request_id, str(e))
+                continue
+            self.stats["requests"] += len(reqs)
+            self.stats["frames"] += len(rows)
+            self.stats["batches"] += 1
+
+            payload = memoryview(rows.view(np.uint8))
+            start = 0
+            for r in reqs:
+                n = len(r.frames) // packed.frame_nbytes(shape) * self.row_bytes
+                r.conn.respond(r.request_id, payload[start : start + n])
+                start += n
+
+
+class DecodeClient:
+    """Thin client of a DecodeServer. Safe to share between threads."""
+
+    def __init__(self, path: str, timeout: float = None) -> None:
+        """Connect to a server.
+
+        Params:
+            path: file system path of the server's socket
+            timeout: optional socket timeout in seconds
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.dtype = results.result_dtype()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def decode(
+        self, frames, shape: tuple[int, int] = None, sections: bool = True
+    ) -> np.ndarray:
+        """Decodes frames on the server.
+
+        Params:
+            frames: (B,N,M,2) batch of bitmatrices or a buffer of packed
+                frames (see packed module)
+            shape: (N,M) shape of packed frames. Defaults to the order of
+                the server's codec. Ignored for bitmatrices.
+            sections: if True, decodes section coordinates
+
+        Returns:
+            rows: (B,) structured results, see AnotoCodec.decode_batch
+
+        Raises:
+            ValueError: if frames are larger than 255x255 or the payload
+                exceeds 4 GiB, which the protocol cannot express.
+        """
+        if isinstance(frames, np.ndarray) and frames.ndim == 4:
+            shape = frames.shape[1:3]
+            frames = packed.pack_frames(frames)
+        N, M = (0, 0) if shape is None else (int(shape[0]), int(shape[1]))
+        if not (0 <= N <= 255 and 0 <= M <= 255):
+            raise ValueError(f"Frames of shape {(N, M)} exceed 255x255")
+        payload = memoryview(frames).cast("B")
+        if payload.nbytes >= 2**32:
+            raise ValueError("Payload exceeds 4 GiB, split it into several requests")
+        flags = FLAG_SECTIONS if sections else 0
+
+        with self._lock:
+            rid = self._next_id
+            self._next_id = (self._next_id + 1) % 2**32
+            header = REQUEST_HEADER.pack(
+                REQUEST_MAGIC, rid, payload.nbytes, N, M, flags
+            )
+            self.sock.sendall(header)
+            self.sock.sendall(payload)
+            header = _recv_exact(self.sock, RESPONSE_HEADER.size)
+            if header is None:
+                raise ConnectionError("Decode server closed the connection")
+            magic, rrid, nbytes, status = RESPONSE_HEADER.unpack(header)
+            data = _recv_exact(self.sock, nbytes)
+            if magic != RESPONSE_MAGIC or rrid != rid or data is None:
+                raise ConnectionError("Invalid response from decode server")
+
+        if status != 0:
+            raise DecodingError(data.decode("utf-8"))
+        return np.frombuffer(data, dtype=self.dtype)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "DecodeClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,309 @@
+"""Tools to build and verify sequences for custom codecs.
+
+A codec requires a binary main number sequence (MNS) and a set of
+secondary number sequences (SNS), each of which has to be a (quasi)
+De Bruijn sequence, i.e. every substring of the sequence's order
+appears at most once in the cyclic sequence. Additionally, the SNS
+lengths need to be pairwise relatively prime for the CRT to apply.
+
+This module provides
+    - linear time checks of the (quasi) De Bruijn property based on
+      integer window codes,
+    - generation of De Bruijn sequences by Eulerian traversal of the
+      De Bruijn graph and of quasi De Bruijn sequences of arbitrary
+      length by cutting closed sub-trails from them,
+    - a search for relatively prime SNS lengths that maximize the
+      addressable period.
+
+Example:
+    mns = quasi_debruijn(alphabet=2, order=6, length=63, seed=0)
+    a1 = quasi_debruijn(alphabet=3, order=5, length=236, seed=0)
+    assert is_quasi_debruijn(mns, 6) and is_quasi_debruijn(a1, 5)
+"""
+
+import math
+
+import numpy as np
+
+
+def window_codes(
+    seq: np.ndarray, order: int, alphabet: int = None, cyclic: bool = True
+) -> np.ndarray:
+    """Packs every window of the given order into an integer code.
+
+    Params:
+        seq: (N,) sequence of symbols in [0,alphabet)
+        order: window length
+        alphabet: number of symbols. If not given, max(seq)+1 is used.
+        cyclic: If True, windows wrap around the end of the sequence.
+
+    Returns:
+        codes: (N,) array of window codes for cyclic sequences, otherwise
+            (N-order+1,).
+    """
+    seq = np.asarray(seq, dtype=np.int64)
+    if alphabet is None:
+        alphabet = int(seq.max()) + 1
+    if cyclic:
+        # Indexing modulo the length also handles sequences shorter than order
+        seq = seq[np.arange(len(seq) + order - 1) % len(seq)]
+    n = len(seq) - order + 1
+    codes = np.zeros(n, dtype=np.int64)
+    # Horner scheme over the window offsets, vectorized over all windows
+    for k in range(order):
+        codes = codes * alphabet + seq[k : k + n]
+    return codes
+
+
+def find_repeats(
+    seq: np.ndarray, order: int, alphabet: int = None, cyclic: bool = True
+) -> list[tuple[int, int]]:
+    """Finds windows that appear more than once.
+
+    Params:
+        seq: (N,) sequence of symbols
+        order: window length
+        alphabet: number of symbols. If not given, max(seq)+1 is used.
+        cyclic: If True, windows wrap around the end of the sequence.
+
+    Returns:
+        repeats: list of (first, other) start indices of duplicate windows,
+            sorted by the index of the duplicate.
+    """
+    codes = window_codes(seq, order, alphabet=alphabet, cyclic=cyclic)
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    firsts = first[inverse.reshape(-1)]
+    dups = np.flatnonzero(firsts != np.arange(len(codes)))
+    return [(int(firsts[i]), int(i)) for i in dups]
+
+
+def is_quasi_debruijn(
+    seq: np.ndarray, order: int, alphabet: int = None, cyclic: bool = True
+) -> bool:
+    """Tests whether every window of the given order appears at most once.
+
+    For moderate code spaces, occurrences are counted by bincount which
+    makes this test linear in the length of the sequence.
+    """
+    codes = window_codes(seq, order, alphabet=alphabet, cyclic=cyclic)
+    space = (int(np.max(seq)) + 1 if alphabet is None else alphabet) ** order
+    if space <= 4 * len(codes) + 2**16:
+        return bool(np.bincount(codes, minlength=space).max(initial=0) <= 1)
+    return len(np.unique(codes)) == len(codes)
+
+
+def is_debruijn(seq: np.ndarray, order: int, alphabet: int) -> bool:
+    """Tests whether the cyclic sequence contains every window exactly once."""
+    return len(seq) == alphabet**order and is_quasi_debruijn(seq, order, alphabet)
+
+
+def debruijn(alphabet: int, order: int, seed: int = None) -> np.ndarray:
+    """Generates a cyclic De Bruijn sequence B(alphabet, order).
+
+    The sequence is the label sequence of an Eulerian circuit in the
+    De Bruijn graph whose nodes are the words of length order-1 and whose
+    edges are the words of length order. The circuit is found by an
+    iterative variant of Hierholzer's algorithm.
+
+    Params:
+        alphabet: number of symbols
+        order: window length
+        seed: If given, outgoing edges are visited in random order, which
+            yields different sequences for different seeds. Otherwise the
+            sequence starts with order zeros.
+
+    Returns:
+        seq: (alphabet**order,) int8 sequence
+    """
+    if alphabet < 2 or order < 1:
+        raise ValueError("Requires an alphabet of at least two symbols and order >= 1")
+    if order == 1:
+        return np.arange(alphabet, dtype=np.int8)
+
+    num_nodes = alphabet ** (order - 1)
+    # Symbols of outgoing edges per node, consumed from the end
+    if seed is None:
+        out = np.tile(np.arange(alphabet)[::-1], (num_nodes, 1))
+    else:
+        rng = np.random.default_rng(seed)
+        out = rng.permuted(np.tile(np.arange(alphabet), (num_nodes, 1)), axis=1)
+    out = out.tolist()
+
+    # Hierholzer: walk unused edges, backtrack and emit edge labels
+    node_stack = [0]
+    label_stack = []
+    labels = []
+    while node_stack:
+        node = node_stack[-1]
+        edges = out[node]
+        if edges:
+            a = edges.pop()
+            node_stack.append((node * alphabet + a) % num_nodes)
+            label_stack.append(a)
+        else:
+            node_stack.pop()
+            if label_stack:
+                labels.append(label_stack.pop())
+    labels.reverse()
+
+    # Starting at node 0 (order-1 zeros), labels denote the appended symbols.
+    # Rotate so that the sequence starts with the zero node's word.
+    seq = np.array(labels, dtype=np.int8)
+    return np.roll(seq, order - 1)
+
+
+def quasi_debruijn(
+    alphabet: int,
+    order: int,
+    length: int,
+    seed: int = None,
+    max_tries: int = 32,
+) -> np.ndarray:
+    """Generates a cyclic quasi De Bruijn sequence of given length.
+
+    Starting from a De Bruijn sequence, closed sub-trails are removed until
+    the target length is reached. A closed sub-trail is a segment between
+    two occurrences of the same word of length order-1. Removing it keeps
+    all windows of the given order unique, since every window across the
+    cut already existed in the original sequence.
+
+    Params:
+        alphabet: number of symbols
+        order: window length
+        length: target length, at most alphabet**order
+        seed: seed of random choices. None yields a deterministic sequence.
+        max_tries: number of restarts with different random choices before
+            giving up.
+
+    Returns:
+        seq: (length,) int8 quasi De Bruijn sequence
+
+    Raises:
+        ValueError: if the length is out of range or no sequence was found.
+    """
+    full = alphabet**order
+    if not 1 <= length <= full:
+        raise ValueError(f"Length must be in [1,{full}] but got {length}")
+
+    rng = np.random.default_rng(0 if seed is None else seed)
+    for trial in range(max_tries):
+        # First try the canonical sequence, then randomized ones
+        dseed = None if (seed is None and trial == 0) else int(rng.integers(2**31))
+        s = debruijn(alphabet, order, seed=dseed)
+        s = _cut_down(s, order, alphabet, length, rng)
+        if s is not None:
+            return s
+    raise ValueError(
+        f"Failed to find a quasi De Bruijn sequence of length {length} "
+        f"for alphabet {alphabet} and order {order}"
+    )
+
+
+def _cut_down(
+    seq: np.ndarray, order: int, alphabet: int, length: int, rng
+) -> np.ndarray:
+    """Removes closed sub-trails from seq until it has the given length.
+    Returns None when no suitable sub-trail is left."""
+    seq = np.asarray(seq)
+    while len(seq) > length:
+        n = len(seq)
+        excess = n - length
+        if order == 1:
+            return seq[:length]
+        codes = window_codes(seq, order - 1, alphabet)
+        order_idx = np.argsort(codes, kind="stable")
+        scodes = codes[order_idx]
+
+        # Pairs of consecutive occurrences of the same word are the
+        # shortest closed sub-trails; also consider the complement.
+        same = scodes[1:] == scodes[:-1]
+        i = order_idx[:-1][same]
+        j = order_idx[1:][same]
+        d = j - i  # remove seq[i:j]
+        if len(d) == 0:
+            return None
+        cand = np.concatenate((d, n - d))
+        starts = np.concatenate((i, j))
+
+        exact = np.flatnonzero(cand == excess)
+        if len(exact) > 0:
+            k = exact[rng.integers(len(exact))]
+        else:
+            # Remove the largest sub-trail that leaves room for another cut
+            feasible = np.flatnonzero(cand < excess)
+            if len(feasible) == 0:
+                return None
+            best = cand[feasible].max()
+            top = feasible[cand[feasible] == best]
+            k = top[rng.integers(len(top))]
+        b, e = int(starts[k]), int(starts[k] + cand[k])
+        seq = np.roll(seq, -b)
+        seq = seq[e - b :]
+    return seq.astype(np.int8)
+
+
+def is_pairwise_coprime(numbers: list[int]) -> bool:
+    """Tests whether all pairs of numbers are relatively prime."""
+    numbers = list(numbers)
+    return all(
+        math.gcd(a, b) == 1
+        for idx, a in enumerate(numbers)
+        for b in numbers[idx + 1 :]
+    )
+
+
+def coprime_lengths(
+    max_lengths: list[int], min_lengths: list[int] = None, window: int = 32
+) -> tuple[list[int], int]:
+    """Searches pairwise relatively prime lengths maximizing their product.
+
+    The product of SNS lengths is the period of the CRT and hence the number
+    of addressable positions per direction. The search is a depth-first
+    branch-and-bound over candidate lengths in [max_length-window, max_length]
+    for each sequence.
+
+    Params:
+        max_lengths: upper bound on the length of each sequence, usually
+            alphabet**order of the corresponding SNS.
+        min_lengths: optional lower bounds on the lengths
+        window: number of candidates below each upper bound to consider
+
+    Returns:
+        lengths: best lengths in the order of max_lengths
+        period: product of the best lengths
+    """
+    n = len(max_lengths)
+    if min_lengths is None:
+        min_lengths = [1] * n
+    cands = [
+        list(range(hi, max(lo, hi - window) - 1, -1))
+        for lo, hi in zip(min_lengths, max_lengths)
+    ]
+    # Search most constrained sequences first
+    perm = sorted(range(n), key=lambda i: max_lengths[i])
+    bound = [1] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        bound[k] = bound[k + 1] * max_lengths[perm[k]]
+
+    best = [None, 0]
+
+    def search(k: int, chosen: list[int], prod: int):
+        if k == n:
+            if prod > best[1]:
+                best[0], best[1] = list(chosen), prod
+            return
+        for c in cands[perm[k]]:
+            if prod * c * bound[k + 1] <= best[1]:
+                break  # candidates are descending
+            if all(math.gcd(c, o) == 1 for o in chosen):
+                chosen.append(c)
+                search(k + 1, chosen, prod * c)
+                chosen.pop()
+
+    search(0, [], 1)
+    if best[0] is None:
+        raise ValueError("No relatively prime lengths found")
+    lengths = [0] * n
+    for k, i in enumerate(perm):
+        lengths[i] = best[0][k]
+    return lengths, best[1]
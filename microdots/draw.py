@@ -1,5 +1,7 @@
 import numpy as np
 
+from .helpers import OFFSET_LUT
+
 
 def draw_dots(
     bitmatrix: np.ndarray,
@@ -31,17 +33,8 @@ def draw_dots(
         # Little order: x is lowest bit, y is highes bit => 10 = 2 means x=0,y=1
         bitmatrix = np.packbits(bitmatrix, axis=-1, bitorder="little").squeeze(-1)
 
-    # Taken from
-    # https://patentimages.storage.googleapis.com/b8/ef/c2/046cdc9e044b9e/US7999798.pdf
     if offset_lut is None:
-        offset_lut = np.array(
-            [
-                [0, -1.0],  # 0: north
-                [-1.0, 0.0],  # 1: east
-                [1.0, 0.0],  # 2: west
-                [0.0, 1.0],  # 3: south
-            ]
-        )
+        offset_lut = OFFSET_LUT
     offset_scale = grid_size * 1 / 6
 
     if ax is None:
@@ -0,0 +1,308 @@
+"""Conversion of dot centroids into bitmatrices.
+
+Cameras observe the pattern as a cloud of dot centroids in image
+coordinates. Each dot sits on a node of a regular grid, displaced by a
+sixth of the grid pitch in one of four directions. This module turns
+batches of centroid clouds into (H,W,2) bitmatrices in three steps:
+
+    1. The grid pitch and angle are estimated from the dominant spatial
+       frequencies of the point cloud. A coarse FFT of the rasterized
+       points locates the two fundamental frequencies, which are refined
+       by evaluating the exact Fourier transform of the points around
+       them. The phase at the fundamentals yields the grid origin.
+    2. The affine grid is refined into a homography by least-squares fits
+       to the displaced grid nodes assigned to the points, which absorbs
+       moderate perspective distortion.
+    3. Each point is assigned to its nearest grid node and its offset from
+       the node is classified into the directions of OFFSET_LUT, which is
+       the convention used by draw.draw_dots.
+
+All steps are vectorized over points and batched over frames. Frames are
+passed as (F,N,2) arrays, where frames with fewer points are padded with
+NaN. The first grid axis is the one closest to the image x-axis, hence
+patterns rotated by more than 45° result in rotated bitmatrices (see
+AnotoCodec.decode_rotation).
+
+Example:
+    bits, mask = centroids_to_bits(centroids, shape=(8, 8))
+    xy, status = codec.decode_positions_masked(bits, mask)
+"""
+
+import numpy as np
+
+from . import helpers
+
+
+def _as_batch(points: np.ndarray, valid: np.ndarray = None):
+    points = np.asarray(points, dtype=np.float64)
+    single = points.ndim == 2
+    if single:
+        points = points[None]
+    if points.ndim != 3 or points.shape[-1] != 2:
+        raise ValueError(f"Expected (N,2) or (F,N,2) points, got {points.shape}")
+    finite = np.isfinite(points).all(-1)
+    if valid is None:
+        valid = finite
+    else:
+        valid = np.asarray(valid, dtype=bool).reshape(points.shape[:2]) & finite
+    points = np.where(valid[..., None], points, 0.0)
+    return points, valid, single
+
+
+def _coarse_frequencies(points, valid, raster):
+    """Locates the two strongest, non-parallel frequencies of rasterized points.
+
+    Returns (F,2,2) frequency vectors as rows in cycles per pixel.
+    """
+    F = len(points)
+    lo = np.where(valid[..., None], points, np.inf).min(1)
+    hi = np.where(valid[..., None], points, -np.inf).max(1)
+    lo = np.where(np.isfinite(lo), lo, 0.0)
+    extent = np.where(np.isfinite(hi), hi - lo, 0.0).max(-1)
+    scale = np.maximum(extent, 1e-9) / (raster - 1)  # pixels per raster cell
+
+    u = np.rint((points - lo[:, None, :]) / scale[:, None, None]).astype(np.int64)
+    u = u.clip(0, raster - 1)
+    fidx = np.broadcast_to(np.arange(F)[:, None], valid.shape)
+    img = np.zeros((F, raster, raster))
+    np.add.at(img, (fidx[valid], u[..., 1][valid], u[..., 0][valid]), 1.0)
+    win = np.hanning(raster)
+    img *= win[:, None] * win[None, :]
+
+    spec = np.abs(np.fft.rfft2(img)).reshape(F, -1)
+    ky, kx = np.meshgrid(np.fft.fftfreq(raster), np.fft.rfftfreq(raster), indexing="ij")
+    k = np.stack((kx.reshape(-1), ky.reshape(-1)), -1)  # (P,2) cycles per cell
+    norm = np.linalg.norm(k, axis=-1)
+    # Favor fundamentals over harmonics by blurring points to a fraction of
+    # the pitch expected from the number of points
+    pitch = (raster - 1) / np.sqrt(np.maximum(valid.sum(-1), 1))
+    sigma = 0.15 * pitch[:, None]
+    spec *= np.exp(-2 * (np.pi * sigma * norm[None, :]) ** 2)
+    # Suppress DC and the envelope of the point cloud
+    spec[:, norm < 3.0 / raster] = 0
+
+    # Second frequency at more than 60° from the first one
+    k1 = k[spec.argmax(-1)]  # (F,2)
+    norms = norm[None, :] * np.linalg.norm(k1, axis=-1)[:, None]
+    cos = np.abs(k1 @ k.T) / np.maximum(norms, 1e-12)
+    k2 = k[np.where(cos < 0.5, spec, 0).argmax(-1)]
+    return np.stack((k1, k2), 1) / scale[:, None, None]
+
+
+def _refine_frequencies(points, valid, freqs, step, iterations=5):
+    """Refines (F,2,2) frequencies by maximizing the magnitude of the exact
+    Fourier transform of the points on successively finer local grids."""
+    offs = np.linspace(-2, 2, 5)
+    grid = np.stack(np.meshgrid(offs, offs, indexing="ij"), -1).reshape(-1, 2)
+    w = valid.astype(np.float64)
+    freqs = freqs.copy()
+    for _ in range(iterations):
+        for r in range(2):
+            cand = freqs[:, r, None, :] + grid[None] * step[:, None, None]  # (F,C,2)
+            phase = 2 * np.pi * np.einsum("fcd,fnd->fcn", cand, points)
+            mag = np.abs(np.einsum("fcn,fn->fc", np.exp(1j * phase), w))
+            freqs[:, r] = cand[np.arange(len(cand)), mag.argmax(-1)]
+        step = step / 2.5
+    return freqs
+
+
+def _canonical_affine(points, valid, freqs):
+    """Builds (F,3,3) affine maps from grid to image coordinates whose first
+    axis is closest to the image x-axis and whose handedness is positive."""
+    F = len(points)
+    # Frames without usable points yield degenerate frequencies
+    degenerate = ~(np.abs(np.linalg.det(freqs)) > 1e-12)
+    freqs = np.where(degenerate[:, None, None], np.eye(2), freqs)
+    B = np.linalg.inv(freqs)  # columns are lattice vectors
+    a, b = B[..., 0], B[..., 1]  # (F,2)
+    # Lagrange reduction, in case harmonics or diagonals were picked
+    for _ in range(4):
+        t = np.rint((a * b).sum(-1) / np.maximum((a * a).sum(-1), 1e-12))
+        b = b - t[:, None] * a
+        shorter = (b * b).sum(-1) < (a * a).sum(-1)
+        a, b = np.where(shorter[:, None], b, a), np.where(shorter[:, None], a, b)
+    # First axis: the lattice vector (up to sign) with largest |x|
+    swap = np.abs(b[:, 0]) > np.abs(a[:, 0])
+    e1 = np.where(swap[:, None], b, a)
+    e2 = np.where(swap[:, None], a, b)
+    e1 = e1 * np.sign(e1[:, :1] + 1e-12)
+    det = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    e2 = e2 * np.sign(det + 1e-12)[:, None]
+    B = np.stack((e1, e2), -1)
+
+    # Origin from the phase of the fundamentals
+    K = np.linalg.inv(B)
+    q = np.einsum("fij,fnj->fni", K, points)
+    z = np.einsum("fnd,fn->fd", np.exp(2j * np.pi * q), valid.astype(np.float64))
+    origin = np.einsum("fij,fj->fi", B, np.angle(z) / (2 * np.pi))
+
+    A = np.zeros((F, 3, 3))
+    A[:, :2, :2] = B
+    A[:, :2, 2] = origin
+    A[:, 2, 2] = 1.0
+    return A
+
+
+def _apply(H: np.ndarray, pts: np.ndarray) -> np.ndarray:
+    """Applies (F,3,3) projective maps to (F,N,2) points."""
+    q = np.einsum("fij,fnj->fni", H[:, :, :2], pts) + H[:, None, :, 2]
+    return q[..., :2] / q[..., 2:]
+
+
+def _fit_homographies(cells, points, w):
+    """Weighted least-squares fit of (F,3,3) homographies mapping grid cells
+    to image points, with normalized coordinates for conditioning."""
+    F, N = w.shape
+    sw = np.maximum(w.sum(-1), 1e-12)
+    mc = np.einsum("fnd,fn->fd", cells, w) / sw[:, None]
+    mp = np.einsum("fnd,fn->fd", points, w) / sw[:, None]
+    s = np.sqrt(np.einsum("fn,fn->f", ((points - mp[:, None]) ** 2).sum(-1), w) / sw)
+    s = np.maximum(s, 1e-9)
+    c = cells - mc[:, None]
+    p = (points - mp[:, None]) / s[:, None, None]
+    i, j = c[..., 0], c[..., 1]
+    x, y = p[..., 0], p[..., 1]
+    one, zero = np.ones_like(i), np.zeros_like(i)
+    A = np.concatenate(
+        (
+            np.stack((i, j, one, zero, zero, zero, -i * x, -j * x), -1),
+            np.stack((zero, zero, zero, i, j, one, -i * y, -j * y), -1),
+        ),
+        1,
+    )  # (F,2N,8)
+    b = np.concatenate((x, y), 1)
+    ww = np.concatenate((w, w), 1)
+    AtA = np.einsum("fnk,fn,fnl->fkl", A, ww, A) + 1e-9 * np.eye(8)
+    Atb = np.einsum("fnk,fn,fn->fk", A, ww, b)
+    h = np.linalg.solve(AtA, Atb[..., None])[..., 0]
+    Hn = np.concatenate((h, np.ones((F, 1))), -1).reshape(F, 3, 3)
+
+    T_cell = np.tile(np.eye(3), (F, 1, 1))
+    T_cell[:, :2, 2] = -mc
+    T_img = np.tile(np.eye(3), (F, 1, 1))
+    T_img[:, 0, 0] = T_img[:, 1, 1] = s
+    T_img[:, :2, 2] = mp
+    return T_img @ Hn @ T_cell
+
+
+def estimate_grid(
+    points: np.ndarray,
+    valid: np.ndarray = None,
+    raster: int = None,
+    iterations: int = 4,
+) -> np.ndarray:
+    """Estimates the nominal dot grid of centroid clouds.
+
+    Params:
+        points: (N,2) or (F,N,2) centroids in image coordinates. NaN rows
+            are ignored.
+        valid: optional (F,N) mask of points to use
+        raster: size of the raster used to locate fundamental frequencies.
+            Defaults to a size that resolves the expected number of dots.
+        iterations: number of homography refinements
+
+    Returns:
+        H: (3,3) or (F,3,3) homographies mapping grid coordinates (i,j) to
+            image coordinates. Grid nodes have integer coordinates.
+    """
+    points, valid, single = _as_batch(points, valid)
+    n = valid.sum(-1)
+    if raster is None:
+        across = np.sqrt(max(int(n.max(initial=0)), 1))
+        raster = int(np.clip(2 ** np.ceil(np.log2(6 * across)), 32, 1024))
+
+    # Work relative to the centroid of each frame for numerical stability
+    center = np.einsum("fnd,fn->fd", points, valid) / np.maximum(n, 1)[:, None]
+    rel = np.where(valid[..., None], points - center[:, None], 0.0)
+
+    freqs = _coarse_frequencies(rel, valid, raster)
+    extent = np.abs(rel).max(axis=(1, 2)) * 2 + 1e-9
+    freqs = _refine_frequencies(rel, valid, freqs, step=0.5 / extent)
+    H = _canonical_affine(rel, valid, freqs)
+
+    for it in range(iterations):
+        q = _apply(np.linalg.inv(H), rel)
+        cells = np.rint(q)
+        # Grow the fitted region from the center, where the affine estimate
+        # is most accurate, so that perspective does not mislead assignments
+        radius = 3 * 2**it if it < iterations - 1 else np.inf
+        w = (valid & (np.abs(cells).max(-1) <= radius)).astype(np.float64)
+        # Dots are displaced along one of the grid axes. Fitting to displaced
+        # nodes keeps projective terms from absorbing the displacements.
+        r = q - cells
+        major = np.abs(r) >= np.abs(r[..., ::-1])
+        disp = np.where(major, r, 0.0)
+        # Points close to the diagonals have ambiguous displacements
+        margin = np.abs(np.abs(r[..., 0]) - np.abs(r[..., 1]))
+        Hn = _fit_homographies(cells + disp, rel, w * np.clip(margin * 12, 0.05, 1))
+        ok = np.isfinite(Hn).all((1, 2)) & (np.abs(np.linalg.det(Hn)) > 1e-12)
+        H = np.where(ok[:, None, None], Hn, H)
+
+    T = np.tile(np.eye(3), (len(H), 1, 1))
+    T[:, :2, 2] = center
+    H = T @ H
+    return H[0] if single else H
+
+
+def centroids_to_bits(
+    points: np.ndarray,
+    shape: tuple[int, int],
+    valid: np.ndarray = None,
+    offset_lut: np.ndarray = None,
+    homographies: np.ndarray = None,
+    max_residual: float = 0.4,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Converts centroid clouds into bitmatrices.
+
+    Params:
+        points: (N,2) or (F,N,2) centroids in image coordinates. NaN rows
+            are ignored.
+        shape: (H,W) shape of the bitmatrices. The top-left cell is the
+            smallest grid node observed in each frame.
+        valid: optional (F,N) mask of points to use
+        offset_lut: optional (4,2) matrix of offset directions per number in
+            [0,3]. Defaults to helpers.OFFSET_LUT as used by draw_dots.
+        homographies: optional (F,3,3) grid estimates. Computed by
+            estimate_grid if not given.
+        max_residual: points farther than this from their grid node (in
+            units of the pitch) are ignored.
+
+    Returns:
+        bits: (H,W,2) or (F,H,W,2) bitmatrices
+        mask: (H,W) or (F,H,W) boolean masks of cells observed by exactly
+            one point. Bits of other cells are zero.
+    """
+    points, valid, single = _as_batch(points, valid)
+    F = len(points)
+    H, W = int(shape[0]), int(shape[1])
+    if offset_lut is None:
+        offset_lut = helpers.OFFSET_LUT
+    if homographies is None:
+        homographies = estimate_grid(points, valid)
+    homographies = np.asarray(homographies, dtype=np.float64).reshape(F, 3, 3)
+
+    q = _apply(np.linalg.inv(homographies), points)  # (F,N,2) grid coordinates
+    cells = np.rint(q)
+    resid = q - cells
+    symbols = np.argmax(resid @ np.asarray(offset_lut, dtype=np.float64).T, -1)
+    valid = valid & (np.linalg.norm(resid, axis=-1) <= max_residual)
+    valid &= (valid.sum(-1) >= 8)[:, None]  # too few points for a grid
+
+    cells = cells.astype(np.int64)
+    c0 = np.where(valid[..., None], cells, np.iinfo(np.int64).max).min(1)
+    idx = cells - c0[:, None]
+    inside = valid & (idx[..., 0] < W) & (idx[..., 1] < H)
+
+    f = np.broadcast_to(np.arange(F)[:, None], valid.shape)[inside]
+    iy, ix = idx[..., 1][inside], idx[..., 0][inside]
+    counts = np.zeros((F, H, W), dtype=np.int64)
+    np.add.at(counts, (f, iy, ix), 1)
+    nums = np.zeros((F, H, W), dtype=np.uint8)
+    nums[f, iy, ix] = symbols[inside]
+    mask = counts == 1
+    nums[~mask] = 0
+
+    bits = helpers.num_to_bits(nums).astype(np.int8)
+    if single:
+        return bits[0], mask[0]
+    return bits, mask
@@ -18,6 +18,19 @@ def num_to_bits(num_matrix: np.ndarray) -> np.ndarray:
     )
 
 
+"""Default displacement direction (x,y) of dots for each number in [0,3] with
+y pointing down. Taken from
+https://patentimages.storage.googleapis.com/b8/ef/c2/046cdc9e044b9e/US7999798.pdf
+"""
+OFFSET_LUT = np.array(
+    [
+        [0, -1.0],  # 0: north
+        [-1.0, 0.0],  # 1: east
+        [1.0, 0.0],  # 2: west
+        [0.0, 1.0],  # 3: south
+    ]
+)
+
 """Maps from displacement direction d to canonical direction c.
 For example index d=1 ('west') -> c=3."""
 NUM2DIR = [0, 3, 1, 2]
@@ -33,17 +46,14 @@ def rot90(
     """Simulates 90° rotation of the bitmatrix applied k-times.
 
     When k is positive applies a counterclockwise rotation,
-    else clockwise.
+    else clockwise. Also accepts (...,M,N,2) batches of bitmatrices.
     """
     m = bits_to_num(bitmatrix)
     # 1. Rotate array
-    m = np.rot90(m, k=k, axes=(0, 1))
+    m = np.rot90(m, k=k, axes=(-2, -1))
 
     # 2. Change bits: under rotation, bits will be decoded differently
-    def rot_num(x):
-        d = (NUM2DIR[x] - k) % 4
-        return DIR2NUM[d]
-
-    m = np.vectorize(rot_num)(m)
+    lut = np.array([DIR2NUM[(NUM2DIR[x] - k) % 4] for x in range(4)], dtype=np.uint8)
+    m = lut[m]
     # 3. Convert back to bits
     return num_to_bits(m.astype(np.uint8))
@@ -0,0 +1,117 @@
+"""Opt-in instrumentation of the decoding hot-path.
+
+An instance of CodecInstrumentation collects per-stage call counts,
+accumulated times and timing histograms as well as counts of failure
+reasons. It is attached to a codec via AnotoCodec.enable_instrumentation
+and is otherwise not consulted, so that a codec without instrumentation
+pays nothing but a single attribute check per decode.
+"""
+
+import bisect
+import time
+from collections import Counter
+
+"""Names of the instrumented stages of position/section decoding."""
+STAGES = (
+    "mns_search",
+    "delta_check",
+    "project",
+    "sns_search",
+    "crt_solve",
+    "integrate_roll",
+    "index_lookup",
+)
+
+"""Default upper bucket bounds of timing histograms in seconds. A final
+overflow bucket collects all samples larger than the last bound."""
+DEFAULT_BUCKET_BOUNDS = (
+    1e-6,
+    2e-6,
+    5e-6,
+    1e-5,
+    2e-5,
+    5e-5,
+    1e-4,
+    2e-4,
+    5e-4,
+    1e-3,
+    1e-2,
+    1e-1,
+)
+
+
+class CodecInstrumentation:
+    """Collects stage timings and failure counts of a codec.
+
+    Stage times are measured with time.perf_counter. Histograms use
+    fixed bucket bounds, so that snapshots of different processes can
+    be merged by simple addition. This class is not thread-safe; use
+    one codec instance per thread when instrumentation is enabled.
+    """
+
+    def __init__(self, bucket_bounds: tuple[float, ...] = None) -> None:
+        """Initialize the instrumentation.
+
+        Params:
+            bucket_bounds: sorted upper bounds of histogram buckets in seconds.
+                If not given, DEFAULT_BUCKET_BOUNDS is used.
+        """
+        if bucket_bounds is None:
+            bucket_bounds = DEFAULT_BUCKET_BOUNDS
+        self.bucket_bounds = tuple(float(b) for b in bucket_bounds)
+        if list(self.bucket_bounds) != sorted(self.bucket_bounds):
+            raise ValueError("Bucket bounds must be sorted.")
+        self.clock = time.perf_counter
+        self.reset()
+
+    def reset(self) -> None:
+        """Clears all collected counters and histograms."""
+        nbuckets = len(self.bucket_bounds) + 1
+        self.counts = {s: 0 for s in STAGES}
+        self.totals = {s: 0.0 for s in STAGES}
+        self.maxima = {s: 0.0 for s in STAGES}
+        self.histograms = {s: [0] * nbuckets for s in STAGES}
+        self.failures = Counter()
+        self.calls = Counter()
+
+    def record(self, stage: str, elapsed: float) -> None:
+        """Records a single timing sample for the given stage."""
+        self.counts[stage] += 1
+        self.totals[stage] += elapsed
+        if elapsed > self.maxima[stage]:
+            self.maxima[stage] = elapsed
+        self.histograms[stage][bisect.bisect_left(self.bucket_bounds, elapsed)] += 1
+
+    def record_failure(self, reason: str) -> None:
+        """Counts a decoding failure of the given reason."""
+        self.failures[reason] += 1
+
+    def record_call(self, method: str) -> None:
+        """Counts a call to a public decoding method."""
+        self.calls[method] += 1
+
+    def snapshot(self) -> dict:
+        """Returns a copy of the collected data made of plain Python types.
+
+        Returns:
+            snapshot: dictionary with keys 'calls', 'failures', 'bucket_bounds'
+                and 'stages'. The latter maps each stage name to a dictionary
+                of 'count', 'total', 'mean', 'max' (all times in seconds) and
+                'histogram' counts (one more than there are bucket bounds).
+        """
+        stages = {}
+        for s in STAGES:
+            n = self.counts[s]
+            stages[s] = {
+                "count": n,
+                "total": self.totals[s],
+                "mean": self.totals[s] / n if n > 0 else 0.0,
+                "max": self.maxima[s],
+                "histogram": list(self.histograms[s]),
+            }
+        return {
+            "calls": dict(self.calls),
+            "failures": dict(self.failures),
+            "bucket_bounds": list(self.bucket_bounds),
+            "stages": stages,
+        }
@@ -1,8 +1,19 @@
 """This is just a demo script that shows how to reconstruct numbers in
 a specific range from bases, coefficients relating to their prime factors"""
 
+import math
+
 import numpy as np
 
+"""Largest exclusive upper bound of integers represented as np.int64."""
+INT64_UPPER = 2**63
+
+
+def integer_dtype(upper: int):
+    """Returns np.int64 if all integers in [0,upper) fit into it and object
+    (arrays of Python integers) otherwise."""
+    return np.int64 if int(upper) <= INT64_UPPER else object
+
 
 class NumberBasis:
     def __init__(self, pfactors: np.ndarray):
@@ -16,11 +27,12 @@ class NumberBasis:
         Note, the order of the p1,...,pn gives raise to different bases
         and hence different coefficient representations for the same integer.
         """
-        self.upper = np.prod(pfactors)
+        pfactors = [int(p) for p in pfactors]
+        self.upper = math.prod(pfactors)
         self.lower = 0
-        p = np.concatenate([[1], pfactors])
-        p = np.cumprod(p)
-        self.bases = p[:-1]
+        self.dtype = integer_dtype(self.upper)
+        bases = [math.prod(pfactors[:i]) for i in range(len(pfactors))]
+        self.bases = np.array(bases, dtype=self.dtype)
         self.rbases = self.bases[::-1]
 
     def project(self, n: np.ndarray) -> np.ndarray:
@@ -35,10 +47,13 @@ class NumberBasis:
                 and each basis, starting with the b1.
         """
         n = np.asarray(n)
+        if self.dtype is object:
+            n = n.astype(object)
         assert np.logical_and(n >= 0, n < self.upper).all()
         coeffs = []
         for b in self.rbases:
-            q, r = np.divmod(n, b)
+            # np.divmod does not support Python integers of large bases
+            q, r = n // b, n % b
             coeffs.append(q)
             n = r
         return np.array(coeffs[::-1], dtype=n.dtype).T
@@ -118,29 +133,102 @@ class CRT:
     [1] https://mathworld.wolfram.com/GreatestCommonDivisorTheorem.html
     https://en.wikipedia.org/wiki/Chinese_remainder_theorem
     https://de.wikipedia.org/wiki/Chinesischer_Restsatz#Finden_einer_L%C3%B6sung
+
+    ## Large periods
+    The terms ei*ai exceed 64 bits long before x does. Therefore, for periods
+    L where they do, solve computes the mixed-radix digits v1,...,vn of x with
+        x = v1 + v2*l1 + v3*l1*l2 + ... + vn*l1*...*l(n-1)
+    instead (Garner's algorithm), which only involves products of numbers
+    less than the individual li. The digits are combined by Horner's scheme
+    in groups whose product of lengths fits into 64 bits. Only if the period
+    L exceeds 2^63, the groups are combined using Python integers, and
+    solutions are returned as arrays of dtype object.
     """
 
     def __init__(self, lengths: list[int]) -> None:
-        self.lengths = np.asarray(lengths)
-        self.L = np.prod(self.lengths)
-        self.qs = self._compute_qs(self.lengths)
-        self.es = self.qs * (self.L // self.lengths)
-        self.es = self.es.astype(np.int64)
+        lengths = [int(li) for li in lengths]
+        if any(li < 1 or li >= 2**31 for li in lengths):
+            raise ValueError("List lengths must be in [1,2^31).")
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.L = math.prod(lengths)
+        self.dtype = integer_dtype(self.L)
+        self.qs = self._compute_qs(lengths)
+        self.es = np.array(
+            [int(q) * (self.L // li) for q, li in zip(self.qs, lengths)],
+            dtype=self.dtype,
+        )
+
+        # inverses[i,j] is the inverse of lj modulo li for j < i
+        n = len(lengths)
+        self.direct = self.L * max(lengths + [n]) < INT64_UPPER
+        self.inverses = np.zeros((n, n), dtype=np.int64)
+        for i in range(n):
+            for j in range(i):
+                self.inverses[i, j] = pow(lengths[j], -1, lengths[i])
+
+        # Consecutive digits whose product of lengths fits into int64
+        self.groups = []
+        start, prod = 0, 1
+        for i, li in enumerate(lengths):
+            if prod * li > INT64_UPPER:
+                self.groups.append((start, i))
+                start, prod = i, 1
+            prod *= li
+        self.groups.append((start, n))
+
+    def digits(self, remainders: np.ndarray) -> np.ndarray:
+        """Returns the mixed-radix digits of the solutions.
+
+        Params:
+            remainders: (...,n) array of remainders
+
+        Returns:
+            digits: (...,n) int64 array of digits vi in [0,li)
+        """
+        r = np.asarray(remainders, dtype=np.int64)
+        v = np.empty(r.shape, dtype=np.int64)
+        for i, li in enumerate(self.lengths):
+            t = r[..., i] % li
+            for j in range(i):
+                # Operands are less than li < 2^31, products fit into int64
+                t = ((t - v[..., j]) % li) * self.inverses[i, j] % li
+            v[..., i] = t
+        return v
 
     def solve(self, remainders: list[int]) -> int:
         """Returns the smallest positive number solving the remainder congruences.
 
         Params:
             remainders: list of remainders, ri, such that ri = x mod li where
-                li is the i-th list length.
+                li is the i-th list length. Also accepts a (B,n) array of
+                remainders, in which case a (B,) array of solutions is returned.
+                Solutions have dtype int64, unless the period exceeds 2^63
+                (see dtype).
         """
-        # We make use of
-        #     a + b = c => a (mod N) + b (mod N) = c (mod N)
-        # to avoid having large addition terms.
-        return np.sum((remainders * self.es) % self.L) % self.L
+        if self.direct:
+            # Small periods: the terms ei*ai and their sum fit into int64.
+            # We make use of
+            #     a + b = c => a (mod N) + b (mod N) = c (mod N)
+            # to avoid having large addition terms.
+            remainders = np.asarray(remainders, dtype=np.int64)
+            return np.sum((remainders * self.es) % self.L, axis=-1) % self.L
+        v = self.digits(remainders)
+        x = None
+        for start, stop in self.groups[::-1]:
+            # Horner's scheme within a group stays below the group's product
+            g = v[..., stop - 1]
+            for i in range(stop - 2, start - 1, -1):
+                g = g * self.lengths[i] + v[..., i]
+            if x is None:
+                x = g
+            else:
+                radix = math.prod(int(li) for li in self.lengths[start:stop])
+                x = x.astype(object) * radix + g.astype(object)
+        x = np.asarray(x)
+        return x[()] if x.ndim == 0 else x
 
     def _compute_qs(self, lengths: list[int]) -> list[int]:
-        L = np.prod(lengths)
+        L = math.prod(lengths)
         qs = []
         for li in lengths:
             gcd, _, s = extended_euclid(li, L // li)
@@ -0,0 +1,118 @@
+"""Frames of 2-bit symbols packed into bytes.
+
+Pens transmit the observed window as a compact payload: the symbols of an
+(N,M) frame in row-major order, four symbols per byte. Symbol i occupies
+bits 2*(i%4) and 2*(i%4)+1 of byte i//4, the x-bit being the lower one
+(see helpers.bits_to_num). Frames are padded to whole bytes, so that a
+buffer of concatenated frames is a (F,ceil(N*M/4)) array of bytes.
+
+Decoding only requires the partial MNS sequences of both directions, i.e.
+the columns of the x-plane and the rows of the y-plane of the top-left
+(n,n) window, where n is the order of the MNS. PackedWindowTables maps
+every byte value at every byte position of a frame to the bits it
+contributes to the packed codes of these sequences. Looking up and
+combining a few bytes per frame yields the codes without unpacking the
+frame into a bitmatrix.
+"""
+
+import numpy as np
+
+
+def frame_nbytes(shape: tuple[int, int]) -> int:
+    """Returns the number of bytes of a packed (N,M) frame."""
+    return -(-int(shape[0]) * int(shape[1]) // 4)
+
+
+def pack_frames(bits: np.ndarray) -> np.ndarray:
+    """Packs a (B,N,M,2) batch of bitmatrices into (B,ceil(N*M/4)) bytes."""
+    bits = np.asarray(bits, dtype=np.uint8)
+    return np.packbits(bits.reshape(len(bits), -1), axis=-1, bitorder="little")
+
+
+def unpack_frames(frames: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """Unpacks (B,ceil(N*M/4)) bytes into a (B,N,M,2) batch of bitmatrices."""
+    N, M = int(shape[0]), int(shape[1])
+    frames = np.asarray(frames, dtype=np.uint8)
+    bits = np.unpackbits(frames, axis=-1, count=N * M * 2, bitorder="little")
+    return bits.reshape(len(frames), N, M, 2).astype(np.int8)
+
+
+def frame_view(buffer, shape: tuple[int, int]) -> np.ndarray:
+    """Views a buffer of concatenated packed frames as (F,nbytes) bytes.
+
+    Params:
+        buffer: object supporting the buffer protocol, such as bytes,
+            bytearray, memoryview, mmap or a uint8 array. Not copied.
+        shape: (N,M) frame shape
+
+    Returns:
+        frames: (F,nbytes) read-only uint8 view of the buffer
+    """
+    nbytes = frame_nbytes(shape)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) % nbytes != 0:
+        raise ValueError(
+            f"Buffer of {len(data)} bytes does not hold whole {shape} frames"
+        )
+    return data.reshape(-1, nbytes)
+
+
+class PackedWindowTables:
+    """Lookup tables from packed frame bytes to partial sequence codes."""
+
+    def __init__(self, shape: tuple[int, int], order: int) -> None:
+        """Initialize the tables.
+
+        Params:
+            shape: (N,M) frame shape. N,M need to be greater than or equal
+                to order.
+            order: order of the MNS
+        """
+        N, M = int(shape[0]), int(shape[1])
+        if min(N, M) < order:
+            raise ValueError(f"Frames of shape {shape} are smaller than {order}")
+        self.shape = (N, M)
+        self.order = order
+        # Rows of sequences packed into one int64 group code
+        self.rows_per_group = min(63 // order, order)
+        G = -(-order // self.rows_per_group)
+
+        # bit of the frame holding element k of sequence r per direction;
+        # direction 0 runs down the columns of the x-plane, direction 1
+        # along the rows of the y-plane.
+        r, k = np.meshgrid(np.arange(order), np.arange(order), indexing="ij")
+        framebit = np.stack((2 * (k * M + r), 2 * (r * M + k) + 1))  # (2,n,n)
+        self.bytes = np.unique(framebit // 8)
+
+        values = np.arange(256, dtype=np.int64)
+        tables = np.zeros((2, G, len(self.bytes), 256), dtype=np.int64)
+        for d in range(2):
+            for ri in range(order):
+                g, rg = divmod(ri, self.rows_per_group)
+                for ki in range(order):
+                    b = np.searchsorted(self.bytes, framebit[d, ri, ki] // 8)
+                    bit = (values >> (framebit[d, ri, ki] % 8)) & 1
+                    tables[d, g, b] |= bit << (order * rg + ki)
+        self.tables = tables
+
+    def row_codes(self, frames: np.ndarray) -> np.ndarray:
+        """Computes the codes of the partial sequences of packed frames.
+
+        Params:
+            frames: (F,nbytes) packed frames
+
+        Returns:
+            codes: (F,2,n) codes of the n sequences per direction. Element k
+                of a sequence is bit k of its code. Direction 0 holds the
+                columns of the x-plane, direction 1 the rows of the y-plane.
+        """
+        n, g = self.order, self.rows_per_group
+        G = self.tables.shape[1]
+        group_codes = np.zeros((len(frames), 2, G), dtype=np.int64)
+        for i, b in enumerate(self.bytes):
+            group_codes |= self.tables[:, :, i][:, :, frames[:, b]].transpose(2, 0, 1)
+
+        ri = np.arange(n)
+        shifts = n * (ri % g)
+        mask = np.int64((1 << n) - 1)
+        return (group_codes[:, :, ri // g] >> shifts) & mask
@@ -0,0 +1,345 @@
+"""Tiled preview pyramids of encoded pages.
+
+Layout tools show pages at zoom levels from the whole sheet down to single
+dots. Rendering such views from the full bitmatrix is slow for large pages.
+build_pyramid instead writes a tiled image pyramid to a directory, from
+which any viewport is assembled by loading only the tiles it intersects.
+
+The pyramid consists of
+    - level 0, the leaf level, with dot-accurate renderings of cell x cell
+      pixels per dot (see render_dots). Pixels are grayscale with 255 for
+      paper and 0 for dots.
+    - overview levels 1..K, where a pixel of level k aggregates blocks of
+      2^(k-1) x 2^(k-1) dots. Pixels hold the fraction of covered (printed)
+      dots scaled to [0,255]. Level 1 is computed from the coverage of dots,
+      every further level by summing 2x2 blocks of the level below. Level K
+      fits into a single tile.
+
+Pages are consumed strip by strip and tiles are written as soon as they are
+complete, so pages larger than memory can be processed, for example the
+strips generated by page_strips or a memory-mapped bitmatrix. Tiles without
+covered dots are not written.
+
+Example:
+    pyr = build_pyramid("preview/", page_strips(codec, (7000, 5000)))
+    img = pyr.viewport((1200, 800), (600, 900), px_per_dot=0.25)
+"""
+
+import json
+import os
+
+import numpy as np
+
+from . import helpers
+
+
+def render_dots(symbols: np.ndarray, cell: int, mask: np.ndarray = None) -> np.ndarray:
+    """Renders (H,W) symbols as grayscale image with one dot per cell.
+
+    Params:
+        symbols: (H,W) numbers in [0,3] (see helpers.bits_to_num)
+        cell: side length of a cell in pixels
+        mask: optional (H,W) boolean mask of dots to draw
+
+    Returns:
+        img: (H*cell,W*cell) uint8 image, 255 for paper and 0 for dots
+    """
+    H, W = symbols.shape
+    img = np.full((H * cell, W * cell), 255, dtype=np.uint8)
+    shift = max(cell // 6, 1)
+    off = helpers.OFFSET_LUT.astype(np.int64)[symbols] * shift
+    ys = (np.arange(H)[:, None] * cell + cell // 2 + off[..., 1]).clip(0, H * cell - 1)
+    xs = (np.arange(W)[None, :] * cell + cell // 2 + off[..., 0]).clip(0, W * cell - 1)
+    if mask is None:
+        img[ys, xs] = 0
+    else:
+        img[ys[mask], xs[mask]] = 0
+    return img
+
+
+def page_strips(
+    codec,
+    shape: tuple[int, int],
+    section: tuple[int, int] = (0, 0),
+    origin: tuple[int, int] = (0, 0),
+    strip: int = 256,
+):
+    """Yields (h,W,2) strips of consecutive rows of a page.
+
+    Params:
+        codec: codec to encode with
+        shape: (H,W) page shape
+        section: section coordinates to use
+        origin: (x,y) position of the page's top-left dot
+        strip: number of rows per strip
+    """
+    H, W = int(shape[0]), int(shape[1])
+    x0, y0 = int(origin[0]), int(origin[1])
+    for y in range(0, H, strip):
+        h = min(strip, H - y)
+        yield codec.encode_region((x0, y0 + y), (h, W), section=section)
+
+
+def _reduce(a: np.ndarray) -> np.ndarray:
+    """Sums 2x2 blocks of a (h,w) array, zero padding odd sizes."""
+    h, w = a.shape
+    a = np.pad(a, ((0, h % 2), (0, w % 2)))
+    return a.reshape(a.shape[0] // 2, 2, a.shape[1] // 2, 2).sum((1, 3))
+
+
+class _LevelWriter:
+    """Writes the rows of one overview level into tiles and forwards pairs of
+    rows to the next level."""
+
+    def __init__(self, pyramid: "PreviewPyramid", level: int, next_level) -> None:
+        self.pyramid = pyramid
+        self.level = level
+        self.next = next_level
+        self.row0 = 0  # first row held by the buffers
+        self.covered = None  # rows of covered dot counts
+        self.area = None  # rows of dot counts
+        self.pair = None  # single row waiting to be reduced
+
+    def push(self, covered: np.ndarray, area: np.ndarray) -> None:
+        if self.covered is None:
+            self.covered, self.area = covered, area
+        else:
+            self.covered = np.concatenate((self.covered, covered))
+            self.area = np.concatenate((self.area, area))
+        T = self.pyramid.tile_size
+        n = (len(self.covered) // T) * T
+        if n > 0:
+            self._write(self.covered[:n], self.area[:n])
+            self.covered, self.area = self.covered[n:], self.area[n:]
+            self.row0 += n
+
+        if self.next is not None:
+            if self.pair is not None:
+                covered = np.concatenate((self.pair[0], covered))
+                area = np.concatenate((self.pair[1], area))
+            n = (len(covered) // 2) * 2
+            self.pair = (covered[n:], area[n:]) if n < len(covered) else None
+            if n > 0:
+                self.next.push(_reduce(covered[:n]), _reduce(area[:n]))
+
+    def finish(self) -> None:
+        if self.covered is not None and len(self.covered) > 0:
+            self._write(self.covered, self.area)
+        if self.next is not None:
+            if self.pair is not None:
+                self.next.push(_reduce(self.pair[0]), _reduce(self.pair[1]))
+            self.next.finish()
+
+    def _write(self, covered: np.ndarray, area: np.ndarray) -> None:
+        T = self.pyramid.tile_size
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.where(area > 0, covered / area, 0.0)
+        img = np.rint(frac * 255).astype(np.uint8)
+        for r in range(0, len(img), T):
+            for c in range(0, img.shape[1], T):
+                if covered[r : r + T, c : c + T].any():
+                    ty, tx = (self.row0 + r) // T, c // T
+                    self.pyramid._save_tile(
+                        self.level, ty, tx, img[r : r + T, c : c + T]
+                    )
+
+
+class PreviewPyramid:
+    """Tiled image pyramid stored in a directory (see build_pyramid)."""
+
+    def __init__(self, directory: str) -> None:
+        """Opens an existing pyramid.
+
+        Params:
+            directory: directory written by build_pyramid
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "pyramid.json")) as f:
+            meta = json.load(f)
+        self._init(meta["shape"], meta["cell"], meta["tile_size"], meta["num_levels"])
+
+    def _init(self, shape, cell: int, tile_size: int, num_levels: int) -> None:
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.cell = int(cell)
+        self.tile_size = int(tile_size)
+        self.num_levels = int(num_levels)
+
+    @classmethod
+    def _create(cls, directory, shape, cell, tile_size) -> "PreviewPyramid":
+        if tile_size % cell != 0:
+            raise ValueError("Tile size must be a multiple of the cell size.")
+        H, W = int(shape[0]), int(shape[1])
+        num_levels = 2
+        while max(H, W) > tile_size * 2 ** (num_levels - 2):
+            num_levels += 1
+        pyr = cls.__new__(cls)
+        pyr.directory = directory
+        pyr._init((H, W), cell, tile_size, num_levels)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "pyramid.json"), "w") as f:
+            json.dump(
+                {
+                    "shape": [H, W],
+                    "cell": cell,
+                    "tile_size": tile_size,
+                    "num_levels": num_levels,
+                },
+                f,
+            )
+        return pyr
+
+    def px_per_dot(self, level: int) -> float:
+        """Returns the number of pixels per dot of a level."""
+        if level == 0:
+            return float(self.cell)
+        return 1.0 / 2 ** (level - 1)
+
+    def level_shape(self, level: int) -> tuple[int, int]:
+        """Returns the (h,w) shape of a level in pixels."""
+        H, W = self.shape
+        if level == 0:
+            return (H * self.cell, W * self.cell)
+        d = 2 ** (level - 1)
+        return (-(-H // d), -(-W // d))
+
+    def level_for(self, px_per_dot: float) -> int:
+        """Returns the coarsest level resolving at least px_per_dot."""
+        if px_per_dot > 1:
+            return 0
+        k = 1 + int(np.floor(np.log2(1.0 / px_per_dot) + 1e-9))
+        return min(k, self.num_levels - 1)
+
+    def _tile_path(self, level: int, ty: int, tx: int) -> str:
+        return os.path.join(self.directory, str(level), f"{ty}_{tx}.npy")
+
+    def _save_tile(self, level: int, ty: int, tx: int, img: np.ndarray) -> None:
+        path = self._tile_path(level, ty, tx)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, img)
+
+    def tile(self, level: int, ty: int, tx: int) -> np.ndarray:
+        """Returns a tile of a level. Missing tiles are blank."""
+        path = self._tile_path(level, ty, tx)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+        h, w = self.level_shape(level)
+        T = self.tile_size
+        shape = (min(T, h - ty * T), min(T, w - tx * T))
+        return np.full(shape, 255 if level == 0 else 0, dtype=np.uint8)
+
+    def viewport(
+        self,
+        origin: tuple[int, int],
+        shape: tuple[int, int],
+        level: int = None,
+        px_per_dot: float = None,
+    ) -> np.ndarray:
+        """Assembles the image of a rectangle of the page.
+
+        Params:
+            origin: (x,y) top-left dot of the viewport
+            shape: (h,w) size of the viewport in dots
+            level: level to read from. Chosen by px_per_dot if not given.
+            px_per_dot: requested resolution (see level_for). Defaults to the
+                leaf level.
+
+        Returns:
+            img: uint8 image of the viewport at the resolution of the level
+        """
+        if level is None:
+            level = 0 if px_per_dot is None else self.level_for(px_per_dot)
+        s = self.px_per_dot(level)
+        H, W = self.level_shape(level)
+        x0, y0 = int(origin[0]), int(origin[1])
+        r0, c0 = int(np.floor(y0 * s)), int(np.floor(x0 * s))
+        r1 = min(int(np.ceil((y0 + shape[0]) * s)), H)
+        c1 = min(int(np.ceil((x0 + shape[1]) * s)), W)
+        r0, c0 = max(r0, 0), max(c0, 0)
+        img = np.empty((max(r1 - r0, 0), max(c1 - c0, 0)), dtype=np.uint8)
+        T = self.tile_size
+        for ty in range(r0 // T, -(-r1 // T)):
+            for tx in range(c0 // T, -(-c1 // T)):
+                t = self.tile(level, ty, tx)
+                ys = slice(max(r0 - ty * T, 0), min(r1 - ty * T, t.shape[0]))
+                xs = slice(max(c0 - tx * T, 0), min(c1 - tx * T, t.shape[1]))
+                img[
+                    ty * T + ys.start - r0 : ty * T + ys.stop - r0,
+                    tx * T + xs.start - c0 : tx * T + xs.stop - c0,
+                ] = t[ys, xs]
+        return img
+
+
+def build_pyramid(
+    directory: str,
+    source,
+    shape: tuple[int, int] = None,
+    mask: np.ndarray = None,
+    cell: int = 8,
+    tile_size: int = 256,
+) -> PreviewPyramid:
+    """Writes the preview pyramid of a page.
+
+    Params:
+        directory: output directory. Existing tiles are overwritten.
+        source: (H,W,2) bitmatrix of the page, possibly memory-mapped, or an
+            iterable of strips of consecutive rows. Strips are (h,W,2)
+            bitmatrices or tuples of a bitmatrix and its (h,W) coverage mask.
+        shape: (H,W) page shape. Required for iterables of strips.
+        mask: optional (H,W) coverage mask of a bitmatrix source. Dots not
+            covered are not rendered.
+        cell: side length of a dot's cell in pixels at the leaf level
+        tile_size: side length of tiles in pixels. Multiple of cell.
+
+    Returns:
+        pyramid: the written pyramid
+    """
+    if isinstance(source, np.ndarray):
+        page, shape, rows = source, source.shape[:2], 256
+        source = (
+            (page[y : y + rows], None if mask is None else mask[y : y + rows])
+            for y in range(0, shape[0], rows)
+        )
+    elif shape is None:
+        raise ValueError("Shape is required for strip sources.")
+
+    pyr = PreviewPyramid._create(directory, shape, cell, tile_size)
+    H, W = pyr.shape
+    writer = None
+    for level in range(pyr.num_levels - 1, 0, -1):
+        writer = _LevelWriter(pyr, level, writer)
+
+    D = tile_size // cell  # dots per leaf tile
+    pending_sym, pending_mask = [], []
+    leaf_row = 0  # first dot row of pending leaf tiles
+
+    def write_leaves(symbols, cov):
+        for c in range(0, W, D):
+            m = cov[:, c : c + D]
+            if m.any():
+                img = render_dots(symbols[:, c : c + D], cell, m)
+                pyr._save_tile(0, leaf_row // D, c // D, img)
+
+    for strip in source:
+        bits, smask = strip if isinstance(strip, tuple) else (strip, None)
+        bits = np.asarray(bits)
+        cov = (
+            np.ones(bits.shape[:2], dtype=bool)
+            if smask is None
+            else np.asarray(smask, dtype=bool)
+        )
+        writer.push(cov.astype(np.int64), np.ones(cov.shape, dtype=np.int64))
+
+        pending_sym.append(helpers.bits_to_num(bits))
+        pending_mask.append(cov)
+        symbols, cov = np.concatenate(pending_sym), np.concatenate(pending_mask)
+        n = (len(symbols) // D) * D
+        for r in range(0, n, D):
+            write_leaves(symbols[r : r + D], cov[r : r + D])
+            leaf_row += D
+        pending_sym, pending_mask = [symbols[n:]], [cov[n:]]
+
+    symbols, cov = np.concatenate(pending_sym), np.concatenate(pending_mask)
+    if len(symbols) > 0:
+        write_leaves(symbols, cov)
+    writer.finish()
+    return pyr
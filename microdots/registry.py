@@ -0,0 +1,357 @@
+"""Registry of documents printed onto regions of the Anoto space.
+
+Each printed page occupies a rectangular region of position coordinates
+within one section. The registry hands out non-overlapping regions,
+persists them and maps decoded (section, position) samples back to the
+owning document, page and page-local coordinates.
+
+Lookups are answered by a uniform grid index over all sections: each
+region is registered in every grid cell it overlaps, and queries are
+resolved by locating the query's cell and testing its (few) candidate
+regions. All steps are vectorized over the batch of queries.
+
+Example:
+    reg = DocumentRegistry.for_codec(defaults.anoto_6x6_a4_fixed)
+    reg.allocate(doc_id=42, shape=(990, 700), pages=2)
+    xy, _ = codec.decode_positions(windows)
+    uv, _ = codec.decode_sections(windows, xy)
+    doc, page, local = reg.lookup(uv, xy)
+"""
+
+import json
+
+import numpy as np
+
+REGION_DTYPE = np.dtype(
+    [
+        ("doc", np.int64),
+        ("page", np.int32),
+        ("u", np.int32),
+        ("v", np.int32),
+        ("x0", np.int64),
+        ("y0", np.int64),
+        ("x1", np.int64),
+        ("y1", np.int64),
+    ]
+)
+
+
+class DocumentRegistry:
+    """Allocates regions to document pages and resolves decoded samples.
+
+    Regions are half-open rectangles [x0,x1)x[y0,y1) of position coordinates
+    within section (u,v). New regions are placed by a shelf allocator that
+    fills the position space of a section row by row before moving on to
+    the next section.
+    """
+
+    def __init__(
+        self,
+        extent: tuple[int, int],
+        num_sections: tuple[int, int],
+        cell_size: int = None,
+        spacing: int = 0,
+    ) -> None:
+        """Initialize an empty registry.
+
+        Params:
+            extent: (W,H) usable position space per section
+            num_sections: number of distinct section coordinates (U,V)
+            cell_size: side length of grid cells of the lookup index. If not
+                given, the median region size is used when the index is built.
+                Cells have to be large enough for the number of grid cells of
+                all sections to fit into int64 keys.
+            spacing: number of unused positions left between allocated regions
+        """
+        self.extent = (int(extent[0]), int(extent[1]))
+        self.num_sections = (int(num_sections[0]), int(num_sections[1]))
+        if cell_size is not None and self._num_cells(int(cell_size)) >= 2**63:
+            raise ValueError(
+                f"Cell size {cell_size} yields too many grid cells for int64 keys."
+            )
+        self.cell_size = cell_size
+        self.spacing = int(spacing)
+        self._regions = np.zeros(16, dtype=REGION_DTYPE)
+        self._size = 0
+        self._reserved = []  # indices of regions added explicitly
+        # Shelf allocator state: section index, cursor x, shelf y, shelf height
+        self._cursor = [0, 0, 0, 0]
+        self._index = None
+
+    @classmethod
+    def for_codec(cls, codec, **kwargs) -> "DocumentRegistry":
+        """Creates a registry spanning the full address space of a codec."""
+        L = int(codec.crt.L)
+        return cls((L, L), (codec.mns_length, codec.mns_length), **kwargs)
+
+    @property
+    def regions(self) -> np.ndarray:
+        """Structured array of all regions (see REGION_DTYPE)."""
+        return self._regions[: self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(
+        self,
+        doc: int,
+        section: tuple[int, int],
+        origin: tuple[int, int],
+        shape: tuple[int, int],
+        page: int = 0,
+    ) -> int:
+        """Registers an explicitly placed region.
+
+        Params:
+            doc: document id
+            section: (u,v) section coordinates
+            origin: (x,y) position of the top-left corner
+            shape: (H,W) size of the region in dots
+            page: page number within the document
+
+        Returns:
+            idx: index of the region
+
+        Raises:
+            ValueError: if the region leaves the extent or overlaps a
+                registered region.
+        """
+        x0, y0 = int(origin[0]), int(origin[1])
+        x1, y1 = x0 + int(shape[1]), y0 + int(shape[0])
+        if x0 < 0 or y0 < 0 or x1 > self.extent[0] or y1 > self.extent[1]:
+            raise ValueError("Region exceeds the position space of a section.")
+        if self._overlaps(np.arange(self._size), section, x0, y0, x1, y1) is not None:
+            raise ValueError("Region overlaps a registered region.")
+        idx = self._append(doc, page, section, x0, y0, x1, y1)
+        self._reserved.append(idx)
+        return idx
+
+    def allocate(self, doc: int, shape: tuple[int, int], pages: int = 1) -> list[int]:
+        """Allocates non-overlapping regions for the pages of a document.
+
+        Params:
+            doc: document id
+            shape: (H,W) size of each page in dots
+            pages: number of pages
+
+        Returns:
+            indices: region index of each page
+        """
+        h, w = int(shape[0]), int(shape[1])
+        W, H = self.extent
+        if w > W or h > H:
+            raise ValueError("Page shape exceeds the position space of a section.")
+        U, V = self.num_sections
+        reserved = np.array(self._reserved, dtype=np.int64)
+        indices = []
+        for page in range(pages):
+            while True:
+                sec, x, y, shelf = self._cursor
+                if sec >= U * V:
+                    raise ValueError("Registry is out of sections.")
+                if x + w > W:
+                    # Start a new shelf
+                    self._cursor = [sec, 0, y + shelf + self.spacing, 0]
+                    continue
+                if y + h > H:
+                    # Start a new section
+                    self._cursor = [sec + 1, 0, 0, 0]
+                    continue
+                section = (sec // V, sec % V)
+                blocker = self._overlaps(reserved, section, x, y, x + w, y + h)
+                if blocker is not None:
+                    self._cursor = [sec, blocker + self.spacing, y, max(shelf, h)]
+                    continue
+                break
+            indices.append(self._append(doc, page, section, x, y, x + w, y + h))
+            self._cursor = [sec, x + w + self.spacing, y, max(shelf, h)]
+        return indices
+
+    def _append(self, doc, page, section, x0, y0, x1, y1) -> int:
+        if self._size == len(self._regions):
+            self._regions = np.resize(self._regions, 2 * len(self._regions))
+        self._regions[self._size] = (doc, page, section[0], section[1], x0, y0, x1, y1)
+        self._size += 1
+        self._index = None
+        return self._size - 1
+
+    def _overlaps(self, candidates, section, x0, y0, x1, y1) -> int:
+        """Returns the largest x1 of candidates overlapping the rectangle
+        or None if there is no overlap."""
+        if len(candidates) == 0:
+            return None
+        r = self._regions[candidates]
+        hit = (
+            (r["u"] == section[0])
+            & (r["v"] == section[1])
+            & (r["x0"] < x1)
+            & (r["x1"] > x0)
+            & (r["y0"] < y1)
+            & (r["y1"] > y0)
+        )
+        if not hit.any():
+            return None
+        return int(r["x1"][hit].max())
+
+    def _num_cells(self, cell: int) -> int:
+        """Returns the number of grid cells over all sections."""
+        U, V = self.num_sections
+        return U * V * -(-self.extent[0] // cell) * -(-self.extent[1] // cell)
+
+    def _build_index(self):
+        r = self.regions
+        cell = self.cell_size
+        if cell is None:
+            if len(r) == 0:
+                cell = 1024
+            else:
+                cell = int(np.median(np.maximum(r["x1"] - r["x0"], r["y1"] - r["y0"])))
+        cell = max(int(cell), 1)
+        while self._num_cells(cell) >= 2**63:
+            # Coarsen the grid until keys fit into int64
+            cell *= 2
+        ncx = -(-self.extent[0] // cell)
+        ncy = -(-self.extent[1] // cell)
+
+        cx0, cx1 = r["x0"] // cell, (r["x1"] - 1) // cell
+        cy0, cy1 = r["y0"] // cell, (r["y1"] - 1) // cell
+        nx = cx1 - cx0 + 1
+        ny = cy1 - cy0 + 1
+        counts = nx * ny
+
+        # Expand each region into the cells it covers
+        ridx = np.repeat(np.arange(len(r)), counts)
+        offs = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = cx0[ridx] + offs % nx[ridx]
+        cy = cy0[ridx] + offs // nx[ridx]
+        sec = r["u"][ridx].astype(np.int64) * self.num_sections[1] + r["v"][ridx]
+        keys = (sec * ncy + cy) * ncx + cx
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        ukeys, starts, bucket = np.unique(keys, return_index=True, return_counts=True)
+        self._index = {
+            "cell": cell,
+            "ncx": ncx,
+            "ncy": ncy,
+            "keys": ukeys,
+            "starts": starts,
+            "counts": bucket,
+            "regions": ridx[order],
+            "max_bucket": int(bucket.max(initial=0)),
+        }
+
+    def lookup(
+        self, sections: np.ndarray, xy: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Maps decoded samples to documents, pages and local coordinates.
+
+        Params:
+            sections: (N,2) section coordinates (u,v) of each sample
+            xy: (N,2) position coordinates (x,y) of each sample
+
+        Returns:
+            docs: (N,) document ids. -1 if the sample hits no region.
+            pages: (N,) page numbers. -1 if the sample hits no region.
+            local: (N,2) coordinates relative to the page's top-left corner.
+                -1 if the sample hits no region.
+        """
+        if self._index is None:
+            self._build_index()
+        idx = self._index
+        sections = np.asarray(sections, dtype=np.int64).reshape(-1, 2)
+        xy = np.asarray(xy, dtype=np.int64).reshape(-1, 2)
+        N = len(xy)
+        cell = idx["cell"]
+
+        valid = (
+            (xy >= 0).all(-1)
+            & (xy[:, 0] < self.extent[0])
+            & (xy[:, 1] < self.extent[1])
+            & (sections >= 0).all(-1)
+            & (sections[:, 0] < self.num_sections[0])
+            & (sections[:, 1] < self.num_sections[1])
+        )
+        sec = sections[:, 0] * self.num_sections[1] + sections[:, 1]
+        keys = (sec * idx["ncy"] + xy[:, 1] // cell) * idx["ncx"] + xy[:, 0] // cell
+        k = np.searchsorted(idx["keys"], keys)
+        k = np.minimum(k, max(len(idx["keys"]) - 1, 0))
+        if len(idx["keys"]) > 0:
+            found = valid & (idx["keys"][k] == keys)
+        else:
+            found = np.zeros(N, dtype=bool)
+
+        hit = np.full(N, -1, dtype=np.int64)
+        r = self.regions
+        for j in range(idx["max_bucket"]):
+            todo = np.flatnonzero(found & (hit < 0) & (idx["counts"][k] > j))
+            if len(todo) == 0:
+                break
+            cand = idx["regions"][idx["starts"][k[todo]] + j]
+            c = r[cand]
+            p = xy[todo]
+            inside = (
+                (p[:, 0] >= c["x0"])
+                & (p[:, 0] < c["x1"])
+                & (p[:, 1] >= c["y0"])
+                & (p[:, 1] < c["y1"])
+            )
+            hit[todo[inside]] = cand[inside]
+
+        ok = hit >= 0
+        c = r[np.where(ok, hit, 0)] if len(r) > 0 else np.zeros(N, dtype=REGION_DTYPE)
+        docs = np.where(ok, c["doc"], -1)
+        pages = np.where(ok, c["page"], -1)
+        local = np.stack((xy[:, 0] - c["x0"], xy[:, 1] - c["y0"]), -1)
+        local[~ok] = -1
+        return docs, pages, local
+
+    def locate(self, codec, bits: np.ndarray):
+        """Decodes a batch of windows and resolves them to documents.
+
+        Params:
+            codec: codec the pattern was encoded with
+            bits: (B,N,M,2) batch of observed bits
+
+        Returns:
+            docs, pages, local: see lookup
+        """
+        xy, _ = codec.decode_positions(bits)
+        uv, _ = codec.decode_sections(bits, xy)
+        return self.lookup(uv, xy)
+
+    def save(self, path: str) -> None:
+        """Stores the registry in a .npz file."""
+        state = {
+            "extent": self.extent,
+            "num_sections": self.num_sections,
+            "cell_size": self.cell_size,
+            "spacing": self.spacing,
+            "cursor": [int(c) for c in self._cursor],
+        }
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                regions=self.regions,
+                reserved=np.array(self._reserved, dtype=np.int64),
+                state=json.dumps(state),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "DocumentRegistry":
+        """Loads a registry stored by save."""
+        with np.load(path) as data:
+            state = json.loads(str(data["state"]))
+            reg = cls(
+                state["extent"],
+                state["num_sections"],
+                cell_size=state["cell_size"],
+                spacing=state["spacing"],
+            )
+            regions = data["regions"]
+            reg._regions = np.zeros(max(16, len(regions)), dtype=REGION_DTYPE)
+            reg._regions[: len(regions)] = regions
+            reg._size = len(regions)
+            reg._reserved = [int(i) for i in data["reserved"]]
+            reg._cursor = state["cursor"]
+        return reg
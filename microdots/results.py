@@ -0,0 +1,187 @@
+"""Columnar storage of batch decoding results.
+
+Batch decoding (AnotoCodec.decode_batch) writes its outcome into the
+columns of a NumPy structured array, so that no per-window Python
+objects are created. Such arrays can be exported to .npy without
+conversion and be memory-mapped back for analytics.
+
+For long-running captures, ResultWriter appends results to a directory
+of chunk files. Decoding can write directly into the writer's buffer:
+
+    with ResultWriter("captures/") as writer:
+        for bits in stream:
+            rows = codec.decode_batch(bits, out=writer.reserve(len(bits)))
+            rows["timestamp"] = time.time()
+
+    chunks = load_results("captures/")
+"""
+
+import os
+import re
+
+import numpy as np
+
+"""Columns filled by decoding."""
+RESULT_FIELDS = (
+    ("x", np.int64),
+    ("y", np.int64),
+    ("u", np.int32),
+    ("v", np.int32),
+    ("rotation", np.int8),
+    ("status", np.uint8),
+)
+
+
+def result_dtype(
+    timestamp: bool = False, device: bool = False, position_dtype=np.int64
+) -> np.dtype:
+    """Returns the structured dtype of decoding results.
+
+    Params:
+        timestamp: add a float64 'timestamp' column
+        device: add a uint32 'device' column
+        position_dtype: dtype of the 'x' and 'y' columns. Codecs whose
+            positions exceed int64 decode into object columns (see
+            integer.CRT), which cannot be memory-mapped.
+    """
+    fields = [
+        (name, position_dtype if name in ("x", "y") else dtype)
+        for name, dtype in RESULT_FIELDS
+    ]
+    if timestamp:
+        fields.append(("timestamp", np.float64))
+    if device:
+        fields.append(("device", np.uint32))
+    return np.dtype(fields)
+
+
+def empty_results(
+    n: int, timestamp: bool = False, device: bool = False, position_dtype=np.int64
+) -> np.ndarray:
+    """Allocates n result rows. Coordinates and rotations are set to -1."""
+    res = np.zeros(
+        n,
+        dtype=result_dtype(
+            timestamp=timestamp, device=device, position_dtype=position_dtype
+        ),
+    )
+    for name in ("x", "y", "u", "v", "rotation"):
+        res[name] = -1
+    return res
+
+
+class ResultWriter:
+    """Appends decoding results to a directory of .npy chunk files.
+
+    Rows are collected in a buffer of chunk_size rows that is written to
+    '<prefix>-<index>.npy' once full or when the writer is flushed. Chunk
+    files are never modified after being written; reopening a directory
+    continues numbering after the last existing chunk.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        dtype: np.dtype = None,
+        chunk_size: int = 2**20,
+        prefix: str = "results",
+    ) -> None:
+        """Initialize the writer.
+
+        Params:
+            directory: directory to store chunks in. Created if missing.
+            dtype: structured dtype of rows. Defaults to result_dtype().
+            chunk_size: maximum number of rows per chunk
+            prefix: file name prefix of chunks
+        """
+        self.directory = directory
+        self.dtype = np.dtype(dtype) if dtype is not None else result_dtype()
+        self.chunk_size = int(chunk_size)
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        existing = _chunk_files(directory, prefix)
+        self.next_index = existing[-1][0] + 1 if existing else 0
+        self._buffer = np.empty(self.chunk_size, dtype=self.dtype)
+        self._size = 0
+
+    def reserve(self, n: int) -> np.ndarray:
+        """Returns a view of the next n rows of the buffer.
+
+        The rows count as appended and are written with the next chunk.
+        Rows are initialized as in empty_results.
+
+        The view aliases the buffer and is only valid until the next call of
+        reserve, append or flush. Afterwards its rows may already be written
+        and reused for other rows, so fill the view before reserving more.
+        Use append to hand over rows that are kept elsewhere.
+
+        More than chunk_size rows are reserved in a buffer of their own, which
+        is written in chunks of chunk_size rows.
+        """
+        if self._size + n > len(self._buffer):
+            self.flush()
+        if n > len(self._buffer):
+            self._buffer = np.empty(n, dtype=self.dtype)
+        rows = self._buffer[self._size : self._size + n]
+        rows[...] = 0
+        for name in ("x", "y", "u", "v", "rotation"):
+            if name in self.dtype.names:
+                rows[name] = -1
+        self._size += n
+        return rows
+
+    def append(self, rows: np.ndarray) -> None:
+        """Copies rows of a matching structured array into the buffer."""
+        rows = np.asarray(rows)
+        for start in range(0, len(rows), self.chunk_size):
+            part = rows[start : start + self.chunk_size]
+            self.reserve(len(part))[...] = part
+
+    def flush(self) -> None:
+        """Writes buffered rows to new chunk files."""
+        for start in range(0, self._size, self.chunk_size):
+            stop = min(start + self.chunk_size, self._size)
+            path = os.path.join(
+                self.directory, f"{self.prefix}-{self.next_index:06d}.npy"
+            )
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, self._buffer[start:stop])
+            os.replace(tmp, path)
+            self.next_index += 1
+        self._size = 0
+        if len(self._buffer) > self.chunk_size:
+            self._buffer = np.empty(self.chunk_size, dtype=self.dtype)
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _chunk_files(directory: str, prefix: str) -> list[tuple[int, str]]:
+    pattern = re.compile(re.escape(prefix) + r"-(\d+)\.npy$")
+    files = []
+    for name in os.listdir(directory):
+        m = pattern.match(name)
+        if m:
+            files.append((int(m.group(1)), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def load_results(
+    directory: str, prefix: str = "results", mmap_mode: str = "r"
+) -> list[np.ndarray]:
+    """Returns the chunks written by ResultWriter in order.
+
+    Chunks are memory-mapped unless mmap_mode is None. Use
+    np.concatenate to obtain a single array.
+    """
+    return [
+        np.load(path, mmap_mode=mmap_mode)
+        for _, path in _chunk_files(directory, prefix)
+    ]
@@ -0,0 +1,159 @@
+"""Patterns covering only parts of a page.
+
+Layouts that print the pattern in writing areas only do not need the
+dense (H,W,2) bitmatrix of the page. AnotoCodec.encode_sparse encodes
+only the tiles of a page that intersect the covered area, and within
+each tile only the bounding box of covered dots. The result is a
+SparsePattern, which can be converted to a dense masked page or to
+coordinate/symbol lists.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from . import helpers
+
+
+class SparseTile(NamedTuple):
+    """Encoded part of a tile.
+
+    Attributes:
+        origin: (x,y) page coordinates of the top-left dot of bits
+        bits: (h,w,2) bitmatrix of the bounding box of covered dots
+        mask: (h,w) boolean coverage or None if all dots are covered
+    """
+
+    origin: tuple[int, int]
+    bits: np.ndarray
+    mask: np.ndarray
+
+
+class SparsePattern:
+    """Collection of encoded tiles of a page, keyed by tile (row,column)."""
+
+    def __init__(self, shape: tuple[int, int], tile_size: int) -> None:
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.tile_size = int(tile_size)
+        self.tiles: dict[tuple[int, int], SparseTile] = {}
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    @property
+    def num_dots(self) -> int:
+        """Number of covered dots."""
+        return sum(
+            t.bits.shape[0] * t.bits.shape[1] if t.mask is None else int(t.mask.sum())
+            for t in self.tiles.values()
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            t.bits.nbytes + (0 if t.mask is None else t.mask.nbytes)
+            for t in self.tiles.values()
+        )
+
+    def to_dense(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the (H,W,2) bitmatrix of the page and its (H,W) coverage.
+
+        Bits of uncovered dots are zero.
+        """
+        bits = np.zeros(self.shape + (2,), dtype=np.int8)
+        mask = np.zeros(self.shape, dtype=bool)
+        for t in self.tiles.values():
+            x, y = t.origin
+            h, w = t.bits.shape[:2]
+            m = np.ones((h, w), dtype=bool) if t.mask is None else t.mask
+            bits[y : y + h, x : x + w][m] = t.bits[m]
+            mask[y : y + h, x : x + w] |= m
+        return bits, mask
+
+    def coordinates(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the covered dots as coordinate/symbol lists.
+
+        Returns:
+            xy: (N,2) page coordinates (x,y) of covered dots in tile order
+            symbols: (N,) symbols in [0,3] (see helpers.bits_to_num)
+        """
+        xys, symbols = [], []
+        for t in self.tiles.values():
+            h, w = t.bits.shape[:2]
+            m = np.ones((h, w), dtype=bool) if t.mask is None else t.mask
+            ys, xs = np.nonzero(m)
+            xys.append(np.stack((xs + t.origin[0], ys + t.origin[1]), -1))
+            symbols.append(helpers.bits_to_num(t.bits[ys, xs]))
+        if len(xys) == 0:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.uint8)
+        return np.concatenate(xys).astype(np.int64), np.concatenate(symbols)
+
+
+def coverage_tiles(
+    shape: tuple[int, int],
+    tile_size: int,
+    regions: np.ndarray = None,
+    mask: np.ndarray = None,
+):
+    """Yields the coverage of every tile intersecting regions or mask.
+
+    Params:
+        shape: (H,W) page shape
+        tile_size: side length of tiles
+        regions: optional (R,4) half-open rectangles (x0,y0,x1,y1) in page
+            coordinates
+        mask: optional (MH,MW) coarse boolean mask. Each cell covers a block
+            of ceil(H/MH) x ceil(W/MW) dots.
+
+    Yields:
+        key: (row,column) of the tile
+        origin: (x,y) of the tile's top-left dot
+        coverage: (h,w) boolean coverage of the tile's dots
+    """
+    H, W = shape
+    T = tile_size
+    TY, TX = -(-H // T), -(-W // T)
+    touched = np.zeros((TY, TX), dtype=bool)
+
+    if regions is not None:
+        regions = np.asarray(regions, dtype=np.int64).reshape(-1, 4)
+        regions = np.stack(
+            (
+                regions[:, 0].clip(0, W),
+                regions[:, 1].clip(0, H),
+                regions[:, 2].clip(0, W),
+                regions[:, 3].clip(0, H),
+            ),
+            -1,
+        )
+        nonempty = (regions[:, 2] > regions[:, 0]) & (regions[:, 3] > regions[:, 1])
+        regions = regions[nonempty]
+        for x0, y0, x1, y1 in regions:
+            touched[y0 // T : (y1 - 1) // T + 1, x0 // T : (x1 - 1) // T + 1] = True
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        ch, cw = -(-H // mask.shape[0]), -(-W // mask.shape[1])
+        cy, cx = np.nonzero(mask)
+        for y0, y1, x0, x1 in zip(cy * ch, (cy + 1) * ch, cx * cw, (cx + 1) * cw):
+            y1, x1 = min(y1, H), min(x1, W)
+            if y1 > y0 and x1 > x0:
+                touched[y0 // T : (y1 - 1) // T + 1, x0 // T : (x1 - 1) // T + 1] = True
+
+    for ty, tx in zip(*np.nonzero(touched)):
+        x0, y0 = int(tx) * T, int(ty) * T
+        x1, y1 = min(x0 + T, W), min(y0 + T, H)
+        cov = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        if regions is not None:
+            hit = (
+                (regions[:, 0] < x1)
+                & (regions[:, 2] > x0)
+                & (regions[:, 1] < y1)
+                & (regions[:, 3] > y0)
+            )
+            for rx0, ry0, rx1, ry1 in regions[hit]:
+                cov[max(ry0 - y0, 0) : ry1 - y0, max(rx0 - x0, 0) : rx1 - x0] = True
+        if mask is not None:
+            ys = np.arange(y0, y1) // ch
+            xs = np.arange(x0, x1) // cw
+            cov |= mask[ys[:, None], xs[None, :]]
+        yield (int(ty), int(tx)), (x0, y0), cov
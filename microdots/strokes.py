@@ -0,0 +1,216 @@
+"""Assembly of decoding results into pen strokes.
+
+A pen streams frames only while it touches the paper. Decoding these
+frames (see AnotoCodec.decode_batch) gives a position and section per
+frame, some of which failed or, rarely, decoded to a wrong location.
+assemble_strokes turns the results of many pens into stroke polylines in
+global coordinates by
+
+    1. mapping section coordinates to the offset of their page on a
+       global canvas (see SectionLayout),
+    2. splitting each pen's frames into pen-down segments at pauses in
+       the frame stream,
+    3. rejecting short runs of samples that jump implausibly fast away
+       from the rest of their segment, while the samples around them
+       connect,
+    4. interpolating failed or rejected frames that lie between two good
+       samples of the same stroke, and
+    5. splitting strokes at remaining jumps and gaps too long to fill.
+
+All steps operate on whole arrays sorted by pen and time, so that the
+cost per sample does not depend on the number of pens or strokes.
+
+Example:
+    rows = codec.decode_batch(bits, rotation=True)
+    samples = assemble_strokes(rows, t, pen, layout=sheet.layout())
+    polylines = split_strokes(samples)
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .codec import DecodeStatus
+
+"""Samples of assembled strokes sorted by stroke and time. Positions are
+global dots, time in seconds and frame indexes the input results."""
+ASSEMBLED_DTYPE = np.dtype(
+    [
+        ("pen", np.int32),
+        ("stroke", np.int32),
+        ("t", np.float64),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("rotation", np.int8),
+        ("interpolated", np.bool_),
+        ("frame", np.int64),
+    ]
+)
+
+
+class SectionLayout(NamedTuple):
+    """Placement of sections on a global canvas.
+
+    Attributes:
+        sections: (K,2) section coordinates (u,v)
+        offsets: (K,2) global (x,y) of the top-left dot of each section
+    """
+
+    sections: np.ndarray
+    offsets: np.ndarray
+
+    def lookup(self, uv: np.ndarray) -> np.ndarray:
+        """Returns the (N,) layout indices of (N,2) sections or -1."""
+        keys = _section_keys(self.sections)
+        q = _section_keys(uv)
+        if len(keys) == 0:
+            return np.full(len(q), -1, dtype=np.int64)
+        order = np.argsort(keys)
+        idx = np.minimum(np.searchsorted(keys[order], q), len(keys) - 1)
+        return np.where(keys[order][idx] == q, order[idx], -1)
+
+
+def _section_keys(uv: np.ndarray) -> np.ndarray:
+    uv = np.asarray(uv, dtype=np.int64).reshape(-1, 2)
+    return (uv[:, 0] << 32) | (uv[:, 1] & 0xFFFFFFFF)
+
+
+def assemble_strokes(
+    results: np.ndarray,
+    t: np.ndarray,
+    pen: np.ndarray = None,
+    layout: SectionLayout = None,
+    max_gap: float = 0.05,
+    max_speed: float = 2000.0,
+    max_outlier_run: int = 3,
+    max_fill: float = 0.1,
+    min_samples: int = 2,
+) -> np.ndarray:
+    """Assembles decoded frames into strokes.
+
+    Params:
+        results: (N,) decoding results with columns x, y, u, v, rotation and
+            status (see results.result_dtype)
+        t: (N,) capture time of frames in seconds
+        pen: (N,) pen of frames. Defaults to a single pen.
+        layout: global placement of sections. Frames of sections not in the
+            layout are treated as failed. Without a layout, positions are
+            used as is and a change of section splits strokes.
+        max_gap: pauses between consecutive frames of a pen longer than this
+            (in seconds) separate strokes
+        max_speed: maximum plausible pen speed in dots per second
+        max_outlier_run: runs of at most this many samples that are reached
+            or left by a jump faster than max_speed are rejected, if the
+            samples around them connect without the run or if the run is
+            shorter than its neighbouring runs
+        max_fill: failed or rejected frames are interpolated if the good
+            samples around them are at most this many seconds apart.
+            Otherwise the stroke is split.
+        min_samples: strokes with fewer samples are discarded
+
+    Returns:
+        samples: structured array of ASSEMBLED_DTYPE
+    """
+    N = len(t)
+    t = np.asarray(t, dtype=np.float64)
+    pen = np.zeros(N, dtype=np.int64) if pen is None else np.asarray(pen)
+    order = np.lexsort((t, pen))
+    t, pen = t[order], pen[order]
+    x = np.asarray(results["x"])[order].astype(np.float64)
+    y = np.asarray(results["y"])[order].astype(np.float64)
+    uv = np.stack((results["u"], results["v"]), -1)[order]
+    rotation = np.asarray(results["rotation"])[order]
+    valid = np.asarray(results["status"])[order] == DecodeStatus.OK
+
+    if layout is not None:
+        idx = layout.lookup(uv)
+        valid &= idx >= 0
+        offsets = np.asarray(layout.offsets, dtype=np.float64)
+        x += np.where(idx >= 0, offsets[idx, 0], 0)
+        y += np.where(idx >= 0, offsets[idx, 1], 0)
+        region = np.zeros(N, dtype=np.int64)
+    else:
+        region = _section_keys(uv)
+
+    def jumps(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Flags samples a[k],b[k] that cannot be connected."""
+        dist = np.hypot(x[b] - x[a], y[b] - y[a])
+        return (dist > max_speed * (t[b] - t[a])) | (region[a] != region[b])
+
+    # Pen-down segments from the timing of all frames
+    newseg = np.ones(N, dtype=bool)
+    newseg[1:] = (pen[1:] != pen[:-1]) | (np.diff(t) > max_gap)
+    seg = np.cumsum(newseg) - 1
+
+    # Runs of valid samples connected at plausible speeds
+    vi = np.flatnonzero(valid)
+    sameseg = seg[vi[1:]] == seg[vi[:-1]]
+    jump = sameseg & jumps(vi[:-1], vi[1:])
+    run = np.cumsum(np.r_[True, ~sameseg | jump][: len(vi)]) - 1
+    num_runs = run[-1] + 1 if len(run) > 0 else 0
+
+    # A short run is rejected if it is reached or left by a jump and either
+    # its neighbouring runs connect plausibly without it, or it is shorter
+    # than each neighbouring run of its segment.
+    length = np.bincount(run, minlength=num_runs)
+    first = np.flatnonzero(np.r_[True, np.diff(run) > 0][: len(vi)])
+    last = np.r_[first[1:] - 1, len(vi) - 1][:num_runs]
+    has_prev = np.zeros(num_runs, dtype=bool)
+    has_prev[run[1:][jump]] = True  # reached by a jump
+    has_next = np.zeros(num_runs, dtype=bool)
+    has_next[run[:-1][jump]] = True  # left by a jump
+    prev_len = np.where(has_prev, np.r_[0, length[:-1]], np.inf)
+    next_len = np.where(has_next, np.r_[length[1:], 0], np.inf)
+    between = np.flatnonzero(has_prev & has_next)
+    bridged = np.zeros(num_runs, dtype=bool)
+    bridged[between] = ~jumps(vi[last[between - 1]], vi[first[between + 1]])
+    shorter = (length < prev_len) & (length < next_len)
+    outlier = (
+        (has_prev | has_next) & (length <= max_outlier_run) & (bridged | shorter)
+    )
+    keep = np.zeros(N, dtype=bool)
+    keep[vi] = ~outlier[run]
+
+    # Strokes of kept samples
+    ki = np.flatnonzero(keep)
+    split = (seg[ki[1:]] != seg[ki[:-1]]) | jumps(ki[:-1], ki[1:])
+    split |= (np.diff(ki) > 1) & (np.diff(t[ki]) > max_fill)
+    stroke = np.full(N, -1, dtype=np.int64)
+    stroke[ki] = np.cumsum(np.r_[True, split][: len(ki)]) - 1
+
+    # Interpolate frames between kept samples of the same stroke
+    at = np.arange(N)
+    prev = np.maximum.accumulate(np.where(keep, at, -1))
+    nxt = np.minimum.accumulate(np.where(keep, at, N)[::-1])[::-1]
+    fill = ~keep & (prev >= 0) & (nxt < N)
+    fi, p, n = at[fill], prev[fill], nxt[fill]
+    inner = stroke[p] == stroke[n]
+    fi, p, n = fi[inner], p[inner], n[inner]
+    dt = t[n] - t[p]
+    w = np.divide(t[fi] - t[p], dt, out=np.zeros(len(fi)), where=dt > 0)
+    x[fi] = x[p] + w * (x[n] - x[p])
+    y[fi] = y[p] + w * (y[n] - y[p])
+    rotation[fi] = rotation[p]
+    stroke[fi] = stroke[p]
+
+    # Discard short strokes and number the remaining ones consecutively
+    sel = stroke >= 0
+    counts = np.bincount(stroke[sel], minlength=stroke.max(initial=-1) + 1)
+    sel[sel] = counts[stroke[sel]] >= min_samples
+    _, ids = np.unique(stroke[sel], return_inverse=True)
+
+    samples = np.zeros(int(sel.sum()), dtype=ASSEMBLED_DTYPE)
+    samples["pen"] = pen[sel]
+    samples["stroke"] = ids.reshape(-1)
+    samples["t"] = t[sel]
+    samples["x"] = x[sel]
+    samples["y"] = y[sel]
+    samples["rotation"] = rotation[sel]
+    samples["interpolated"] = ~keep[sel]
+    samples["frame"] = order[sel]
+    return samples
+
+
+def split_strokes(samples: np.ndarray) -> list[np.ndarray]:
+    """Splits assembled samples into one array per stroke."""
+    return np.split(samples, np.flatnonzero(np.diff(samples["stroke"])) + 1)
@@ -0,0 +1,278 @@
+"""Cached provider of encoded pattern tiles.
+
+Tiles are square regions of a section's bitmatrix addressed by tile
+coordinates, i.e. tile (tx,ty) of size S covers the positions
+[tx*S,(tx+1)*S) x [ty*S,(ty+1)*S). Tiles are produced by random-access
+region encoding (AnotoCodec.encode_region) and kept in a two-level
+cache: a size-bounded in-memory LRU and an optional size-bounded
+on-disk LRU. Tiles evicted from memory remain available from disk.
+
+The provider can be used as a local callable or be served over HTTP
+with the standard library server, see make_http_handler.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+
+
+class TileProvider:
+    """Produces and caches encoded tiles.
+
+    Returned tiles are read-only views of cached arrays; copy them before
+    modification. All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int = 64 * 2**20,
+        disk_dir: str = None,
+        disk_bytes: int = 1024 * 2**20,
+    ) -> None:
+        """Initialize the provider.
+
+        Params:
+            memory_bytes: maximum number of bytes of tiles kept in memory
+            disk_dir: optional directory of the on-disk cache
+            disk_bytes: maximum number of bytes of tiles kept on disk
+        """
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> tile
+        self._memory_size = 0
+        self._disk = OrderedDict()  # file name -> size
+        self._disk_size = 0
+        self._fingerprints = weakref.WeakKeyDictionary()  # codec -> fingerprint
+        self._lock = threading.Lock()
+        self.reset_stats()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def reset_stats(self) -> None:
+        """Clears hit/miss counters."""
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def snapshot_stats(self) -> dict:
+        """Returns a copy of the counters along with current cache sizes."""
+        with self._lock:
+            s = dict(self.stats)
+            s["memory_tiles"] = len(self._memory)
+            s["memory_bytes"] = self._memory_size
+            s["disk_tiles"] = len(self._disk)
+            s["disk_bytes"] = self._disk_size
+        return s
+
+    def __call__(self, codec, section, tile_x, tile_y, tile_size) -> np.ndarray:
+        return self.get(codec, section, tile_x, tile_y, tile_size)
+
+    def get(
+        self,
+        codec,
+        section: tuple[int, int],
+        tile_x: int,
+        tile_y: int,
+        tile_size: int,
+    ) -> np.ndarray:
+        """Returns the (S,S,2) bitmatrix of a tile.
+
+        Params:
+            codec: codec to encode with
+            section: (u,v) section coordinates
+            tile_x: tile column
+            tile_y: tile row
+            tile_size: side length S of tiles in dots
+
+        Returns:
+            tile: read-only (S,S,2) bitmatrix
+        """
+        key = (
+            self._fingerprint(codec),
+            int(section[0]),
+            int(section[1]),
+            int(tile_x),
+            int(tile_y),
+            int(tile_size),
+        )
+        if tile_x < 0 or tile_y < 0 or tile_size <= 0:
+            raise ValueError(f"Invalid tile {key[1:]}")
+
+        with self._lock:
+            tile = self._memory.get(key)
+            if tile is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return tile
+
+        tile = self._load_disk(key)
+        if tile is None:
+            tile = codec.encode_region(
+                (tile_x * tile_size, tile_y * tile_size),
+                (tile_size, tile_size),
+                section=section,
+            )
+            tile.flags.writeable = False
+            with self._lock:
+                self.stats["misses"] += 1
+            self._store_disk(key, tile)
+
+        self._store_memory(key, tile)
+        return tile
+
+    def _fingerprint(self, codec) -> str:
+        with self._lock:
+            fp = self._fingerprints.get(codec)
+        if fp is None:
+            fp = codec.fingerprint()
+            with self._lock:
+                self._fingerprints[codec] = fp
+        return fp
+
+    def _store_memory(self, key, tile: np.ndarray):
+        with self._lock:
+            if key in self._memory or tile.nbytes > self.memory_bytes:
+                return
+            self._memory[key] = tile
+            self._memory_size += tile.nbytes
+            while self._memory_size > self.memory_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_size -= old.nbytes
+                self.stats["memory_evictions"] += 1
+
+    def _file_name(self, key) -> str:
+        return hashlib.sha1(repr(key).encode()).hexdigest() + ".npy"
+
+    def _scan_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".npy"):
+                st = os.stat(os.path.join(self.disk_dir, name))
+                files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self._disk[name] = size
+            self._disk_size += size
+
+    def _load_disk(self, key) -> np.ndarray:
+        if self.disk_dir is None:
+            return None
+        name = self._file_name(key)
+        with self._lock:
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        path = os.path.join(self.disk_dir, name)
+        try:
+            tile = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        tile.flags.writeable = False
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        return tile
+
+    def _store_disk(self, key, tile: np.ndarray):
+        if self.disk_dir is None:
+            return
+        name = self._file_name(key)
+        path = os.path.join(self.disk_dir, name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, tile)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        evict = []
+        with self._lock:
+            if name in self._disk:
+                self._disk_size -= self._disk.pop(name)
+            self._disk[name] = size
+            self._disk_size += size
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old, old_size = self._disk.popitem(last=False)
+                self._disk_size -= old_size
+                self.stats["disk_evictions"] += 1
+                evict.append(old)
+        for old in evict:
+            try:
+                os.remove(os.path.join(self.disk_dir, old))
+            except OSError:
+                pass
+
+
+def make_http_handler(
+    provider: TileProvider, codecs: dict, max_tile_size: int = 1024
+) -> type:
+    """Creates a request handler class serving tiles over HTTP.
+
+    Routes:
+        GET /tile/<codec>/<u>/<v>/<size>/<tx>/<ty>
+            returns the tile as .npy (application/octet-stream)
+        GET /stats
+            returns the provider's statistics as JSON
+
+    Requests for tiles larger than max_tile_size or starting beyond the
+    period of the codec's positions are answered with 400.
+
+    Params:
+        provider: tile provider to serve from
+        codecs: mapping from names used in URLs to codec instances
+        max_tile_size: maximum side length of served tiles in dots
+
+    Returns:
+        handler: subclass of http.server.BaseHTTPRequestHandler
+
+    Example:
+        server = ThreadingHTTPServer(("127.0.0.1", 8000), make_http_handler(
+            TileProvider(), {"a4fixed": defaults.anoto_6x6_a4_fixed}))
+        server.serve_forever()
+    """
+
+    class TileRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts == ["stats"]:
+                body = json.dumps(provider.snapshot_stats()).encode()
+                return self._reply(200, body, "application/json")
+            if len(parts) != 7 or parts[0] != "tile" or parts[1] not in codecs:
+                return self._reply(404, b"Not found", "text/plain")
+            codec = codecs[parts[1]]
+            try:
+                u, v, size, tx, ty = (int(p) for p in parts[2:])
+                if size > max_tile_size:
+                    raise ValueError(f"Tile size exceeds {max_tile_size}")
+                if max(tx, ty) * size >= codec.crt.L:
+                    raise ValueError("Tile exceeds the pattern period")
+                if max(abs(u), abs(v)) >= 2**31:
+                    raise ValueError("Invalid section")
+                tile = provider.get(codec, (u, v), tx, ty, size)
+            except ValueError as e:
+                return self._reply(400, str(e).encode(), "text/plain")
+            buf = io.BytesIO()
+            np.save(buf, tile)
+            self._reply(200, buf.getvalue(), "application/octet-stream")
+
+        def _reply(self, code: int, body: bytes, ctype: str):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileRequestHandler
@@ -0,0 +1,277 @@
+"""Exhaustive validation of codecs over their full address space.
+
+Decoding along one direction is fully determined by the MNS offsets of
+mns_order consecutive positions. This module regenerates the window of
+every position in [start,stop) from the closed-form MNS offsets, runs it
+through the vectorized decoder and compares the result to the expected
+position. Since x- and y-direction share the same sequences, validating
+one direction covers both.
+
+The work is split into chunks that are processed on a process pool.
+Progress can be checkpointed to a JSON file, from which an interrupted
+validation resumes.
+
+Example:
+    report = validate_codec(defaults.anoto_6x6_a4_fixed, checkpoint="v.json")
+    print(report.ok, report.collisions[:5], report.unreachable[:5])
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Callable
+
+import numpy as np
+
+from .codec import AnotoCodec, DecodeStatus
+
+
+@dataclass
+class ValidationReport:
+    """Outcome of validating a range of positions.
+
+    Attributes:
+        start: first validated position
+        stop: end of validated positions (exclusive)
+        num_checked: number of positions validated so far
+        num_failed: number of positions whose window failed to decode
+        num_collisions: number of positions whose window decoded to a
+            different position
+        collisions: first (x, decoded) pairs of colliding positions
+        unreachable: first [begin,end) ranges of positions that do not decode
+            to themselves, either due to failure or due to collision
+    """
+
+    start: int
+    stop: int
+    num_checked: int = 0
+    num_failed: int = 0
+    num_collisions: int = 0
+    collisions: list[tuple[int, int]] = field(default_factory=list)
+    unreachable: list[tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return self.num_checked == self.stop - self.start
+
+    @property
+    def ok(self) -> bool:
+        return self.complete and self.num_failed == 0 and self.num_collisions == 0
+
+
+def decode_range(
+    codec: AnotoCodec, start: int, stop: int, section: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Regenerates and decodes the windows of positions [start,stop).
+
+    Params:
+        codec: codec to validate
+        start: first position
+        stop: end position (exclusive)
+        section: section coordinate along the direction
+
+    Returns:
+        pos: (stop-start,) array of decoded positions
+        status: (stop-start,) array of DecodeStatus values
+    """
+    M = codec.mns_order
+    rolls = codec._integrate_rolls(
+        np.arange(start, stop + M - 1, dtype=np.int64),
+        first_roll=section % codec.mns_length,
+    )
+    # Each row is the partial MNS observed at one position
+    rows = codec.mns_cyclic[rolls[:, None] + np.arange(M)]
+    windows = np.lib.stride_tricks.sliding_window_view(rows, M, axis=0)
+    return codec._decode_positions_along_direction(windows.transpose(0, 2, 1))
+
+
+def _validate_chunk(
+    codec: AnotoCodec, start: int, stop: int, section: int, max_report: int
+) -> dict:
+    pos, status = decode_range(codec, start, stop, section)
+    expected = np.arange(start, stop, dtype=np.int64)
+    failed = status != DecodeStatus.OK
+    wrong = pos != expected
+    collided = np.flatnonzero(wrong & ~failed)[:max_report]
+
+    # Runs of wrong positions as [begin,end) ranges
+    edges = np.diff(np.concatenate(([0], wrong.astype(np.int8), [0])))
+    begins = np.flatnonzero(edges == 1)[:max_report]
+    ends = np.flatnonzero(edges == -1)[:max_report]
+
+    return {
+        "start": start,
+        "stop": stop,
+        "num_failed": int(failed.sum()),
+        "num_collisions": int((wrong & ~failed).sum()),
+        "collisions": [(int(expected[i]), int(pos[i])) for i in collided],
+        "unreachable": [(start + int(b), start + int(e)) for b, e in zip(begins, ends)],
+    }
+
+
+_worker_codec: AnotoCodec = None
+
+
+def _init_worker(codec: AnotoCodec) -> None:
+    global _worker_codec
+    _worker_codec = codec
+
+
+def _validate_chunk_worker(start: int, stop: int, section: int, max_report: int):
+    return _validate_chunk(_worker_codec, start, stop, section, max_report)
+
+
+def _merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged = []
+    for b, e in sorted(ranges):
+        if merged and b <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(e, merged[-1][1]))
+        else:
+            merged.append((b, e))
+    return merged
+
+
+def _fingerprint(codec: AnotoCodec, section: int, start: int, stop: int) -> str:
+    h = hashlib.sha1(codec.fingerprint().encode())
+    h.update(repr((section, start, stop)).encode())
+    return h.hexdigest()
+
+
+class _Checkpoint:
+    """Reads and atomically writes validation progress."""
+
+    def __init__(self, path: str, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def load(self, report: ValidationReport) -> list[tuple[int, int]]:
+        """Restores the report and returns the validated [begin,end) ranges."""
+        if self.path is None or not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if data["fingerprint"] != self.fingerprint:
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to a different codec or range."
+            )
+        if "done_ranges" not in data:
+            raise ValueError(
+                f"Checkpoint {self.path} does not record validated ranges."
+            )
+        r = data["report"]
+        report.num_checked = r["num_checked"]
+        report.num_failed = r["num_failed"]
+        report.num_collisions = r["num_collisions"]
+        report.collisions = [tuple(c) for c in r["collisions"]]
+        report.unreachable = [tuple(u) for u in r["unreachable"]]
+        return _merge_ranges([tuple(r) for r in data["done_ranges"]])
+
+    def save(self, report: ValidationReport, done: list[tuple[int, int]]) -> None:
+        if self.path is None:
+            return
+        data = {
+            "fingerprint": self.fingerprint,
+            "done_ranges": _merge_ranges(done),
+            "report": asdict(report),
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+def validate_codec(
+    codec: AnotoCodec,
+    start: int = 0,
+    stop: int = None,
+    section: int = 0,
+    chunk_size: int = 2**18,
+    max_workers: int = None,
+    max_report: int = 100,
+    checkpoint: str = None,
+    checkpoint_every: int = 16,
+    progress: Callable[[int, int], None] = None,
+) -> ValidationReport:
+    """Validates that every position in [start,stop) decodes to itself.
+
+    Params:
+        codec: codec to validate
+        start: first position to validate
+        stop: end position (exclusive). Defaults to the period of the CRT,
+            i.e. the product of all SNS lengths.
+        section: section coordinate along the direction
+        chunk_size: number of positions decoded per vectorized batch
+        max_workers: number of worker processes. Zero validates in the
+            calling process, None uses all cores.
+        max_report: maximum number of collisions and unreachable ranges
+            to report.
+        checkpoint: optional path of a JSON file to store progress in. If the
+            file exists, validation resumes from it.
+        checkpoint_every: number of completed chunks between checkpoints
+        progress: optional callback receiving (num_checked, num_total)
+
+    Returns:
+        report: validation report
+    """
+    if stop is None:
+        stop = int(codec.crt.L)
+    report = ValidationReport(start=start, stop=stop)
+    ckpt = _Checkpoint(checkpoint, _fingerprint(codec, section, start, stop))
+    done = ckpt.load(report)
+
+    # Split what remains of [start,stop) into chunks. Ranges are stored
+    # rather than chunk indices, so that resuming may change chunk_size.
+    chunks = []
+    pos = start
+    for b, e in done + [(stop, stop)]:
+        for c in range(pos, b, chunk_size):
+            chunks.append((c, min(c + chunk_size, b)))
+        pos = max(pos, e)
+    num_done = 0
+
+    def merge(result: dict):
+        report.num_checked += result["stop"] - result["start"]
+        report.num_failed += result["num_failed"]
+        report.num_collisions += result["num_collisions"]
+        report.collisions = sorted(report.collisions + result["collisions"])[
+            :max_report
+        ]
+        report.unreachable = _merge_ranges(report.unreachable + result["unreachable"])[
+            :max_report
+        ]
+        nonlocal num_done
+        done.append((result["start"], result["stop"]))
+        num_done += 1
+        if num_done % checkpoint_every == 0:
+            done[:] = _merge_ranges(done)
+            ckpt.save(report, done)
+        if progress is not None:
+            progress(report.num_checked, stop - start)
+
+    if max_workers == 0:
+        for b, e in chunks:
+            merge(_validate_chunk(codec, b, e, section, max_report))
+    else:
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(codec,)
+        ) as ex:
+            # Bound the number of chunks in flight to limit memory usage
+            max_pending = 2 * max_workers
+            pending = set()
+            for b, e in chunks:
+                pending.add(
+                    ex.submit(_validate_chunk_worker, b, e, section, max_report)
+                )
+                if len(pending) >= max_pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        merge(f.result())
+            for f in wait(pending).done:
+                merge(f.result())
+
+    ckpt.save(report, done)
+    return report
@@ -0,0 +1,210 @@
+"""Verification of printed patterns against their intended encoding.
+
+A scanned sheet yields a (H,W,2) bitmatrix in canonical orientation
+(use AnotoCodec.decode_rotations to determine it beforehand). Verification
+proceeds in two steps:
+
+    1. register_scan decodes a grid of anchor windows and determines by
+       majority vote the position and section of the scan's top-left dot.
+    2. verify_print regenerates the expected pattern of the registered page
+       strip by strip and compares it to the scan. Per tile it reports the
+       fraction of dots that differ and the fraction of windows that fail to
+       decode to their expected position.
+
+Only one strip of the scan and of the expected pattern is held in memory at
+a time, so memory-mapped full-size scans can be verified.
+
+Example:
+    scan = np.load("scan.npy", mmap_mode="r")
+    report = verify_print(defaults.anoto_6x6_a4_fixed, scan, tile_size=64)
+    print(report.registration.origin, report.error_rate)
+    plt.imshow(report.dot_errors)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .codec import AnotoCodec, DecodeStatus
+from .exceptions import DecodingError
+
+
+@dataclass
+class Registration:
+    """Placement of a scan within the pattern.
+
+    Attributes:
+        origin: (x,y) position of the scan's top-left dot
+        section: (u,v) section coordinates of the scan
+        num_anchors: number of anchor windows decoded
+        num_agreeing: number of anchors voting for origin and section
+    """
+
+    origin: tuple[int, int]
+    section: tuple[int, int]
+    num_anchors: int
+    num_agreeing: int
+
+    def shift(self, expected_origin: tuple[int, int]) -> tuple[int, int]:
+        """Returns the (dx,dy) offset of the scan from the expected origin."""
+        return (
+            self.origin[0] - int(expected_origin[0]),
+            self.origin[1] - int(expected_origin[1]),
+        )
+
+
+@dataclass
+class VerificationReport:
+    """Outcome of comparing a scan to its expected pattern.
+
+    Attributes:
+        registration: placement of the scan
+        tile_size: side length of tiles in dots
+        dot_errors: (TY,TX) fraction of dots per tile that differ from the
+            expected pattern
+        decode_failures: (TY,TX) fraction of windows per tile that do not
+            decode to their expected position
+        num_dots: total number of dots compared
+        num_errors: total number of dots differing
+    """
+
+    registration: Registration
+    tile_size: int
+    dot_errors: np.ndarray
+    decode_failures: np.ndarray
+    num_dots: int
+    num_errors: int
+
+    @property
+    def error_rate(self) -> float:
+        return self.num_errors / max(self.num_dots, 1)
+
+
+def register_scan(
+    codec: AnotoCodec,
+    scan: np.ndarray,
+    num_anchors: int = 16,
+    anchor_size: int = 8,
+    min_agreeing: int = 2,
+) -> Registration:
+    """Determines the position and section of a scanned bitmatrix.
+
+    Anchor windows are taken on a regular grid over the scan and decoded as
+    a batch. Each decoded anchor votes for the position of the scan's
+    top-left dot, which makes registration robust to local print defects.
+
+    Params:
+        codec: codec the page was encoded with
+        scan: (H,W,2) scanned bitmatrix
+        num_anchors: approximate number of anchor windows
+        anchor_size: side length of anchor windows. Must be at least the
+            order of the MNS.
+        min_agreeing: minimum number of anchors that have to agree
+
+    Returns:
+        registration: placement of the scan
+
+    Raises:
+        DecodingError: if fewer than min_agreeing anchors agree.
+    """
+    H, W = scan.shape[:2]
+    S = min(anchor_size, H, W)
+    if S < codec.mns_order:
+        raise DecodingError("Scan is too small to be registered.")
+    n = max(int(np.ceil(np.sqrt(num_anchors))), 1)
+    ays = np.unique(np.linspace(0, H - S, n).astype(np.int64))
+    axs = np.unique(np.linspace(0, W - S, n).astype(np.int64))
+    ay, ax = [a.reshape(-1) for a in np.meshgrid(ays, axs, indexing="ij")]
+    anchors = np.stack([np.asarray(scan[y : y + S, x : x + S]) for y, x in zip(ay, ax)])
+
+    res = codec.decode_batch(anchors)
+    ok = res["status"] == DecodeStatus.OK
+    votes = np.stack(
+        (res["x"] - ax, res["y"] - ay, res["u"], res["v"]), -1
+    ).astype(np.int64)[ok]
+    if len(votes) == 0:
+        raise DecodingError("None of the anchor windows could be decoded.")
+    uvotes, counts = np.unique(votes, axis=0, return_counts=True)
+    best = np.argmax(counts)
+    if counts[best] < min_agreeing:
+        raise DecodingError("Anchor windows do not agree on the scan's placement.")
+    ox, oy, u, v = (int(c) for c in uvotes[best])
+    return Registration((ox, oy), (u, v), len(anchors), int(counts[best]))
+
+
+def verify_print(
+    codec: AnotoCodec,
+    scan: np.ndarray,
+    tile_size: int = 64,
+    registration: Registration = None,
+    strip_tiles: int = 4,
+) -> VerificationReport:
+    """Compares a scanned bitmatrix to the pattern it is supposed to show.
+
+    Params:
+        codec: codec the page was encoded with
+        scan: (H,W,2) scanned bitmatrix, possibly memory-mapped
+        tile_size: side length of tiles of the heat maps in dots
+        registration: placement of the scan. Determined by register_scan if
+            not given. Pass a Registration built from the expected page
+            origin and section to verify against a known page.
+        strip_tiles: number of tile rows processed at once
+
+    Returns:
+        report: per-tile error and decoding failure rates
+    """
+    if registration is None:
+        registration = register_scan(codec, scan)
+    H, W = scan.shape[:2]
+    T = int(tile_size)
+    M = codec.mns_order
+    ox, oy = registration.origin
+    TY, TX = -(-H // T), -(-W // T)
+    errors = np.zeros((TY, TX), dtype=np.int64)
+    dots = np.zeros((TY, TX), dtype=np.int64)
+    failures = np.zeros((TY, TX), dtype=np.int64)
+    windows = np.zeros((TY, TX), dtype=np.int64)
+
+    # Tile boundaries along columns, and windows on a grid of stride M
+    cols = np.arange(0, W, T)
+    wx = np.arange(0, W - M + 1, M)
+
+    strip = T * max(int(strip_tiles), 1)
+    for y0 in range(0, H, strip):
+        h = min(strip, H - y0)
+        observed = np.asarray(scan[y0 : y0 + h], dtype=np.int8)
+        expected = codec.encode_region(
+            (ox, oy + y0), (h, W), section=registration.section
+        )
+        wrong = (observed != expected).any(-1).astype(np.int64)  # (h,W)
+        # Strips start at tile boundaries
+        rows = np.arange(0, h, T)
+        t0 = y0 // T
+        tiles = slice(t0, t0 + len(rows))
+        errors[tiles] = np.add.reduceat(np.add.reduceat(wrong, rows, 0), cols, 1)
+        dots[tiles] = np.outer(np.diff(rows, append=h), np.diff(cols, append=W))
+
+        # Windows fully contained in the strip, on a grid of stride M
+        wy = np.arange(0, h - M + 1, M)
+        if len(wy) == 0 or len(wx) == 0:
+            continue
+        gy, gx = [g.reshape(-1) for g in np.meshgrid(wy, wx, indexing="ij")]
+        k = np.arange(M)
+        win = observed[gy[:, None, None] + k[None, :, None], gx[:, None, None] + k]
+        xy, status = codec.decode_positions(win)
+        exp_xy = np.stack((ox + gx, oy + y0 + gy), -1)
+        failed = (status != DecodeStatus.OK) | (xy != exp_xy).any(-1)
+        np.add.at(failures, ((y0 + gy) // T, gx // T), failed)
+        np.add.at(windows, ((y0 + gy) // T, gx // T), 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dot_errors = errors / dots
+        decode_failures = np.where(windows > 0, failures / windows, np.nan)
+    return VerificationReport(
+        registration=registration,
+        tile_size=T,
+        dot_errors=dot_errors,
+        decode_failures=decode_failures,
+        num_dots=int(dots.sum()),
+        num_errors=int(errors.sum()),
+    )
@@ -0,0 +1,153 @@
+"""Bounded cache of decoded windows.
+
+A pen hovering or resting in one spot observes the same window in many
+consecutive frames. Once a WindowCache is attached to a codec via
+AnotoCodec.enable_cache, decode_batch decodes every distinct window of a
+batch only once and serves windows seen in earlier batches from the cache.
+Scalar decoding (decode_position and friends) does not use the cache.
+
+Windows are keyed by their packed window code (see packed.pack_frames),
+e.g. the 72 bits of a 6x6 window in 9 bytes, viewed as a single void
+scalar. Keys of each window shape and set of decoding options are kept
+in a sorted array along with an array of cached rows of position,
+section, rotation and status, so that a batch is deduplicated and looked
+up with a few vectorized operations. Recency is tracked per batch: once
+the cache is full, the entries of the least recently used batches are
+evicted.
+"""
+
+import numpy as np
+
+from .packed import pack_frames
+
+"""Columns of decode_batch held per cached window."""
+CACHED_COLUMNS = ("x", "y", "u", "v", "rotation", "status")
+
+
+def pack_windows(bits: np.ndarray) -> np.ndarray:
+    """Packs a (B,N,M,2) batch of bitmatrices into (B,) void window codes."""
+    frames = np.ascontiguousarray(pack_frames(bits))
+    return frames.view(np.dtype((np.void, frames.shape[1]))).reshape(-1)
+
+
+class WindowCache:
+    """LRU mapping from window codes to decoded results."""
+
+    def __init__(self, max_size: int = 4096) -> None:
+        """Initialize the cache.
+
+        Params:
+            max_size: maximum number of cached windows
+        """
+        if max_size < 1:
+            raise ValueError("Cache size must be positive.")
+        self.max_size = int(max_size)
+        # tag -> (keys, rows, last use), keys sorted
+        self.tables: dict = {}
+        self.tick = 0
+        self.reset_stats()
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys, _, _ in self.tables.values())
+
+    def reset_stats(self) -> None:
+        """Clears the hit, miss and eviction counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self) -> None:
+        """Removes all cached windows. Counters are kept."""
+        self.tables.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def info(self) -> dict:
+        """Returns size and counters of the cache."""
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def decode(
+        self, decode_fn, bits: np.ndarray, options: tuple, dtype=np.int64
+    ) -> dict:
+        """Decodes a batch of windows through the cache.
+
+        Duplicate windows within the batch are decoded once and scattered
+        back. Duplicates count as hits.
+
+        Params:
+            decode_fn: function decoding a (K,N,M,2) batch into a dict of
+                (K,) CACHED_COLUMNS
+            bits: (B,N,M,2) batch of bitmatrices
+            options: hashable decoding options that are part of the key
+            dtype: dtype of the returned columns
+
+        Returns:
+            columns: dict of (B,) CACHED_COLUMNS
+        """
+        bits = np.asarray(bits)
+        B = len(bits)
+        tag = (bits.shape[1:3],) + tuple(options)
+        codes, first, inverse = np.unique(
+            pack_windows(bits), return_index=True, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        self.tick += 1
+
+        keys, rows, used = self.tables.get(tag, (codes[:0], None, None))
+        if rows is None:
+            rows = np.empty((0, len(CACHED_COLUMNS)), dtype=dtype)
+            used = np.empty(0, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(keys, codes), max(len(keys) - 1, 0))
+        found = keys[idx] == codes if len(keys) > 0 else np.zeros(len(codes), bool)
+        used[idx[found]] = self.tick
+
+        table = np.empty((len(codes), len(CACHED_COLUMNS)), dtype=dtype)
+        table[found] = rows[idx[found]]
+        missing = np.flatnonzero(~found)
+        self.misses += len(missing)
+        self.hits += B - len(missing)
+        if len(missing) > 0:
+            decoded = decode_fn(bits[first[missing]])
+            for i, c in enumerate(CACHED_COLUMNS):
+                table[missing, i] = decoded[c]
+            # Merge into the sorted keys of the tag. No more than max_size
+            # windows of a batch can be kept.
+            missing = missing[: self.max_size]
+            at = np.searchsorted(keys, codes[missing])
+            keys = np.insert(keys, at, codes[missing])
+            rows = np.insert(rows, at, table[missing], axis=0)
+            used = np.insert(used, at, self.tick)
+        self.tables[tag] = (keys, rows, used)
+        self._evict()
+
+        return {c: table[inverse, i] for i, c in enumerate(CACHED_COLUMNS)}
+
+    def _evict(self) -> None:
+        """Removes the least recently used entries beyond max_size."""
+        excess = len(self) - self.max_size
+        if excess <= 0:
+            return
+        tags = list(self.tables)
+        used = np.concatenate([self.tables[t][2] for t in tags])
+        # Entries of the same batch are removed in arbitrary order
+        drop = np.zeros(len(used), dtype=bool)
+        drop[np.argpartition(used, excess - 1)[:excess]] = True
+        start = 0
+        for t in tags:
+            keys, rows, last = self.tables[t]
+            keep = ~drop[start : start + len(keys)]
+            start += len(keys)
+            if keep.any():
+                self.tables[t] = (keys[keep], rows[keep], last[keep])
+            else:
+                del self.tables[t]
+        self.evictions += excess
@@ -0,0 +1,164 @@
+"""Precomputed mapping from complete windows to positions.
+
+Decoding along one direction only depends on the (M,M) matrix of bits
+that carry the MNS of that direction. For a codec with MNS length m and
+CRT period L there are at most L*m distinct such matrices: one for each
+position and each cyclic offset of the MNS along the orthogonal
+direction (which also absorbs the section coordinate). For small codecs,
+such as the 4x4 mini embodiment, all of them can be enumerated and
+decoding turns into a table lookup of the packed window code.
+
+The index is either dense, i.e. an array over all 2**(M*M) window codes,
+or sparse, i.e. sorted codes searched by bisection, whichever fits the
+given memory budget.
+"""
+
+import numpy as np
+
+
+def _row_weights(order: int) -> np.ndarray:
+    return np.left_shift(np.int64(1), order * np.arange(order, dtype=np.int64))
+
+
+class WindowIndex:
+    """Maps packed (M,M) window codes to positions along one direction."""
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray, order: int) -> None:
+        """Initialize the index.
+
+        Params:
+            keys: (K,) array of window codes. For a dense index K equals
+                2**(order*order) and keys is None.
+            values: (K,) array of positions. Missing codes map to -1.
+            order: order of the MNS
+        """
+        self.keys = keys
+        self.values = values
+        self.order = order
+        self.row_weights = _row_weights(order)
+
+    @property
+    def dense(self) -> bool:
+        return self.keys is None
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (0 if self.dense else self.keys.nbytes)
+
+    @staticmethod
+    def estimate(codec) -> tuple[int, int, int]:
+        """Estimates the size of an index for the given codec.
+
+        Returns:
+            num_windows: number of windows to enumerate
+            dense_bytes: memory required by a dense index
+            sparse_bytes: memory required by a sparse index
+        """
+        M = codec.mns_order
+        num_windows = int(codec.crt.L) * codec.mns_length
+        vbytes = np.dtype(WindowIndex._value_dtype(codec)).itemsize
+        if M * M > 62:
+            dense_bytes = None
+        else:
+            dense_bytes = (1 << (M * M)) * vbytes
+        sparse_bytes = num_windows * (8 + vbytes)
+        return num_windows, dense_bytes, sparse_bytes
+
+    @staticmethod
+    def _value_dtype(codec):
+        return np.int32 if int(codec.crt.L) < 2**31 else np.int64
+
+    @classmethod
+    def build(cls, codec, budget: int, chunk_size: int = 2**16) -> "WindowIndex":
+        """Enumerates all windows of a codec.
+
+        Params:
+            codec: codec to index
+            budget: maximum number of bytes the index may occupy
+            chunk_size: number of positions processed at once
+
+        Returns:
+            index: the window index or None if it does not fit the budget.
+        """
+        M = codec.mns_order
+        m = codec.mns_length
+        L = int(codec.crt.L)
+        num_windows, dense_bytes, sparse_bytes = cls.estimate(codec)
+        if dense_bytes is not None and dense_bytes <= budget:
+            dense = True
+        elif sparse_bytes <= budget and M * M <= 62:
+            dense = False
+        else:
+            return None
+
+        # Packed code of every partial MNS, indexed by location in the MNS
+        mns_codes = (
+            np.lib.stride_tricks.sliding_window_view(codec.mns_cyclic, M).astype(
+                np.int64
+            )
+            @ codec.mns_weights
+        )
+        rw = _row_weights(M)
+        offsets = np.arange(m)
+
+        keys, values = [], []
+        for start in range(0, L, chunk_size):
+            stop = min(start + chunk_size, L)
+            rolls = codec._integrate_rolls(np.arange(start, stop + M - 1))
+            # (N+M-1,m) row codes for every position and MNS offset
+            rows = mns_codes[(rolls[:, None] + offsets) % m]
+            win = np.lib.stride_tricks.sliding_window_view(rows, M, axis=0)
+            keys.append((win @ rw).reshape(-1))
+            values.append(np.repeat(np.arange(start, stop), m))
+        keys = np.concatenate(keys)
+        values = np.concatenate(values).astype(cls._value_dtype(codec))
+
+        # Keep the first occurrence of ambiguous windows
+        keys, first = np.unique(keys, return_index=True)
+        values = values[first]
+
+        if dense:
+            lut = np.full(1 << (M * M), -1, dtype=values.dtype)
+            lut[keys] = values
+            return cls(None, lut, M)
+        return cls(keys, values, M)
+
+    def codes(self, bits: np.ndarray) -> np.ndarray:
+        """Packs (...,M,M) bit matrices (MNS along rows) into window codes."""
+        rows = bits.astype(np.int64) @ (1 << np.arange(self.order, dtype=np.int64))
+        return rows @ self.row_weights
+
+    def lookup(self, bits: np.ndarray) -> np.ndarray:
+        """Returns the positions of (...,M,M) bit matrices or -1 if unknown."""
+        return self.lookup_codes(self.codes(bits))
+
+    def lookup_codes(self, codes: np.ndarray) -> np.ndarray:
+        """Returns the positions of packed window codes or -1 if unknown."""
+        if self.dense:
+            return self.values[codes].astype(np.int64)
+        idx = np.searchsorted(self.keys, codes)
+        idx = np.minimum(idx, len(self.keys) - 1)
+        return np.where(self.keys[idx] == codes, self.values[idx], -1).astype(
+            np.int64
+        )
+
+    def save(self, path: str, fingerprint: str) -> None:
+        """Stores the index in a .npz file tagged with the codec fingerprint."""
+        data = {"values": self.values, "order": self.order, "fingerprint": fingerprint}
+        if not self.dense:
+            data["keys"] = self.keys
+        with open(path, "wb") as f:
+            np.savez(f, **data)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> "WindowIndex":
+        """Loads an index stored by save.
+
+        Returns:
+            index: the loaded index or None if the fingerprint differs.
+        """
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            keys = data["keys"] if "keys" in data else None
+            return cls(keys, data["values"], int(data["order"]))
@@ -0,0 +1,436 @@
+"""Replay of pen-stroke workloads through the decoding APIs.
+
+Isolated decoding benchmarks do not tell how a decoder keeps up with
+many pens streaming frames concurrently. This module
+
+    1. synthesizes (or loads) stroke trajectories of several pens on a
+       sheet made of pages with different sections, including rotated
+       pens and strokes crossing page boundaries,
+    2. turns them into time-stamped streams of observed windows cut from
+       encoded pages, and
+    3. replays the streams through a decoder with a bounded input queue.
+
+Replay runs on a virtual clock: frames arrive at their (scaled)
+timestamps, while the clock advances by the measured wall-time of each
+decoding call. Hence, the reported frame rates and latencies are those
+of a decoder running at full speed, without sleeping in the harness.
+
+Example:
+    sheet = Sheet.create(defaults.anoto_6x6_a4_fixed, (512, 512), (2, 2))
+    strokes = synthesize_strokes(sheet, num_pens=32, duration=5.0)
+    frames = make_frames(sheet, strokes)
+    report = replay(defaults.anoto_6x6_a4_fixed, frames, max_batch=512)
+    print(report.fps, report.latency_p99, report.drop_rate)
+"""
+
+import time
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+
+from . import helpers
+from .codec import AnotoCodec, DecodeStatus
+from .exceptions import DecodingError
+from .strokes import SectionLayout
+
+"""Samples of recorded or synthesized strokes. Positions are given in
+dots wrt to the top-left of the sheet, time in seconds."""
+STROKE_DTYPE = np.dtype(
+    [
+        ("pen", np.int32),
+        ("stroke", np.int32),
+        ("t", np.float64),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("rotation", np.int8),
+    ]
+)
+
+"""Ground truth of frames."""
+TRUTH_DTYPE = np.dtype(
+    [
+        ("x", np.int64),
+        ("y", np.int64),
+        ("u", np.int32),
+        ("v", np.int32),
+        ("rotation", np.int8),
+    ]
+)
+
+
+class Sheet(NamedTuple):
+    """Grid of encoded pages.
+
+    Attributes:
+        pages: (P,H,W,2) bitmatrices of all pages in row-major grid order
+        sections: (P,2) section coordinates of pages
+        grid: (rows,cols) of pages
+    """
+
+    pages: np.ndarray
+    sections: np.ndarray
+    grid: tuple[int, int]
+
+    @classmethod
+    def create(
+        cls,
+        codec: AnotoCodec,
+        page_shape: tuple[int, int],
+        grid: tuple[int, int] = (1, 1),
+        sections: list[tuple[int, int]] = None,
+    ) -> "Sheet":
+        """Encodes the pages of a sheet.
+
+        Params:
+            codec: codec to encode with
+            page_shape: (H,W) shape of each page
+            grid: (rows,cols) of pages
+            sections: section of each page. Defaults to consecutive sections.
+        """
+        P = grid[0] * grid[1]
+        if sections is None:
+            sections = [(10 + i, 2 + i) for i in range(P)]
+        sections = np.asarray(sections, dtype=np.int64).reshape(P, 2)
+        pages = np.stack(
+            [codec.encode_bitmatrix(page_shape, tuple(s)) for s in sections]
+        )
+        return cls(pages, sections, (int(grid[0]), int(grid[1])))
+
+    def layout(self) -> SectionLayout:
+        """Returns the placement of the pages' sections on the sheet."""
+        H, W = self.pages.shape[1:3]
+        row, col = np.divmod(np.arange(len(self.pages)), self.grid[1])
+        return SectionLayout(self.sections, np.stack((col * W, row * H), -1))
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """(H,W) of the whole sheet in dots."""
+        return (self.grid[0] * self.pages.shape[1], self.grid[1] * self.pages.shape[2])
+
+
+class Frames(NamedTuple):
+    """Time-stamped stream of observed windows, sorted by time.
+
+    Attributes:
+        t: (N,) capture time in seconds
+        pen: (N,) pen id
+        bits: (N,S,S,2) observed windows
+        truth: (N,) expected decoding results (see TRUTH_DTYPE)
+    """
+
+    t: np.ndarray
+    pen: np.ndarray
+    bits: np.ndarray
+    truth: np.ndarray
+
+
+def synthesize_strokes(
+    sheet: Sheet,
+    num_pens: int = 8,
+    duration: float = 10.0,
+    rate: float = 100.0,
+    speed: tuple[float, float] = (50.0, 300.0),
+    stroke_duration: tuple[float, float] = (0.2, 1.5),
+    pen_up: tuple[float, float] = (0.05, 0.5),
+    rotation_prob: float = 0.1,
+    seed: int = None,
+) -> np.ndarray:
+    """Synthesizes handwriting-like strokes of several pens.
+
+    Each pen alternates between strokes and pen-up gaps. Strokes start at
+    random locations and follow a random walk of the heading at a random
+    speed. A fraction of strokes is written with the pen rotated relative to
+    the sheet.
+
+    Params:
+        sheet: sheet to write on
+        num_pens: number of concurrent pens
+        duration: length of the session in seconds
+        rate: frame rate of pens in Hz
+        speed: range of writing speeds in dots per second
+        stroke_duration: range of stroke durations in seconds
+        pen_up: range of durations between strokes in seconds
+        rotation_prob: probability of a stroke with rotated pen
+        seed: seed of the random generator
+
+    Returns:
+        samples: structured array of STROKE_DTYPE sorted by time
+    """
+    rng = np.random.default_rng(seed)
+    H, W = sheet.shape
+    samples = []
+    stroke_id = 0
+    for pen in range(num_pens):
+        t = rng.uniform(0, pen_up[1])
+        while t < duration:
+            n = max(int(rng.uniform(*stroke_duration) * rate), 1)
+            ts = t + np.arange(n) / rate
+            heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.15, n))
+            step = rng.uniform(*speed) / rate
+            x = rng.uniform(0, W) + np.cumsum(step * np.cos(heading))
+            y = rng.uniform(0, H) + np.cumsum(step * np.sin(heading))
+            s = np.zeros(n, dtype=STROKE_DTYPE)
+            s["pen"] = pen
+            s["stroke"] = stroke_id
+            s["t"] = ts
+            s["x"] = x.clip(0, W - 1)
+            s["y"] = y.clip(0, H - 1)
+            s["rotation"] = rng.integers(1, 4) if rng.random() < rotation_prob else 0
+            samples.append(s[ts < duration])
+            stroke_id += 1
+            t = ts[-1] + rng.uniform(*pen_up)
+    if len(samples) == 0:
+        return np.zeros(0, dtype=STROKE_DTYPE)
+    samples = np.concatenate(samples)
+    return samples[np.argsort(samples["t"], kind="stable")]
+
+
+def load_strokes(path: str) -> np.ndarray:
+    """Loads recorded strokes from a .npy file of STROKE_DTYPE samples."""
+    samples = np.load(path)
+    missing = set(STROKE_DTYPE.names) - set(samples.dtype.names or ())
+    if missing:
+        raise ValueError(f"Stroke file lacks fields {sorted(missing)}")
+    samples = samples.astype(STROKE_DTYPE)
+    return samples[np.argsort(samples["t"], kind="stable")]
+
+
+def make_frames(sheet: Sheet, samples: np.ndarray, window_size: int = 8) -> Frames:
+    """Cuts the observed window of every stroke sample from the sheet.
+
+    The window's top-left dot is the sample position, shifted to keep the
+    window within its page. Windows of rotated pens are rotated accordingly.
+
+    Params:
+        sheet: sheet the strokes are written on
+        samples: stroke samples (see STROKE_DTYPE)
+        window_size: side length S of windows. Determining rotations requires
+            windows larger than the order of the MNS.
+
+    Returns:
+        frames: stream of observed windows
+    """
+    P, H, W = sheet.pages.shape[:3]
+    S = window_size
+    gx = samples["x"].astype(np.int64)
+    gy = samples["y"].astype(np.int64)
+    row = np.minimum(gy // H, sheet.grid[0] - 1)
+    col = np.minimum(gx // W, sheet.grid[1] - 1)
+    page = row * sheet.grid[1] + col
+    x = np.clip(gx - col * W, 0, W - S)
+    y = np.clip(gy - row * H, 0, H - S)
+
+    k = np.arange(S)
+    bits = sheet.pages[
+        page[:, None, None], y[:, None, None] + k[None, :, None], x[:, None, None] + k
+    ]
+    rot = samples["rotation"].astype(np.int8)
+    for r in range(1, 4):
+        sel = rot == r
+        if sel.any():
+            bits[sel] = helpers.rot90(bits[sel], k=r)
+
+    truth = np.zeros(len(samples), dtype=TRUTH_DTYPE)
+    truth["x"] = x
+    truth["y"] = y
+    truth["u"] = sheet.sections[page, 0]
+    truth["v"] = sheet.sections[page, 1]
+    truth["rotation"] = rot
+    return Frames(samples["t"].copy(), samples["pen"].copy(), bits, truth)
+
+
+@dataclass
+class ReplayReport:
+    """Outcome of replaying a frame stream.
+
+    Attributes:
+        num_frames: number of frames offered
+        num_decoded: number of frames processed by the decoder
+        num_dropped: number of frames rejected by the full input queue
+        num_failed: number of processed frames that failed to decode
+        num_wrong: number of processed frames decoded to a wrong result
+        num_batches: number of decoder invocations
+        duration: virtual time from first arrival to last completion
+        busy: accumulated wall-time spent decoding
+        latencies: (num_decoded,) time from arrival to completion per frame
+    """
+
+    num_frames: int
+    num_decoded: int
+    num_dropped: int
+    num_failed: int
+    num_wrong: int
+    num_batches: int
+    duration: float
+    busy: float
+    latencies: np.ndarray
+
+    @property
+    def fps(self) -> float:
+        """Sustained throughput: processed frames per second of decoding."""
+        return self.num_decoded / self.busy if self.busy > 0 else 0.0
+
+    @property
+    def offered_fps(self) -> float:
+        """Offered load: frames per second of session time."""
+        return self.num_frames / self.duration if self.duration > 0 else 0.0
+
+    @property
+    def drop_rate(self) -> float:
+        return self.num_dropped / max(self.num_frames, 1)
+
+    def latency_percentile(self, q: float) -> float:
+        if len(self.latencies) == 0:
+            return 0.0
+        return float(np.percentile(self.latencies, q))
+
+    @property
+    def latency_p50(self) -> float:
+        return self.latency_percentile(50)
+
+    @property
+    def latency_p99(self) -> float:
+        return self.latency_percentile(99)
+
+    def summary(self) -> dict:
+        """Returns the key figures as plain Python types."""
+        return {
+            "frames": self.num_frames,
+            "decoded": self.num_decoded,
+            "dropped": self.num_dropped,
+            "failed": self.num_failed,
+            "wrong": self.num_wrong,
+            "batches": self.num_batches,
+            "fps": self.fps,
+            "offered_fps": self.offered_fps,
+            "drop_rate": self.drop_rate,
+            "latency_p50": self.latency_p50,
+            "latency_p99": self.latency_p99,
+            "latency_max": float(self.latencies.max(initial=0.0)),
+        }
+
+
+def _decode_single(
+    codec: AnotoCodec, bits: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Decodes windows one by one with the scalar API."""
+    res = np.zeros(len(bits), dtype=TRUTH_DTYPE)
+    ok = np.zeros(len(bits), dtype=bool)
+    for i, b in enumerate(bits):
+        try:
+            rot = codec.decode_rotation(b)
+            b = helpers.rot90(b, k=-rot)
+            xy = codec.decode_position(b)
+            uv = codec.decode_section(b, xy)
+        except DecodingError:
+            continue
+        res[i] = (xy[0], xy[1], uv[0], uv[1], rot)
+        ok[i] = True
+    return res, ok
+
+
+def _decode_batch(
+    codec: AnotoCodec, bits: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    out = codec.decode_batch(bits, rotation=True)
+    res = np.zeros(len(bits), dtype=TRUTH_DTYPE)
+    for name in TRUTH_DTYPE.names:
+        res[name] = out[name]
+    return res, out["status"] == DecodeStatus.OK
+
+
+def replay(
+    codec: AnotoCodec,
+    frames: Frames,
+    max_batch: int = 256,
+    queue_size: int = 4096,
+    speed: float = 1.0,
+    method: str = "batch",
+    clock=None,
+) -> ReplayReport:
+    """Replays a frame stream through a decoder with a bounded input queue.
+
+    The decoder repeatedly takes up to max_batch of the queued frames, or
+    waits for the next arrival if the queue is empty. Frames arriving while
+    the queue holds queue_size frames are dropped. Arrivals are admitted
+    between decoder invocations.
+
+    Params:
+        codec: codec to decode with
+        frames: frame stream as returned by make_frames
+        max_batch: maximum number of frames per decoder invocation
+        queue_size: capacity of the input queue
+        speed: time scale of the stream. Values larger than one replay the
+            stream faster, which increases the offered load.
+        method: 'batch' decodes with AnotoCodec.decode_batch, 'single' with
+            decode_rotation, decode_position and decode_section per frame.
+        clock: function returning seconds used to measure decoding. Defaults
+            to time.perf_counter.
+
+    Returns:
+        report: throughput, latency and drop statistics
+    """
+    if clock is None:
+        clock = time.perf_counter
+    decode = {"batch": _decode_batch, "single": _decode_single}.get(method)
+    if decode is None:
+        raise ValueError(f"Unknown method '{method}'")
+
+    arrivals = np.asarray(frames.t, dtype=np.float64) / speed
+    N = len(arrivals)
+    completion = np.full(N, np.nan)
+    dropped = np.zeros(N, dtype=bool)
+    failed = np.zeros(N, dtype=bool)
+    wrong = np.zeros(N, dtype=bool)
+
+    queue = np.empty(N, dtype=np.int64)  # FIFO of admitted frames
+    head = tail = 0
+    nxt = 0  # next frame to arrive
+    now = arrivals[0] if N > 0 else 0.0
+    busy = 0.0
+    num_batches = 0
+    while nxt < N or head < tail:
+        if head == tail:
+            now = max(now, arrivals[nxt])
+        # Admit arrivals up to now, dropping those exceeding the capacity
+        end = int(np.searchsorted(arrivals, now, side="right"))
+        if end > nxt:
+            free = queue_size - (tail - head)
+            admit = min(max(free, 0), end - nxt)
+            queue[tail : tail + admit] = np.arange(nxt, nxt + admit)
+            tail += admit
+            dropped[nxt + admit : end] = True
+            nxt = end
+        if head == tail:
+            continue
+
+        batch = queue[head : min(head + max_batch, tail)]
+        head += len(batch)
+        t0 = clock()
+        res, ok = decode(codec, frames.bits[batch])
+        elapsed = clock() - t0
+        busy += elapsed
+        now += elapsed
+        num_batches += 1
+        completion[batch] = now
+        failed[batch] = ~ok
+        truth = frames.truth[batch]
+        wrong[batch] = ok & (
+            np.stack([res[n] != truth[n] for n in TRUTH_DTYPE.names], -1).any(-1)
+        )
+
+    decoded = ~dropped
+    latencies = completion[decoded] - arrivals[decoded]
+    duration = float(np.nanmax(completion) - arrivals[0]) if decoded.any() else 0.0
+    return ReplayReport(
+        num_frames=N,
+        num_decoded=int(decoded.sum()),
+        num_dropped=int(dropped.sum()),
+        num_failed=int(failed.sum()),
+        num_wrong=int(wrong.sum()),
+        num_batches=num_batches,
+        duration=duration,
+        busy=busy,
+        latencies=latencies,
+    )
@@ -30,4 +30,7 @@ setup(
     extras_require={
         "dev": dev_required,
     },
+    entry_points={
+        "console_scripts": ["microdots=microdots.cli:main"],
+    },
 )
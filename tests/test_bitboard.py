@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from microdots import anoto_sequences, bitboard, codec, mini_sequences
+
+
+def make_codec(name, engine):
+    if name == "anoto":
+        sns = [
+            anoto_sequences.A1,
+            anoto_sequences.A2,
+            anoto_sequences.A3,
+            anoto_sequences.A4_alt,
+        ]
+        return codec.AnotoCodec(
+            anoto_sequences.MNS, 6, sns, [3, 3, 2, 3], (5, 58), engine=engine
+        )
+    return codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+        engine=engine,
+    )
+
+
+def test_pack_words():
+    rng = np.random.default_rng(0)
+    bits = rng.integers(0, 2, (5, 3, 64)).astype(np.int8)
+    words = bitboard.pack_words(bits)
+    assert words.shape == (5, 3) and words.dtype == np.uint64
+    np.testing.assert_array_equal(bitboard.unpack_words(words[..., None], 64), bits)
+    assert bitboard.pack_words([1, 0, 1]) == 5
+    with pytest.raises(ValueError):
+        bitboard.pack_words(np.zeros(65))
+
+
+@pytest.mark.parametrize("name", ["anoto", "mini"])
+def test_bitboard_identical_output(name):
+    ref = make_codec(name, "numpy")
+    bb = make_codec(name, "bitboard")
+    assert bb.engine == "bitboard" and ref.engine == "numpy"
+
+    m = ref.encode_bitmatrix((150, 140), section=(7, 3))
+    np.testing.assert_array_equal(bb.encode_bitmatrix((150, 140), section=(7, 3)), m)
+    for origin in [(0, 0), (12345, 678), (10**6, 3)]:
+        np.testing.assert_array_equal(
+            bb.encode_region(origin, (70, 130), section=(7, 3)),
+            ref.encode_region(origin, (70, 130), section=(7, 3)),
+        )
+
+    rng = np.random.default_rng(0)
+    n = 500
+    ys, xs = rng.integers(0, 130, (2, n))
+    k = np.arange(8)
+    windows = m[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+    # Corrupt some windows
+    flips = rng.random(windows.shape) < 0.01
+    windows = np.where(flips, 1 - windows, windows).astype(np.int8)
+
+    for a, b in zip(bb.decode_positions(windows), ref.decode_positions(windows)):
+        np.testing.assert_array_equal(a, b)
+    xy, _ = ref.decode_positions(windows)
+    for a, b in zip(bb.decode_sections(windows, xy), ref.decode_sections(windows, xy)):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(bb.decode_rotations(windows), ref.decode_rotations(windows)):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_use_engine():
+    anoto = make_codec("mini", "numpy")
+    anoto.use_engine("bitboard")
+    assert anoto.engine == "bitboard"
+    anoto.use_engine("numpy")
+    assert anoto.bitboard is None
+    with pytest.raises(ValueError):
+        anoto.use_engine("simd")
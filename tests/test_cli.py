@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+
+from microdots import defaults, helpers
+from microdots.cli import main
+from microdots.codec import DecodeStatus
+
+
+def test_encode(tmp_path):
+    codec = defaults.anoto_6x6_a4_fixed
+    expected = codec.encode_bitmatrix((40, 30), section=(3, 4))
+
+    path = str(tmp_path / "page.npy")
+    assert main(["encode", path, "--shape", "40", "30", "--section", "3", "4"]) == 0
+    np.testing.assert_array_equal(np.load(path), expected)
+
+    path = str(tmp_path / "symbols.npy")
+    args = ["encode", path, "--shape", "40", "30", "--section", "3", "4"]
+    assert main(args + ["--symbols", "--strip", "7"]) == 0
+    np.testing.assert_array_equal(np.load(path), helpers.bits_to_num(expected))
+
+    path = tmp_path / "page.pgm"
+    assert main(["encode", str(path), "--shape", "40", "30", "--cell", "6"]) == 0
+    data = path.read_bytes()
+    assert data.startswith(b"P5\n180 240\n255\n")
+    img = np.frombuffer(data[len(b"P5\n180 240\n255\n") :], dtype=np.uint8)
+    assert (img == 0).sum() == 40 * 30
+
+
+def test_decode(tmp_path, capsys):
+    codec = defaults.anoto_6x6_a4_fixed
+    page = codec.encode_bitmatrix((60, 60), section=(10, 2))
+    rng = np.random.default_rng(0)
+    xs = rng.integers(0, 54, 50)
+    ys = rng.integers(0, 54, 50)
+    k = np.arange(6)
+    windows = page[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+    windows[0] = 0
+
+    inp = str(tmp_path / "windows.npy")
+    out = str(tmp_path / "results.npy")
+    np.save(inp, windows)
+    assert main(["decode", inp, out, "--sections", "--chunk", "16", "--jobs", "2"]) == 1
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["windows"] == 50 and summary["failed"] == 1
+
+    res = np.load(out)
+    assert res.shape == (50,)
+    assert res["status"][0] != DecodeStatus.OK
+    np.testing.assert_array_equal(res["x"][1:], xs[1:])
+    np.testing.assert_array_equal(res["y"][1:], ys[1:])
+    assert (res["u"][1:] == 10).all() and (res["v"][1:] == 2).all()
+    assert (res["status"][1:] == DecodeStatus.OK).all()
+
+    # Symbols inside an archive
+    inp = str(tmp_path / "windows.npz")
+    np.savez(inp, symbols=helpers.bits_to_num(windows[1:]))
+    args = ["decode", inp, out, "--key", "symbols", "--chunk", "16", "--jobs", "2"]
+    assert main(args) == 0
+    res = np.load(out)
+    np.testing.assert_array_equal(res["x"], xs[1:])
+    np.testing.assert_array_equal(res["y"], ys[1:])
+    assert (res["u"] == -1).all() and (res["v"] == -1).all()
+
+    # Zero jobs decode in-process
+    assert main(["decode", inp, out, "--key", "symbols", "--jobs", "0"]) == 0
+    np.testing.assert_array_equal(np.load(out)["x"], xs[1:])
+
+
+def test_validate(capsys):
+    assert main(["validate", "--stop", "2000", "--jobs", "0"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report["ok"] and report["checked"] == 2000
+
+
+def test_preview(tmp_path, capsys):
+    out = str(tmp_path / "pyr")
+    args = ["preview", out, "--shape", "100", "90", "--strip", "30", "--tile", "64"]
+    assert main(args) == 0
+    info = json.loads(capsys.readouterr().out)
+    assert info["shape"] == [100, 90]
+    assert (tmp_path / "pyr" / "pyramid.json").exists()
+    assert len(list((tmp_path / "pyr" / "0").glob("*.npy"))) == 13 * 12
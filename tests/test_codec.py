@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from microdots import defaults, codec, helpers
+from microdots import codec, debruijn, defaults, helpers
 
 
 def test_bitmatrix_encode_different_sections():
@@ -78,3 +78,327 @@ def test_bitmatrix_decode_rotation():
 
             r = helpers.rot90(s, k=3)
             assert anoto.decode_rotation(r) == 3
+
+
+@pytest.mark.parametrize("anoto", [defaults.anoto_6x6, defaults.anoto_6x6_a4_fixed])
+def test_bitmatrix_decode_batch(anoto):
+    m = anoto.encode_bitmatrix((64, 256), section=(3, 7))
+    windows = np.lib.stride_tricks.sliding_window_view(m, (6, 6), axis=(0, 1))
+    windows = windows.transpose(0, 1, 3, 4, 2).reshape(-1, 6, 6, 2)
+
+    xy, status = anoto.decode_positions(windows)
+    assert (status == codec.DecodeStatus.OK).all()
+    expected = [anoto.decode_position(w) for w in windows[::37]]
+    assert np.all(xy[::37] == expected)
+
+    bad = windows[:2].copy()
+    bad[0] = 0
+    bad[1, :, :, 1] = 0
+    xy, status = anoto.decode_positions(bad)
+    assert list(status) == [codec.DecodeStatus.DELTA_OUT_OF_RANGE] * 2
+    assert (xy == -1).all()
+
+    xy, status = anoto.decode_positions(windows[:0])
+    assert xy.shape == (0, 2) and status.shape == (0,)
+    with pytest.raises(codec.DecodingError):
+        anoto.decode_positions(windows[:0, :5])
+
+
+def test_integrate_rolls():
+    anoto = defaults.anoto_6x6_a4_fixed
+    pos = np.arange(0, 1000, 7)
+    rolls = anoto._integrate_rolls(pos, first_roll=5)
+    assert np.all(rolls == [anoto._integrate_roll(p, first_roll=5) for p in pos])
+
+
+def test_bitmatrix_decode_sections_batch():
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((64, 300), section=(10, 5))
+    origins = [(0, 0), (7, 290), (50, 3)]
+    windows = np.stack([m[y : y + 6, x : x + 6] for y, x in origins])
+    xy, _ = anoto.decode_positions(windows)
+    uv, status = anoto.decode_sections(windows, xy)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert np.all(uv == (10, 5))
+    for w, p in zip(windows, xy):
+        assert tuple(anoto.decode_section(w, p)) == (10, 5)
+
+    uv, status = anoto.decode_sections(windows[:1], [[-1, -1]])
+    assert status[0] == codec.DecodeStatus.MNS_NOT_FOUND
+    assert np.all(uv == -1)
+
+
+@pytest.mark.parametrize("section", [(0, 0), (10, 5)])
+def test_encode_region(section):
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((200, 300), section=section)
+    regions = [((0, 0), (200, 300)), ((17, 130), (50, 61)), ((299, 0), (1, 1))]
+    for (x, y), (h, w) in regions:
+        r = anoto.encode_region((x, y), (h, w), section=section)
+        assert r.shape == (h, w, 2)
+        assert np.all(r == m[y : y + h, x : x + w])
+
+
+def test_encode_sections():
+    anoto = defaults.anoto_6x6_a4_fixed
+    sections = [(0, 0), (10, 5), (62, 1), (70, 130)]
+    pages = anoto.encode_sections((50, 61), sections, origin=(17, 130))
+    for section, page in zip(sections, pages):
+        assert page.shape == (50, 61, 2)
+        assert np.all(page == anoto.encode_region((17, 130), (50, 61), section))
+    page = next(anoto.encode_sections((30, 20), [(3, 4)]))
+    assert np.all(page == anoto.encode_bitmatrix((30, 20), section=(3, 4)))
+
+
+def test_bitmatrix_decode_corrected():
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((100, 300), section=(3, 4))
+    windows = np.lib.stride_tricks.sliding_window_view(m, (10, 10), axis=(0, 1))
+    windows = windows.transpose(0, 1, 3, 4, 2).reshape(-1, 10, 10, 2)[::17]
+    expected, _ = anoto.decode_positions(windows)
+
+    xy, status, corrections = anoto.decode_positions_corrected(windows)
+    assert np.all(xy == expected)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert (corrections == 0).all()
+
+    # Flip a single dot bit per window
+    rng = np.random.default_rng(0)
+    B = len(windows)
+    i, j, ch = rng.integers(0, 10, B), rng.integers(0, 10, B), rng.integers(0, 2, B)
+    bad = windows.copy()
+    bad[np.arange(B), i, j, ch] ^= 1
+    xy, status, corrections = anoto.decode_positions_corrected(bad, max_errors=1)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert np.all(xy == expected)
+    assert np.all(corrections[np.arange(B), ch] == 1)
+    assert np.all(corrections[np.arange(B), 1 - ch] == 0)
+
+    # Without correction these windows fail or decode wrongly
+    xy, status = anoto.decode_positions(bad[:, :6, :6])
+    hit = (i < 6) & (j < 6)
+    assert not np.all(xy[hit] == expected[hit], axis=-1).any()
+
+    # Windows of the order of MNS carry no redundancy to correct with
+    with pytest.raises(ValueError):
+        anoto.decode_positions_corrected(bad[:, :6, :8])
+    xy, status, corrections = anoto.decode_positions_corrected(
+        bad[:, :6, :6], max_errors=0
+    )
+    assert np.all(status == anoto.decode_positions(bad[:, :6, :6])[1])
+
+    xy, status, corrections = anoto.decode_positions_corrected(bad[:0])
+    assert xy.shape == (0, 2) and status.shape == (0,) and corrections.shape == (0, 2)
+
+
+@pytest.mark.parametrize("size", [6, 8])
+def test_bitmatrix_decode_masked(size):
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((100, 300), section=(3, 4))
+    windows = np.lib.stride_tricks.sliding_window_view(m, (size, size), axis=(0, 1))
+    windows = windows.transpose(0, 1, 3, 4, 2).reshape(-1, size, size, 2)[::29]
+    expected, _ = anoto.decode_positions(windows)
+    B = len(windows)
+
+    mask = np.ones((B, size, size), dtype=bool)
+    xy, status = anoto.decode_positions_masked(windows, mask)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert np.all(xy == expected)
+
+    # Drop two dots per window and scramble their bits
+    rng = np.random.default_rng(0)
+    for _ in range(2):
+        mask[np.arange(B), rng.integers(0, size, B), rng.integers(0, size, B)] = False
+    bad = np.where(mask[..., None], windows, 1 - windows)
+    xy, status = anoto.decode_positions_masked(bad, mask)
+    ok = status == codec.DecodeStatus.OK
+    # Never wrong, and larger windows resolve almost all erasures
+    assert np.all(xy[ok] == expected[ok])
+    assert np.all(xy[~ok] == -1)
+    if size == 8:
+        assert ok.mean() > 0.95
+
+    # Nothing observed
+    xy, status = anoto.decode_positions_masked(bad[:1], np.zeros((1, size, size)))
+    assert status[0] == codec.DecodeStatus.INSUFFICIENT_DATA
+
+    xy, status = anoto.decode_positions_masked(bad[:0], np.zeros((0, size, size)))
+    assert xy.shape == (0, 2) and status.shape == (0,)
+
+
+def test_bitmatrix_decode_consensus():
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((100, 300), section=(3, 4))
+    windows = np.lib.stride_tricks.sliding_window_view(m, (10, 10), axis=(0, 1))
+    windows = windows.transpose(0, 1, 3, 4, 2).reshape(-1, 10, 10, 2)[::31]
+    expected, _ = anoto.decode_positions(windows)
+
+    xy, status, conf = anoto.decode_positions_consensus(windows)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert np.all(xy == expected)
+    assert np.allclose(conf, 1.0)
+
+    # Corrupt the top-left sub-window, which decode_position would use
+    bad = windows.copy()
+    bad[:, 0, 0] ^= 1
+    xy, status, conf = anoto.decode_positions_consensus(bad)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert np.all(xy == expected)
+    assert np.all(conf >= 24 / 25)
+    plain, _ = anoto.decode_positions(bad)
+    assert not np.all(plain == expected, axis=-1).any()
+
+    # Random flips may let a minority of sub-windows agree on a wrong
+    # position, which a strict majority rejects
+    rng = np.random.default_rng(0)
+    B = len(windows)
+    bad = windows.copy()
+    for _ in range(2):
+        i, j, ch = rng.integers(0, 10, B), rng.integers(0, 10, B), rng.integers(0, 2, B)
+        bad[np.arange(B), i, j, ch] ^= 1
+    xy, status, conf = anoto.decode_positions_consensus(bad)
+    ok = status == codec.DecodeStatus.OK
+    assert np.all(xy[ok] == expected[ok]) and np.all(conf[ok] > 0.5)
+    _, loose, _ = anoto.decode_positions_consensus(bad, min_votes=1)
+    assert (loose == codec.DecodeStatus.OK).sum() > ok.sum()
+
+    xy, status, conf = anoto.decode_positions_consensus(windows[:, :6, :6])
+    assert np.all(xy == expected)
+
+    xy, status, conf = anoto.decode_positions_consensus(windows[:0])
+    assert xy.shape == (0, 2) and status.shape == (0,) and conf.shape == (0,)
+
+
+def test_bitmatrix_decode_rotations_batch():
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((128, 128), section=(5, 10))
+    rng = np.random.default_rng(0)
+    ys, xs = rng.integers(0, 120, (2, 200))
+    k = np.arange(8)
+    windows = m[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+    rots = rng.integers(0, 4, 200)
+    for r in range(1, 4):
+        windows[rots == r] = helpers.rot90(windows[rots == r], k=r)
+    windows[0] = 0
+
+    rot, status = anoto.decode_rotations(windows)
+    assert status[0] == codec.DecodeStatus.ROTATION_UNDETERMINED and rot[0] == -1
+    assert (status[1:] == codec.DecodeStatus.OK).all()
+    np.testing.assert_array_equal(rot[1:], rots[1:])
+    assert [anoto.decode_rotation(w) for w in windows[1:50]] == list(rot[1:50])
+
+    rot, status = anoto.decode_rotations(windows[:0])
+    assert rot.shape == (0,) and status.shape == (0,)
+    assert len(anoto.decode_batch(windows[:0], rotation=True)) == 0
+
+
+def test_decode_batch():
+    from microdots import results
+
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((128, 128), section=(5, 10))
+    rng = np.random.default_rng(1)
+    ys, xs = rng.integers(0, 120, (2, 100))
+    k = np.arange(8)
+    windows = m[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+
+    res = anoto.decode_batch(windows)
+    assert res.dtype == results.result_dtype()
+    np.testing.assert_array_equal(res["x"], xs)
+    np.testing.assert_array_equal(res["y"], ys)
+    assert (res["u"] == 5).all() and (res["v"] == 10).all()
+    assert (res["rotation"] == 0).all() and (res["status"] == 0).all()
+
+    rotated = helpers.rot90(windows, k=1)
+    rotated[0] = 0
+    out = results.empty_results(100, timestamp=True, device=True)
+    anoto.decode_batch(rotated, out=out, rotation=True)
+    assert out["status"][0] == codec.DecodeStatus.ROTATION_UNDETERMINED
+    assert out["x"][0] == -1 and out["u"][0] == -1
+    assert (out["status"][1:] == 0).all() and (out["rotation"][1:] == 1).all()
+    np.testing.assert_array_equal(out["x"][1:], xs[1:])
+    np.testing.assert_array_equal(out["y"][1:], ys[1:])
+    assert (out["device"] == 0).all()
+
+    columns = {"x": np.zeros(100, np.int64), "status": np.zeros(100, np.uint8)}
+    anoto.decode_batch(windows, out=columns, sections=False)
+    np.testing.assert_array_equal(columns["x"], xs)
+
+
+def test_codec_beyond_int64():
+    # Order 9 MNS with four SNS of order 8 addresses 2^68 positions per axis
+    (l1, l2, l3, l4), _ = debruijn.coprime_lengths([5**8, 5**8, 5**8, 3**8])
+    sns = [
+        debruijn.quasi_debruijn(a, 8, length, seed=1)
+        for a, length in zip([5, 5, 5, 3], [l1, l2, l3, l4])
+    ]
+    anoto = codec.AnotoCodec(debruijn.debruijn(2, 9), 9, sns, [5, 5, 5, 3], (69, 443))
+    assert anoto.crt.L > 2**63 and anoto.crt.dtype is object
+
+    x0, y0 = 2**65 + 12345, anoto.crt.L - 20
+    m = anoto.encode_region((x0, y0), (20, 20), section=(3, 11))
+    rng = np.random.default_rng(0)
+    ys, xs = rng.integers(0, 12, 20), rng.integers(0, 12, 20)
+    k = np.arange(9)
+    windows = m[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+
+    xy, status = anoto.decode_positions(windows)
+    assert (status == codec.DecodeStatus.OK).all()
+    assert [int(x) for x in xy[:, 0]] == [x0 + int(x) for x in xs]
+    assert [int(y) for y in xy[:, 1]] == [y0 + int(y) for y in ys]
+    uv, _ = anoto.decode_sections(windows, xy)
+    assert (uv == (3, 11)).all()
+
+    x, y = anoto.decode_position(windows[0])
+    assert (x, y) == (x0 + int(xs[0]), y0 + int(ys[0]))
+    assert anoto.decode_section(windows[0], (x, y)) == (3, 11)
+    pts = np.array([[x, y]], dtype=object)
+    assert (anoto.encode_points(pts, section=(3, 11)) == windows[0, 0, 0]).all()
+
+    res = anoto.decode_batch(windows)
+    assert [int(x) for x in res["x"]] == [int(x) for x in xy[:, 0]]
+
+    from microdots.codec_set import CodecSet
+
+    ids, cxy, _ = CodecSet([anoto]).decode_positions(windows)
+    assert (ids == 0).all() and cxy.dtype == object
+    np.testing.assert_array_equal(cxy, xy)
+
+
+def test_linear_strip():
+    anoto = defaults.anoto_6x6_a4_fixed
+    strip = anoto.encode_strip(1000, 300, section=7)
+    assert strip.shape == (6, 300)
+    region = anoto.encode_region((1000, 0), (6, 300), section=(7, 0))
+    np.testing.assert_array_equal(strip, region[..., 0])
+
+    # Any rows of a taller strip decode
+    strip = anoto.encode_strip(1000, 300, rows=20)
+    rng = np.random.default_rng(0)
+    ys, xs = rng.integers(0, 14, 50), rng.integers(0, 290, 50)
+    k, j = np.arange(6), np.arange(10)
+    planes = strip[ys[:, None, None] + k[None, :, None], xs[:, None, None] + j]
+
+    for K in (6, 10):
+        x, status = anoto.decode_linear_positions(planes[..., :K])
+        assert (status == codec.DecodeStatus.OK).all()
+        np.testing.assert_array_equal(x, xs + 1000)
+    assert anoto.decode_linear_position(planes[3]) == xs[3] + 1000
+
+    # Surplus columns reject misreads
+    planes[:5, 2, 8] ^= 1
+    x, status = anoto.decode_linear_positions(planes)
+    assert (status[:5] != codec.DecodeStatus.OK).all() and (x[:5] == -1).all()
+
+    # x alone from full windows
+    m = anoto.encode_bitmatrix((40, 40), section=(3, 4))
+    assert anoto.decode_linear_position(m[10:16, 20:26]) == 20
+    x, _ = anoto.decode_linear_positions(m[None, 10:16, 20:27])
+    assert x[0] == 20
+
+    for K in (6, 10):
+        x, status = anoto.decode_linear_positions(planes[:0, :, :K])
+        assert x.shape == (0,) and status.shape == (0,)
+
+    with pytest.raises(codec.DecodingError):
+        anoto.decode_linear_position(strip[:6, :1])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from microdots import codec, defaults, mini_sequences
+from microdots.codec_set import CodecSet
+
+
+def sample_windows(anoto, size, n, section=(3, 4), seed=0):
+    m = anoto.encode_bitmatrix((200, 200), section=section)
+    rng = np.random.default_rng(seed)
+    ys, xs = rng.integers(0, 200 - size, (2, n))
+    k = np.arange(size)
+    windows = m[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+    return windows, np.stack((xs, ys), -1)
+
+
+def test_codec_set():
+    mini = codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+    )
+    cs = CodecSet(
+        {
+            "a4": defaults.anoto_6x6,
+            "a4fixed": defaults.anoto_6x6_a4_fixed,
+            "mini": mini,
+        }
+    )
+    assert len(cs) == 3 and len(cs.groups) == 2
+
+    for i, c in enumerate(cs.codecs):
+        windows, xy = sample_windows(c, 8, 500, seed=i)
+        ids, dxy, status = cs.decode_positions(windows)
+        found = ids >= 0
+        assert (ids[found] == i).all()
+        assert found.mean() > 0.9
+        np.testing.assert_array_equal(dxy[found], xy[found])
+        assert (status[found] == codec.DecodeStatus.OK).all()
+
+        uv, status = cs.decode_sections(windows, ids, dxy)
+        assert (uv[found] == (3, 4)).all()
+        assert (uv[~found] == -1).all()
+
+    # Both Anoto codecs apply to most 6x6 windows
+    windows, _ = sample_windows(defaults.anoto_6x6_a4_fixed, 6, 100)
+    ids, xy, status = cs.decode_positions(windows)
+    assert (status[ids < 0] == codec.DecodeStatus.AMBIGUOUS).all()
+    assert (xy[ids < 0] == -1).all()
+
+    # Anoto codecs cannot be tried on 4x4 windows
+    windows, xy = sample_windows(mini, 4, 100)
+    xy_all, status, applies = cs.match(windows)
+    assert (status[:, :2] == codec.DecodeStatus.INSUFFICIENT_DATA).all()
+    ids, _, _ = cs.decode_positions(np.zeros((1, 8, 8, 2), dtype=np.int8))
+    assert ids[0] == -1
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from microdots import defaults, packed
+from microdots.daemon import DecodeClient, DecodeServer
+from microdots.exceptions import DecodingError
+
+
+def _windows(page, n, rng, size=6):
+    H, W = page.shape[:2]
+    ys, xs = rng.integers(0, H - size, n), rng.integers(0, W - size, n)
+    k = np.arange(size)
+    return page[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+
+
+def test_daemon_batches_clients(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    page = anoto.encode_bitmatrix((80, 80), section=(3, 4))
+    path = str(tmp_path / "decode.sock")
+    rng = np.random.default_rng(0)
+    batches = [_windows(page, 10, rng) for _ in range(64)]
+    results = [None] * len(batches)
+
+    def work(client, k):
+        for i in range(k, len(batches), 8):
+            results[i] = client.decode(batches[i])
+
+    with DecodeServer(anoto, path, max_delay=0.02) as server:
+        clients = [DecodeClient(path, timeout=10) for _ in range(8)]
+        threads = [
+            threading.Thread(target=work, args=(c, k)) for k, c in enumerate(clients)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for c in clients:
+            c.close()
+        assert server.stats["requests"] == 64 and server.stats["frames"] == 640
+        assert server.stats["batches"] < 64
+    assert not os.path.exists(path)
+
+    for bits, res in zip(batches, results):
+        np.testing.assert_array_equal(res, anoto.decode_batch(bits))
+
+
+def test_daemon_packed_frames(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    page = anoto.encode_bitmatrix((80, 80), section=(10, 2))
+    path = str(tmp_path / "decode.sock")
+    rng = np.random.default_rng(1)
+    bits = _windows(page, 50, rng, size=8)
+
+    with DecodeServer(anoto, path), DecodeClient(path, timeout=10) as client:
+        buf = packed.pack_frames(bits).tobytes()
+        res = client.decode(buf, shape=(8, 8), sections=False)
+        np.testing.assert_array_equal(res, anoto.decode_batch(bits, sections=False))
+
+        buf = packed.pack_frames(bits[:, :6, :6]).tobytes()
+        np.testing.assert_array_equal(
+            client.decode(memoryview(buf)), anoto.decode_batch(bits[:, :6, :6])
+        )
+        assert client.decode(b"").shape == (0,)
+
+        with pytest.raises(DecodingError):
+            client.decode(bytes(9), shape=(3, 3))
+        with pytest.raises(DecodingError):
+            client.decode(bytes(10))
+        # Connection remains usable after errors
+        assert len(client.decode(buf)) == 50
+
+
+def test_daemon_rejects_oversized_requests(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    page = anoto.encode_bitmatrix((80, 80), section=(10, 2))
+    path = str(tmp_path / "decode.sock")
+    bits = _windows(page, 20, np.random.default_rng(2))
+
+    with DecodeServer(anoto, path, max_batch=16), DecodeClient(path, 10) as client:
+        with pytest.raises(ValueError):
+            client.decode(np.zeros((1, 300, 6, 2), dtype=np.int8))
+        with pytest.raises(DecodingError):
+            client.decode(bits)
+        # The payload was skipped and the connection remains usable
+        res = client.decode(bits[:16])
+        np.testing.assert_array_equal(res, anoto.decode_batch(bits[:16]))
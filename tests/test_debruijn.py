@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from microdots import anoto_sequences, codec, debruijn, mini_sequences
+
+
+@pytest.mark.parametrize(
+    "seq,n,isdebruijn",
+    [
+        (anoto_sequences.MNS, 6, True),
+        (anoto_sequences.A1, 5, True),
+        (anoto_sequences.A4_alt, 5, True),
+        (anoto_sequences.A4, 5, False),
+        (mini_sequences.A2, 3, True),
+    ],
+)
+def test_is_quasi_debruijn(seq, n, isdebruijn):
+    assert debruijn.is_quasi_debruijn(seq, n) == isdebruijn
+    assert (len(debruijn.find_repeats(seq, n)) == 0) == isdebruijn
+
+
+def test_find_repeats_a4():
+    # see test_codec.test_bitmatrix_decode_fail_origa4
+    assert (195, 217) in debruijn.find_repeats(anoto_sequences.A4, 5)
+
+
+@pytest.mark.parametrize("alphabet,order", [(2, 1), (2, 4), (2, 6), (3, 5), (5, 3)])
+def test_debruijn(alphabet, order):
+    for seed in [None, 0, 1]:
+        seq = debruijn.debruijn(alphabet, order, seed=seed)
+        assert debruijn.is_debruijn(seq, order, alphabet)
+    # Canonical sequence of the mini MNS
+    assert np.all(debruijn.debruijn(2, 4) == mini_sequences.MNS)
+
+
+@pytest.mark.parametrize(
+    "alphabet,order,length",
+    [(2, 6, 63), (3, 5, 236), (3, 5, 233), (2, 5, 31), (3, 5, 241), (2, 6, 40)],
+)
+def test_quasi_debruijn(alphabet, order, length):
+    for seed in [None, 1]:
+        seq = debruijn.quasi_debruijn(alphabet, order, length, seed=seed)
+        assert len(seq) == length
+        assert debruijn.is_quasi_debruijn(seq, order, alphabet)
+    with pytest.raises(ValueError):
+        debruijn.quasi_debruijn(alphabet, order, alphabet**order + 1)
+
+
+def test_quasi_debruijn_all_lengths():
+    for length in range(1, 3**4 + 1):
+        seq = debruijn.quasi_debruijn(3, 4, length)
+        assert len(seq) == length
+        assert debruijn.is_quasi_debruijn(seq, 4, 3)
+
+
+def test_coprime_lengths():
+    lengths, period = debruijn.coprime_lengths([243, 243, 32, 243])
+    assert debruijn.is_pairwise_coprime(lengths)
+    assert period == np.prod(lengths)
+    # At least as large as the Anoto choice
+    assert period >= 236 * 233 * 31 * 241
+    assert not debruijn.is_pairwise_coprime([236, 233, 32])
+
+
+def test_generated_codec_decodes():
+    mns = debruijn.quasi_debruijn(2, 4, 16)
+    (l1, l2), _ = debruijn.coprime_lengths([27, 125])
+    a1 = debruijn.quasi_debruijn(3, 3, l1, seed=1)
+    a2 = debruijn.quasi_debruijn(5, 3, l2, seed=1)
+    anoto = codec.AnotoCodec(mns, 4, [a1, a2], [3, 5], (1, 15))
+
+    m = anoto.encode_bitmatrix((64, 64), section=(2, 3))
+    for y, x in [(0, 0), (10, 33), (57, 21)]:
+        assert anoto.decode_position(m[y : y + 4, x : x + 4]) == (x, y)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from microdots import defaults, frontend, helpers
+
+
+def _synthesize(bits, pitch, angle, persp, noise, drop, rng):
+    """Projects the dots of (S,S,2) bits into an image with noisy centroids."""
+    S = bits.shape[0]
+    j, i = np.meshgrid(np.arange(S), np.arange(S), indexing="ij")
+    sym = helpers.bits_to_num(bits).reshape(-1)
+    g = np.stack((i, j), -1).reshape(-1, 2) + helpers.OFFSET_LUT[sym] / 6
+    ca, sa = np.cos(angle), np.sin(angle)
+    H = np.array(
+        [
+            [pitch * ca, -pitch * sa, 120.0],
+            [pitch * sa, pitch * ca, 90.0],
+            [persp / S, -0.5 * persp / S, 1.0],
+        ]
+    )
+    q = np.c_[g, np.ones(len(g))] @ H.T
+    p = q[:, :2] / q[:, 2:] + rng.normal(0, noise * pitch, (len(g), 2))
+    # Keep the first row and column so that the top-left cell is observed
+    keep = (rng.random(len(g)) > drop) | (i.reshape(-1) == 0) | (j.reshape(-1) == 0)
+    p = p[keep]
+    return p[rng.permutation(len(p))], H
+
+
+def test_centroids_to_bits():
+    anoto = defaults.anoto_6x6_a4_fixed
+    rng = np.random.default_rng(0)
+    S, F = 8, 20
+    page = anoto.encode_bitmatrix((100, 100), section=(3, 4))
+    xy = rng.integers(0, 100 - S, (F, 2))
+
+    points = np.full((F, S * S, 2), np.nan)
+    for f, (x, y) in enumerate(xy):
+        p, _ = _synthesize(
+            page[y : y + S, x : x + S],
+            pitch=rng.uniform(10, 16),
+            angle=rng.uniform(-0.5, 0.5),
+            persp=rng.uniform(-0.05, 0.05),
+            noise=0.02,
+            drop=0.03,
+            rng=rng,
+        )
+        points[f, : len(p)] = p
+
+    bits, mask = frontend.centroids_to_bits(points, (S, S))
+    assert bits.shape == (F, S, S, 2) and mask.shape == (F, S, S)
+    assert mask.mean() > 0.9
+    for f, (x, y) in enumerate(xy):
+        m = mask[f]
+        np.testing.assert_array_equal(bits[f][m], page[y : y + S, x : x + S][m])
+        assert (bits[f][~m] == 0).all()
+
+    dxy, status = anoto.decode_positions_masked(bits, mask)
+    np.testing.assert_array_equal(dxy, xy)
+
+
+def test_estimate_grid_single_frame():
+    anoto = defaults.anoto_6x6_a4_fixed
+    rng = np.random.default_rng(1)
+    bits = anoto.encode_bitmatrix((12, 12), section=(0, 0))
+    points, H = _synthesize(bits, 12.0, 0.3, 0.0, 0.0, 0.0, rng)
+
+    est = frontend.estimate_grid(points)
+    assert est.shape == (3, 3)
+    est = est / est[2, 2]
+    # Same pitch and angle, grid origin possibly shifted by whole cells
+    np.testing.assert_allclose(est[:2, :2], H[:2, :2], atol=0.05)
+    shift = np.linalg.solve(H[:2, :2], est[:2, 2] - H[:2, 2])
+    np.testing.assert_allclose(shift, np.rint(shift), atol=0.05)
+
+    nbits, mask = frontend.centroids_to_bits(points, (12, 12), homographies=est)
+    assert mask.all()
+    np.testing.assert_array_equal(nbits, bits)
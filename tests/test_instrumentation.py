@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from microdots import codec, defaults, mini_sequences
+from microdots.exceptions import DecodingError
+from microdots.instrumentation import STAGES
+
+
+def make_codec():
+    # Fresh instance, to not leak instrumentation into the shared defaults
+    return codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+    )
+
+
+def test_instrumentation_disabled_by_default():
+    anoto = make_codec()
+    assert anoto.instrumentation is None
+    with pytest.raises(RuntimeError):
+        anoto.snapshot_instrumentation()
+    assert defaults.anoto_6x6_a4_fixed.instrumentation is None
+
+
+def test_instrumentation_stages_and_failures():
+    anoto = make_codec()
+    m = anoto.encode_bitmatrix((64, 64), section=(3, 4))
+    anoto.enable_instrumentation()
+
+    for x in range(10):
+        xy = anoto.decode_position(m[5:9, x : x + 4])
+        assert xy == (x, 5)
+    sec = anoto.decode_section(m[5:9, 3:7], (3, 5))
+    assert sec == (3, 4)
+
+    snap = anoto.snapshot_instrumentation()
+    assert snap["calls"] == {"decode_position": 10, "decode_section": 1}
+    for s in STAGES[:-2]:
+        # two directions per decode
+        assert snap["stages"][s]["count"] == 20
+        assert sum(snap["stages"][s]["histogram"]) == 20
+        assert snap["stages"][s]["total"] > 0
+    assert snap["stages"]["integrate_roll"]["count"] == 1
+    assert snap["failures"] == {}
+
+    # Identical columns yield zero deltas, which are out of range
+    bad = np.zeros((4, 4, 2), dtype=np.int8)
+    with pytest.raises(DecodingError):
+        anoto.decode_position(bad)
+    snap = anoto.snapshot_instrumentation()
+    assert snap["failures"] == {"delta_out_of_range": 1}
+
+    anoto.reset_instrumentation()
+    snap = anoto.snapshot_instrumentation()
+    assert snap["calls"] == {}
+    assert all(snap["stages"][s]["count"] == 0 for s in STAGES)
+
+    anoto.disable_instrumentation()
+    assert anoto.decode_position(m[5:9, 0:4]) == (0, 5)
+
+
+def test_instrumentation_keeps_index_path():
+    anoto = codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+        index_budget=2**20,
+    )
+    m = anoto.encode_bitmatrix((64, 64), section=(3, 4))
+    anoto.enable_instrumentation()
+
+    assert anoto.decode_position(m[5:9, 7:11]) == (7, 5)
+    assert anoto.decode_linear_position(m[5:9, 7:11]) == 7
+
+    snap = anoto.snapshot_instrumentation()
+    assert snap["calls"] == {"decode_position": 1, "decode_linear_position": 1}
+    assert snap["stages"]["index_lookup"]["count"] == 2
+    assert snap["stages"]["mns_search"]["count"] == 0
@@ -1,4 +1,8 @@
+import math
+
 import numpy as np
+import pytest
+
 from microdots.integer import NumberBasis, CRT
 
 
@@ -35,3 +39,62 @@ def test_crt():
     assert crt.solve([97, 0, 3, 211]) == 170326961
 
     assert crt.solve([0, 0, 0, 0]) == 0
+
+
+def test_crt_batch():
+    crt = CRT([236, 233, 31, 241])
+    rs = np.array([[97, 0, 3, 211], [0, 0, 0, 0], [1, 1, 1, 1]])
+    assert list(crt.solve(rs)) == [170326961, 0, 1]
+
+
+def _crt_reference(lengths, remainders):
+    # Python integers do not overflow
+    L = math.prod(lengths)
+    x = 0
+    for li, ri in zip(lengths, remainders):
+        m = L // li
+        x += int(ri) * m * pow(m, -1, li)
+    return x % L
+
+
+@pytest.mark.parametrize(
+    "lengths",
+    [
+        [236, 233, 31, 241],
+        [1000003, 999983, 999979],  # L < 2^63, but ei*ai overflows int64
+        [1000003, 999983, 999979, 2147483647],  # L > 2^63
+        [65537, 65539, 65543, 65551, 65557, 65563],
+    ],
+)
+def test_crt_large_periods(lengths):
+    crt = CRT(lengths)
+    rng = np.random.default_rng(0)
+    rs = rng.integers(0, lengths, size=(500, len(lengths)))
+    rs[0] = np.asarray(lengths) - 1
+    rs[1] = 0
+    xs = crt.solve(rs)
+    assert xs.shape == (500,)
+    assert xs.dtype == (np.int64 if crt.L <= 2**63 else object)
+    assert [int(x) for x in xs] == [_crt_reference(lengths, r) for r in rs]
+    assert int(crt.solve(rs[0])) == _crt_reference(lengths, rs[0])
+
+    digits = crt.digits(rs)
+    assert (digits >= 0).all() and (digits < crt.lengths).all()
+
+
+def test_crt_invalid_lengths():
+    with pytest.raises(ValueError):
+        CRT([4, 6])
+    with pytest.raises(ValueError):
+        CRT([2**31 + 11, 3])
+
+
+def test_numberbasis_large():
+    pfactors = [2**20 + 7] * 4
+    nb = NumberBasis(pfactors)
+    assert nb.upper == (2**20 + 7) ** 4
+    n = np.array([0, 1, nb.upper - 1, 3**50], dtype=object)
+    coeffs = nb.project(n)
+    for c, x in zip(coeffs, n):
+        assert sum(int(ci) * (2**20 + 7) ** i for i, ci in enumerate(c)) == x
+    assert (nb.reconstruct(coeffs) == n).all()
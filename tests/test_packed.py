@@ -0,0 +1,76 @@
+import mmap
+
+import numpy as np
+import pytest
+
+from microdots import codec, defaults, mini_sequences, packed
+
+
+def _windows(c, shape, n, rng, section=(3, 4)):
+    N, M = shape
+    page = c.encode_bitmatrix((80, 80), section=section)
+    ys, xs = rng.integers(0, 80 - N, n), rng.integers(0, 80 - M, n)
+    k, j = np.arange(N), np.arange(M)
+    return page[ys[:, None, None] + k[None, :, None], xs[:, None, None] + j]
+
+
+def test_pack_frames():
+    rng = np.random.default_rng(0)
+    bits = rng.integers(0, 2, (10, 7, 9, 2)).astype(np.int8)
+    frames = packed.pack_frames(bits)
+    assert frames.shape == (10, packed.frame_nbytes((7, 9))) == (10, 16)
+    np.testing.assert_array_equal(packed.unpack_frames(frames, (7, 9)), bits)
+
+    # Symbol i is stored in bits 2*(i%4) of byte i//4
+    sym = bits[0, 0, 1, 0] + 2 * bits[0, 0, 1, 1]
+    assert (frames[0, 0] >> 2) & 3 == sym
+
+    view = packed.frame_view(frames.tobytes(), (7, 9))
+    np.testing.assert_array_equal(view, frames)
+    with pytest.raises(ValueError):
+        packed.frame_view(frames.tobytes()[:-1], (7, 9))
+
+
+@pytest.mark.parametrize("shape", [(6, 6), (7, 9), (8, 6)])
+def test_decode_packed(shape):
+    anoto = defaults.anoto_6x6_a4_fixed
+    rng = np.random.default_rng(0)
+    bits = _windows(anoto, shape, 300, rng)
+    bits[:20] = rng.integers(0, 2, bits[:20].shape)
+    expected = anoto.decode_batch(bits)
+    assert (expected["status"] != codec.DecodeStatus.OK).any()
+
+    buf = packed.pack_frames(bits).tobytes()
+    np.testing.assert_array_equal(anoto.decode_packed(buf, shape), expected)
+    res = anoto.decode_packed(memoryview(buf), shape, sections=False)
+    np.testing.assert_array_equal(res, anoto.decode_batch(bits, sections=False))
+
+    # Single frame
+    nbytes = packed.frame_nbytes(shape)
+    res = anoto.decode_packed(buf[nbytes * 25 : nbytes * 26], shape)
+    np.testing.assert_array_equal(res, expected[25:26])
+
+
+def test_decode_packed_mmap(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    rng = np.random.default_rng(1)
+    bits = _windows(anoto, (6, 6), 100, rng, section=(10, 2))
+    path = tmp_path / "frames.bin"
+    path.write_bytes(packed.pack_frames(bits).tobytes())
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        res = anoto.decode_packed(m)
+        np.testing.assert_array_equal(res, anoto.decode_batch(bits))
+        del res
+    assert (anoto.decode_packed(b"")["x"]).shape == (0,)
+
+
+def test_decode_packed_window_index():
+    s = mini_sequences
+    mini = codec.AnotoCodec(s.MNS, 4, [s.A1, s.A2], [3, 5], (1, 15))
+    rng = np.random.default_rng(2)
+    bits = _windows(mini, (4, 4), 200, rng, section=(1, 1))
+    buf = packed.pack_frames(bits).tobytes()
+    expected = mini.decode_batch(bits)
+    np.testing.assert_array_equal(mini.decode_packed(buf), expected)
+    assert mini.build_index(2**24)
+    np.testing.assert_array_equal(mini.decode_packed(buf), expected)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from microdots import defaults, helpers, preview
+
+
+def _coverage(mask, d):
+    H, W = mask.shape
+    hp, wp = -(-H // d), -(-W // d)
+    cov = np.zeros((hp * d, wp * d))
+    area = np.zeros_like(cov)
+    cov[:H, :W] = mask
+    area[:H, :W] = 1
+    cov = cov.reshape(hp, d, wp, d).sum((1, 3))
+    area = area.reshape(hp, d, wp, d).sum((1, 3))
+    return np.rint(cov / area * 255).astype(np.uint8)
+
+
+def test_build_pyramid(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    H, W = 300, 470
+    page = anoto.encode_region((5, 9), (H, W), section=(2, 3))
+    mask = np.zeros((H, W), dtype=bool)
+    mask[20:130, 40:400] = True
+    mask[200:290, 300:460] = True
+
+    pyr = preview.build_pyramid(tmp_path / "a", page, mask=mask, tile_size=64)
+    assert pyr.shape == (H, W)
+    assert pyr.level_shape(0) == (H * 8, W * 8)
+    assert pyr.level_shape(1) == (H, W)
+    assert max(pyr.level_shape(pyr.num_levels - 1)) <= 64
+
+    # Leaf level is dot-accurate
+    full = preview.render_dots(helpers.bits_to_num(page), 8, mask)
+    np.testing.assert_array_equal(pyr.viewport((0, 0), (H, W)), full)
+    view = pyr.viewport((33, 17), (50, 71))
+    np.testing.assert_array_equal(view, full[17 * 8 : 67 * 8, 33 * 8 : 104 * 8])
+
+    # Overview levels hold the covered fraction
+    for level in range(1, pyr.num_levels):
+        view = pyr.viewport((0, 0), (H, W), level=level)
+        np.testing.assert_array_equal(view, _coverage(mask, 2 ** (level - 1)))
+
+    # Empty tiles are not written
+    assert not (tmp_path / "a" / "0" / "0_0.npy").exists()
+    assert (pyr.tile(0, 0, 0) == 255).all()
+
+    # Strips of arbitrary heights give the same tiles
+    rng = np.random.default_rng(0)
+    cuts = np.unique(np.r_[0, rng.integers(1, H, 15), H])
+    strips = ((page[a:b], mask[a:b]) for a, b in zip(cuts[:-1], cuts[1:]))
+    preview.build_pyramid(tmp_path / "b", strips, shape=(H, W), tile_size=64)
+    files = sorted(p.relative_to(tmp_path / "a") for p in (tmp_path / "a").rglob("*"))
+    assert files == sorted(
+        p.relative_to(tmp_path / "b") for p in (tmp_path / "b").rglob("*")
+    )
+    for f in files:
+        if f.suffix == ".npy":
+            a, b = np.load(tmp_path / "a" / f), np.load(tmp_path / "b" / f)
+            np.testing.assert_array_equal(a, b)
+
+
+def test_page_strips_and_levels(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    strips = preview.page_strips(anoto, (100, 90), section=(1, 1), strip=30)
+    pyr = preview.build_pyramid(tmp_path, strips, shape=(100, 90), cell=4, tile_size=32)
+    page = anoto.encode_bitmatrix((100, 90), section=(1, 1))
+    np.testing.assert_array_equal(
+        pyr.viewport((0, 0), (100, 90)),
+        preview.render_dots(helpers.bits_to_num(page), 4),
+    )
+    assert pyr.level_for(4) == 0 and pyr.level_for(1) == 1
+    assert pyr.level_for(0.3) == 2
+    assert pyr.level_for(1e-6) == pyr.num_levels - 1
+    assert pyr.viewport((8, 12), (80, 80), px_per_dot=0.25).shape == (20, 20)
+
+    # Reopened from disk
+    again = preview.PreviewPyramid(tmp_path)
+    assert again.num_levels == pyr.num_levels and again.shape == pyr.shape
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from microdots import defaults
+from microdots.registry import DocumentRegistry
+
+
+def test_registry_allocate_nonoverlapping():
+    reg = DocumentRegistry((1000, 500), (2, 2), spacing=2)
+    reg.add(doc=99, section=(0, 0), origin=(100, 0), shape=(50, 50))
+    with pytest.raises(ValueError):
+        reg.add(doc=98, section=(0, 0), origin=(120, 20), shape=(50, 50))
+
+    for d in range(40):
+        reg.allocate(doc=d, shape=(120, 90), pages=2)
+    r = reg.regions
+    assert len(r) == 81
+    assert (r["x1"] <= 1000).all() and (r["y1"] <= 500).all()
+    for i in range(len(r)):
+        other = np.delete(r, i)
+        same = (other["u"] == r[i]["u"]) & (other["v"] == r[i]["v"])
+        overlap = (
+            same
+            & (other["x0"] < r[i]["x1"])
+            & (other["x1"] > r[i]["x0"])
+            & (other["y0"] < r[i]["y1"])
+            & (other["y1"] > r[i]["y0"])
+        )
+        assert not overlap.any()
+    # Sections are filled before moving on
+    sections = r["u"] * 2 + r["v"]
+    assert np.all(np.diff(sections[1:]) >= 0)
+    assert set(sections) == {0, 1}
+
+    with pytest.raises(ValueError):
+        for d in range(100):
+            reg.allocate(doc=d, shape=(120, 90))
+
+
+def test_registry_lookup_and_persistence(tmp_path):
+    reg = DocumentRegistry((10000, 10000), (4, 4))
+    rng = np.random.default_rng(0)
+    for d in range(500):
+        reg.allocate(doc=d, shape=rng.integers(50, 400, size=2), pages=3)
+
+    r = reg.regions
+    pick = rng.integers(0, len(r), size=5000)
+    c = r[pick]
+    lx = rng.integers(0, c["x1"] - c["x0"])
+    ly = rng.integers(0, c["y1"] - c["y0"])
+    xy = np.stack((c["x0"] + lx, c["y0"] + ly), -1)
+    uv = np.stack((c["u"], c["v"]), -1)
+
+    docs, pages, local = reg.lookup(uv, xy)
+    assert np.all(docs == c["doc"])
+    assert np.all(pages == c["page"])
+    assert np.all(local == np.stack((lx, ly), -1))
+
+    # Misses: unused space, foreign sections and invalid decodes
+    docs, pages, local = reg.lookup(
+        [[3, 3], [0, 0], [-1, -1]], [[5, 5], [9999, 9999], [0, 0]]
+    )
+    assert list(docs) == [-1, -1, -1]
+    assert (local == -1).all()
+
+    path = str(tmp_path / "reg.npz")
+    reg.save(path)
+    reg2 = DocumentRegistry.load(path)
+    assert np.all(reg2.regions == reg.regions)
+    docs2, _, _ = reg2.lookup(uv, xy)
+    assert np.all(docs2 == c["doc"])
+    # Allocation continues where it stopped
+    idx = reg2.allocate(doc=1000, shape=(10, 10))[0]
+    assert reg2.regions[idx]["doc"] == 1000
+    assert len(reg2) == len(reg) + 1
+
+
+def test_registry_locate_windows():
+    anoto = defaults.anoto_6x6_a4_fixed
+    reg = DocumentRegistry.for_codec(anoto)
+    reg.allocate(doc=7, shape=(40, 30))
+    reg.allocate(doc=8, shape=(40, 30))
+    (idx,) = reg.allocate(doc=9, shape=(40, 30))
+    region = reg.regions[idx]
+
+    m = anoto.encode_bitmatrix((region["y1"], region["x1"]), section=(0, 0))
+    windows = np.stack([m[y : y + 6, x : x + 6] for y, x in [(0, 65), (30, 80)]])
+    docs, pages, local = reg.locate(anoto, windows)
+    assert list(docs) == [9, 9]
+    assert local.tolist() == [[65 - region["x0"], 0], [80 - region["x0"], 30]]
+
+    # Grid keys of small cells over the full address space exceed int64
+    with pytest.raises(ValueError):
+        DocumentRegistry.for_codec(anoto, cell_size=4)
+    reg = DocumentRegistry.for_codec(anoto)
+    reg.add(doc=1, section=(62, 62), origin=(reg.extent[0] - 4, 0), shape=(4, 4))
+    docs, _, _ = reg.lookup([[62, 62]], [[reg.extent[0] - 1, 3]])
+    assert list(docs) == [1]
+    assert reg._num_cells(reg._index["cell"]) < 2**63
@@ -0,0 +1,50 @@
+import numpy as np
+
+from microdots import defaults
+from microdots.results import ResultWriter, empty_results, load_results, result_dtype
+
+
+def test_result_dtype():
+    assert result_dtype().names == ("x", "y", "u", "v", "rotation", "status")
+    assert result_dtype(timestamp=True, device=True).names[-2:] == (
+        "timestamp",
+        "device",
+    )
+    res = empty_results(3)
+    assert (res["x"] == -1).all() and (res["status"] == 0).all()
+
+
+def test_result_writer(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((40, 40), section=(1, 2))
+    windows = np.stack([m[i : i + 6, i : i + 6] for i in range(30)])
+
+    dtype = result_dtype(timestamp=True)
+    with ResultWriter(str(tmp_path), dtype=dtype, chunk_size=16) as writer:
+        for i in range(0, 30, 10):
+            rows = anoto.decode_batch(windows[i : i + 10], out=writer.reserve(10))
+            rows["timestamp"] = i
+    chunks = load_results(str(tmp_path))
+    assert [len(c) for c in chunks] == [10, 10, 10]
+    res = np.concatenate(chunks)
+    assert res.dtype == dtype
+    np.testing.assert_array_equal(res["x"], np.arange(30))
+    np.testing.assert_array_equal(res["timestamp"], np.repeat([0, 10, 20], 10))
+
+    # Reopening appends new chunks
+    with ResultWriter(str(tmp_path), dtype=dtype, chunk_size=16) as writer:
+        writer.append(res[:20])
+    chunks = load_results(str(tmp_path))
+    assert [len(c) for c in chunks] == [10, 10, 10, 16, 4]
+    np.testing.assert_array_equal(np.concatenate(chunks[3:]), res[:20])
+
+    # Reservations larger than a chunk are split into chunks when written
+    with ResultWriter(str(tmp_path), dtype=dtype, chunk_size=16) as writer:
+        writer.reserve(4)["x"] = 7
+        rows = anoto.decode_batch(windows, out=writer.reserve(30))
+        rows["timestamp"] = 1
+        writer.reserve(2)
+    chunks = load_results(str(tmp_path))
+    assert [len(c) for c in chunks[5:]] == [4, 16, 14, 2]
+    np.testing.assert_array_equal(np.concatenate(chunks[6:8])["x"], np.arange(30))
+    assert len(writer._buffer) == 16
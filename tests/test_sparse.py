@@ -0,0 +1,51 @@
+import numpy as np
+
+from microdots import defaults, helpers
+
+
+def test_encode_points():
+    anoto = defaults.anoto_6x6_a4_fixed
+    m = anoto.encode_bitmatrix((100, 120), section=(4, 9))
+    rng = np.random.default_rng(0)
+    xy = np.stack((rng.integers(0, 120, 50), rng.integers(0, 100, 50)), -1)
+    bits = anoto.encode_points(xy, section=(4, 9))
+    np.testing.assert_array_equal(bits, m[xy[:, 1], xy[:, 0]])
+
+
+def test_encode_sparse():
+    anoto = defaults.anoto_6x6_a4_fixed
+    H, W = 300, 200
+    page = anoto.encode_region((50, 70), (H, W), section=(4, 9))
+
+    regions = [(10, 20, 60, 45), (150, 250, 400, 400), (0, 0, 0, 10)]
+    mask = np.zeros((10, 10), dtype=bool)
+    mask[5, 1] = True
+    pattern = anoto.encode_sparse(
+        (H, W),
+        regions=regions,
+        mask=mask,
+        section=(4, 9),
+        origin=(50, 70),
+        tile_size=64,
+    )
+
+    expected_mask = np.zeros((H, W), dtype=bool)
+    expected_mask[20:45, 10:60] = True
+    expected_mask[250:, 150:] = True
+    expected_mask[150:180, 20:40] = True
+    bits, cov = pattern.to_dense()
+    np.testing.assert_array_equal(cov, expected_mask)
+    np.testing.assert_array_equal(bits[cov], page[cov])
+    assert (bits[~cov] == 0).all()
+    assert pattern.num_dots == expected_mask.sum()
+    assert len(pattern) == 6
+    assert pattern.nbytes < page.nbytes
+
+    xy, symbols = pattern.coordinates()
+    assert len(xy) == expected_mask.sum()
+    assert expected_mask[xy[:, 1], xy[:, 0]].all()
+    expected = helpers.bits_to_num(page[xy[:, 1], xy[:, 0]])
+    np.testing.assert_array_equal(symbols, expected)
+
+    empty = anoto.encode_sparse((H, W), regions=[])
+    assert len(empty) == 0 and empty.coordinates()[0].shape == (0, 2)
@@ -0,0 +1,110 @@
+import numpy as np
+
+from microdots import defaults, results, workload
+from microdots.codec import DecodeStatus
+from microdots.strokes import SectionLayout, assemble_strokes, split_strokes
+
+
+def test_assemble_strokes():
+    anoto = defaults.anoto_6x6_a4_fixed
+    sheet = workload.Sheet.create(anoto, (128, 96), (2, 2))
+    samples = workload.synthesize_strokes(
+        sheet, num_pens=6, duration=5.0, pen_up=(0.1, 0.5), seed=0
+    )
+    frames = workload.make_frames(sheet, samples)
+    rows = anoto.decode_batch(frames.bits, rotation=True)
+    assert (rows["status"] == DecodeStatus.OK).all()
+
+    # Wrong decodes and failures
+    rng = np.random.default_rng(0)
+    N = len(rows)
+    wrong = rng.choice(N, N // 50, replace=False)
+    rows["x"][wrong] = rng.integers(0, 96, len(wrong))
+    rows["y"][wrong] = rng.integers(0, 128, len(wrong))
+    failed = rng.choice(N, N // 20, replace=False)
+    rows["status"][failed] = DecodeStatus.MNS_NOT_FOUND
+
+    layout = sheet.layout()
+    out = assemble_strokes(rows, frames.t, frames.pen, layout=layout, max_speed=1000)
+    assert (np.diff(out["stroke"]) >= 0).all()
+    assert not np.isin(out["frame"][~out["interpolated"]], wrong).any()
+    assert out["interpolated"][np.isin(out["frame"], failed)].all()
+
+    truth = frames.truth[out["frame"]]
+    page = layout.lookup(np.stack((truth["u"], truth["v"]), -1))
+    gx = truth["x"] + layout.offsets[page, 0]
+    gy = truth["y"] + layout.offsets[page, 1]
+    assert np.hypot(out["x"] - gx, out["y"] - gy).max() < 5
+    np.testing.assert_array_equal(out["rotation"], truth["rotation"])
+
+    # Strokes do not mix and long strokes are recovered
+    polylines = split_strokes(out)
+    assert len(polylines) == out["stroke"].max() + 1
+    ids = [np.unique(samples["stroke"][p["frame"]]) for p in polylines]
+    assert all(len(i) == 1 for i in ids)
+    counts = np.bincount(samples["stroke"])
+    assert set(np.flatnonzero(counts >= 10)) <= {int(i[0]) for i in ids}
+
+
+def test_assemble_strokes_splits():
+    t = np.arange(100) * 0.01
+    rows = results.empty_results(100)
+    rows["x"] = np.arange(100)
+    rows["y"] = 7
+    rows["u"], rows["v"] = 3, 4
+    rows["rotation"] = 0
+    rows["status"] = DecodeStatus.OK
+
+    out = assemble_strokes(rows, t)
+    assert out["stroke"].max() == 0 and not out["interpolated"].any()
+    np.testing.assert_array_equal(out["frame"], np.arange(100))
+
+    # Pause, long failure, section change, and a short dangling piece
+    t[50:] += 0.2
+    rows["status"][20:35] = DecodeStatus.SNS_NOT_FOUND
+    rows["status"][10:12] = DecodeStatus.SNS_NOT_FOUND
+    rows["u"][80:] = 5
+    rows["status"][90:] = DecodeStatus.SNS_NOT_FOUND
+    out = assemble_strokes(rows, t)
+    parts = [p["frame"] for p in split_strokes(out)]
+    assert [(p[0], p[-1]) for p in parts] == [(0, 19), (35, 49), (50, 79), (80, 89)]
+    assert out["interpolated"][np.isin(out["frame"], [10, 11])].all()
+    np.testing.assert_allclose(out["x"], out["frame"])
+
+    # Unknown sections are dropped, known ones are offset
+    layout = SectionLayout(np.array([[3, 4]]), np.array([[1000, 2000]]))
+    out = assemble_strokes(rows, t, layout=layout, min_samples=3)
+    assert out["frame"].max() == 79
+    np.testing.assert_allclose(out["x"], out["frame"] + 1000)
+    np.testing.assert_allclose(out["y"], 2007)
+
+    # Pens are assembled independently
+    pen = np.arange(100) % 2
+    out = assemble_strokes(rows[:50], t[:50] * 2, pen[:50], max_speed=100)
+    assert set(out["pen"]) == {0, 1}
+    assert all(len(np.unique(p["pen"])) == 1 for p in split_strokes(out))
+
+    rows["status"] = DecodeStatus.SNS_NOT_FOUND
+    assert len(assemble_strokes(rows, t)) == 0
+    assert len(assemble_strokes(rows[:0], t[:0])) == 0
+
+
+def test_assemble_short_stroke_with_outlier():
+    rows = results.empty_results(7)
+    rows["x"] = np.arange(100, 107)
+    rows["y"] = 5
+    rows["u"], rows["v"], rows["rotation"] = 0, 0, 0
+    rows["status"] = DecodeStatus.OK
+    rows["x"][3] = 900
+    t = np.arange(7) * 0.01
+
+    out = assemble_strokes(rows, t)
+    np.testing.assert_array_equal(out["frame"], np.arange(7))
+    assert out["stroke"].max() == 0
+    np.testing.assert_array_equal(out["interpolated"], np.arange(7) == 3)
+    np.testing.assert_allclose(out["x"], np.arange(100, 107))
+
+    # A misdecode starting the stroke is shorter than its neighbour
+    rows["x"][3], rows["x"][0] = 103, 900
+    out = assemble_strokes(rows, t)
+    np.testing.assert_array_equal(out["frame"], np.arange(1, 7))
@@ -0,0 +1,107 @@
+import gc
+import io
+import threading
+import urllib.request
+import weakref
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from microdots import codec, defaults, mini_sequences
+from microdots.tiles import TileProvider, make_http_handler
+
+
+def test_tiles_match_encoding():
+    anoto = defaults.anoto_6x6_a4_fixed
+    provider = TileProvider()
+    m = anoto.encode_bitmatrix((192, 256), section=(3, 4))
+    for ty in range(3):
+        for tx in range(4):
+            tile = provider(anoto, (3, 4), tx, ty, 64)
+            assert np.all(tile == m[ty * 64 : (ty + 1) * 64, tx * 64 : (tx + 1) * 64])
+    with pytest.raises(ValueError):
+        tile[0, 0, 0] = 1
+    with pytest.raises(ValueError):
+        provider(anoto, (3, 4), -1, 0, 64)
+
+
+def test_tiles_memory_and_disk_cache(tmp_path):
+    anoto = defaults.anoto_6x6_a4_fixed
+    tile_bytes = 32 * 32 * 2
+    provider = TileProvider(
+        memory_bytes=2 * tile_bytes, disk_dir=str(tmp_path), disk_bytes=10**9
+    )
+    a = provider.get(anoto, (0, 0), 0, 0, 32)
+    provider.get(anoto, (0, 0), 0, 0, 32)
+    provider.get(anoto, (0, 0), 1, 0, 32)
+    provider.get(anoto, (0, 0), 2, 0, 32)  # evicts (0,0) from memory
+    b = provider.get(anoto, (0, 0), 0, 0, 32)
+    assert np.all(a == b)
+    s = provider.snapshot_stats()
+    assert s["misses"] == 3
+    assert s["memory_hits"] == 1
+    assert s["disk_hits"] == 1
+    assert s["memory_evictions"] >= 1
+    assert s["memory_tiles"] == 2
+    assert s["disk_tiles"] == 3
+
+    # Different codec and section are different keys
+    provider.get(defaults.anoto_6x6, (0, 0), 0, 0, 32)
+    provider.get(anoto, (1, 0), 0, 0, 32)
+    assert provider.snapshot_stats()["misses"] == 5
+
+    # Disk cache survives the provider and is bounded
+    file_bytes = s["disk_bytes"] // 3
+    provider = TileProvider(disk_dir=str(tmp_path), disk_bytes=2 * file_bytes)
+    assert provider.snapshot_stats()["disk_tiles"] == 5
+    provider.get(anoto, (1, 0), 0, 0, 32)
+    s = provider.snapshot_stats()
+    assert s["disk_hits"] == 1 and s["misses"] == 0
+    provider.get(anoto, (5, 5), 0, 0, 32)
+    s = provider.snapshot_stats()
+    assert s["disk_tiles"] == 2
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_tiles_http():
+    anoto = defaults.anoto_6x6_a4_fixed
+    provider = TileProvider()
+    handler = make_http_handler(provider, {"a4fixed": anoto})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/tile/a4fixed/3/4/16/2/1") as r:
+            tile = np.load(io.BytesIO(r.read()))
+        assert np.all(tile == anoto.encode_region((32, 16), (16, 16), (3, 4)))
+        with urllib.request.urlopen(f"{url}/stats") as r:
+            assert b'"misses": 1' in r.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/tile/unknown/0/0/16/0/0")
+        for path in ("0/0/1025/0/0", "0/0/16/-1/0", f"0/0/16/0/{anoto.crt.L}"):
+            with pytest.raises(urllib.error.HTTPError) as e:
+                urllib.request.urlopen(f"{url}/tile/a4fixed/{path}")
+            assert e.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_tiles_fingerprints_do_not_keep_codecs_alive():
+    provider = TileProvider()
+    anoto = codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+    )
+    provider.get(anoto, (0, 0), 0, 0, 8)
+    assert len(provider._fingerprints) == 1
+    ref = weakref.ref(anoto)
+    del anoto
+    gc.collect()
+    assert ref() is None
+    assert len(provider._fingerprints) == 0
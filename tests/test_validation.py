@@ -0,0 +1,118 @@
+import pytest
+
+from microdots import codec, defaults, mini_sequences, validation
+
+
+def test_validate_mini_full_period():
+    anoto = codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+    )
+    for section in [0, 5]:
+        report = validation.validate_codec(
+            anoto, section=section, chunk_size=500, max_workers=0
+        )
+        assert report.num_checked == 27 * 125
+        assert report.ok
+
+
+def test_validate_detects_a4_collisions():
+    report = validation.validate_codec(
+        defaults.anoto_6x6, stop=4096, chunk_size=1000, max_workers=0
+    )
+    assert not report.ok
+    assert report.num_failed == 0
+    assert report.collisions[0] == (217, 139779713)
+    assert report.unreachable[0][0] == 217
+
+    report = validation.validate_codec(
+        defaults.anoto_6x6_a4_fixed, stop=4096, chunk_size=1000, max_workers=0
+    )
+    assert report.ok
+
+
+def test_validate_process_pool():
+    report = validation.validate_codec(
+        defaults.anoto_6x6, stop=2048, chunk_size=100, max_workers=2
+    )
+    expected = validation.validate_codec(
+        defaults.anoto_6x6, stop=2048, chunk_size=100, max_workers=0
+    )
+    assert report == expected
+
+
+def test_validate_checkpoint_resume(tmp_path):
+    path = str(tmp_path / "ckpt.json")
+    expected = validation.validate_codec(
+        defaults.anoto_6x6, stop=3000, chunk_size=100, max_workers=0
+    )
+
+    def interrupt(num_checked, total):
+        if num_checked >= 1500:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        validation.validate_codec(
+            defaults.anoto_6x6,
+            stop=3000,
+            chunk_size=100,
+            max_workers=0,
+            checkpoint=path,
+            checkpoint_every=1,
+            progress=interrupt,
+        )
+
+    checked = []
+    report = validation.validate_codec(
+        defaults.anoto_6x6,
+        stop=3000,
+        chunk_size=100,
+        max_workers=0,
+        checkpoint=path,
+        progress=lambda n, t: checked.append(n),
+    )
+    assert checked[0] > 1500
+    assert report == expected
+
+    with pytest.raises(ValueError):
+        validation.validate_codec(
+            defaults.anoto_6x6_a4_fixed, stop=3000, max_workers=0, checkpoint=path
+        )
+
+
+def test_validate_checkpoint_resume_other_chunk_size(tmp_path):
+    path = str(tmp_path / "ckpt.json")
+    expected = validation.validate_codec(
+        defaults.anoto_6x6, stop=3000, chunk_size=100, max_workers=0
+    )
+
+    def interrupt(num_checked, total):
+        if num_checked >= 1500:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        validation.validate_codec(
+            defaults.anoto_6x6,
+            stop=3000,
+            chunk_size=100,
+            max_workers=0,
+            checkpoint=path,
+            checkpoint_every=3,
+            progress=interrupt,
+        )
+
+    # Chunks of the new size start within the ranges validated before
+    checked = []
+    report = validation.validate_codec(
+        defaults.anoto_6x6,
+        stop=3000,
+        chunk_size=70,
+        max_workers=0,
+        checkpoint=path,
+        progress=lambda n, t: checked.append(n),
+    )
+    assert checked[0] > 1200
+    assert report == expected
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from microdots import defaults
+from microdots.exceptions import DecodingError
+from microdots.verification import Registration, register_scan, verify_print
+
+
+def test_verify_print():
+    anoto = defaults.anoto_6x6_a4_fixed
+    origin, section = (1000, 2500), (7, 3)
+    scan = anoto.encode_region(origin, (300, 200), section=section)
+
+    reg = register_scan(anoto, scan)
+    assert reg.origin == origin and reg.section == section
+    assert reg.num_agreeing == reg.num_anchors
+    assert reg.shift((990, 2500)) == (10, 0)
+
+    report = verify_print(anoto, scan, tile_size=64, strip_tiles=2)
+    assert report.dot_errors.shape == (5, 4)
+    assert report.num_dots == 300 * 200 and report.num_errors == 0
+    assert (report.dot_errors == 0).all() and (report.decode_failures == 0).all()
+
+    # Corrupt a block of dots and flip a few isolated bits
+    scan = scan.copy()
+    scan[70:120, 140:190] = 1 - scan[70:120, 140:190]
+    scan[250, 10, 0] ^= 1
+    report = verify_print(anoto, scan, tile_size=64)
+    assert report.registration.origin == origin
+    assert report.num_errors == 50 * 50 + 1
+    assert report.dot_errors[1, 2] > 0.5 and report.dot_errors[0, 0] == 0
+    assert report.dot_errors[3, 0] == 1 / 64**2
+    assert report.decode_failures[1, 2] > 0.5 and report.decode_failures[0, 0] == 0
+    assert report.error_rate == pytest.approx(2501 / 60000)
+
+    # Verify against a known, but shifted, page
+    expected = Registration((origin[0] - 1, origin[1]), section, 0, 0)
+    report = verify_print(anoto, scan, registration=expected)
+    assert report.error_rate > 0.5
+
+
+def test_register_scan_fails():
+    with pytest.raises(DecodingError):
+        register_scan(defaults.anoto_6x6_a4_fixed, np.zeros((64, 64, 2), np.int8))
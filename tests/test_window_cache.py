@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from microdots import anoto_sequences, codec, helpers
+from microdots.window_cache import CACHED_COLUMNS, WindowCache
+
+
+@pytest.fixture
+def anoto():
+    # Fresh instance, to not leak the cache into the shared defaults
+    s = anoto_sequences
+    return codec.AnotoCodec(
+        s.MNS, 6, (s.A1, s.A2, s.A3, s.A4_alt), [3, 3, 2, 3], (5, 58)
+    )
+
+
+def _windows(anoto, n, rng):
+    page = anoto.encode_bitmatrix((60, 60), section=(5, 7))
+    ys, xs = rng.integers(0, 54, n), rng.integers(0, 54, n)
+    k = np.arange(6)
+    return page[ys[:, None, None] + k[None, :, None], xs[:, None, None] + k]
+
+
+def test_cached_decode_batch_matches_uncached(anoto):
+    rng = np.random.default_rng(0)
+    bits = _windows(anoto, 40, rng)
+    bits[3] = 1 - bits[3]  # failing window
+    bits = np.concatenate((bits, bits[:10]))
+    bits = np.concatenate((bits, helpers.rot90(bits[:5], k=1)))
+    expected = anoto.decode_batch(bits, rotation=True)
+
+    cache = anoto.enable_cache(max_size=100)
+    res = anoto.decode_batch(bits, rotation=True)
+    np.testing.assert_array_equal(res, expected)
+    assert cache.misses == len(np.unique(bits.reshape(len(bits), -1), axis=0))
+    assert cache.hits == len(bits) - cache.misses
+
+    # Second pass is served from the cache
+    res = anoto.decode_batch(bits, rotation=True)
+    np.testing.assert_array_equal(res, expected)
+    assert cache.misses == len(cache)
+    assert cache.info()["hit_rate"] > 0.5
+
+    # Options are part of the key
+    res = anoto.decode_batch(bits, sections=False)
+    assert (res["u"] == -1).all()
+    anoto.disable_cache()
+    np.testing.assert_array_equal(res, anoto.decode_batch(bits, sections=False))
+
+
+def test_hovering_pen(anoto):
+    rng = np.random.default_rng(1)
+    bits = np.repeat(_windows(anoto, 4, rng), 25, axis=0)
+    cache = anoto.enable_cache()
+    res = anoto.decode_batch(bits)
+    assert cache.misses == 4 and cache.hits == 96
+    assert (res["status"] == codec.DecodeStatus.OK).all()
+
+
+def test_lru_eviction():
+    def decode_fn(b):
+        # Fake decoding that reports the first bit as position
+        return {c: b[:, 0, 0, 0].astype(np.int64) for c in CACHED_COLUMNS}
+
+    bits = np.zeros((3, 1, 1, 2), dtype=np.int8)
+    bits[1, 0, 0, 0] = 1
+    bits[2, 0, 0, 1] = 1
+    cache = WindowCache(max_size=2)
+    res = cache.decode(decode_fn, bits[[0, 1]], ())
+    assert list(res["x"]) == [0, 1]
+    cache.decode(decode_fn, bits[[0]], ())
+    res = cache.decode(decode_fn, bits[[2, 2]], ())
+    assert list(res["x"]) == [0, 0]
+    # The window of bits[1] was used least recently
+    cache.decode(decode_fn, bits[[0, 2]], ())
+    assert cache.info() == {
+        "size": 2,
+        "max_size": 2,
+        "hits": 4,
+        "misses": 3,
+        "evictions": 1,
+        "hit_rate": 4 / 7,
+    }
+    cache.decode(decode_fn, bits[[1]], ())
+    assert cache.misses == 4 and cache.evictions == 2
+    cache.clear()
+    assert len(cache) == 0
+    with pytest.raises(ValueError):
+        WindowCache(0)
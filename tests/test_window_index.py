@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from microdots import codec, defaults, mini_sequences
+from microdots.exceptions import DecodingError
+from microdots.window_index import WindowIndex
+
+
+def make_codec(**kwargs):
+    return codec.AnotoCodec(
+        mini_sequences.MNS,
+        4,
+        [mini_sequences.A1, mini_sequences.A2],
+        [3, 5],
+        (1, 15),
+        **kwargs,
+    )
+
+
+def test_index_estimate():
+    num, dense, sparse = WindowIndex.estimate(make_codec())
+    assert num == 27 * 125 * 16
+    assert dense == 2**16 * 4
+    # 6x6 is far too large for either representation
+    num, dense, sparse = WindowIndex.estimate(defaults.anoto_6x6_a4_fixed)
+    assert dense > 2**32 and sparse > 2**32
+    assert not codec.AnotoCodec(
+        defaults.anoto_6x6.mns, 6, defaults.anoto_6x6.sns, [3, 3, 2, 3], (5, 58)
+    ).build_index(2**20)
+
+
+@pytest.mark.parametrize("dense", [True, False])
+def test_index_decode(dense):
+    plain = make_codec()
+    indexed = make_codec(index_budget=2**20)
+    assert indexed.window_index.dense
+    if not dense:
+        lut = indexed.window_index.values
+        keys = np.flatnonzero(lut >= 0)
+        indexed.window_index = WindowIndex(keys, lut[keys], 4)
+
+    m = plain.encode_bitmatrix((128, 128), section=(7, 3))
+    windows = np.lib.stride_tricks.sliding_window_view(m, (4, 4), axis=(0, 1))
+    windows = windows.transpose(0, 1, 3, 4, 2).reshape(-1, 4, 4, 2)
+
+    xy, status = indexed.decode_positions(windows)
+    exy, estatus = plain.decode_positions(windows)
+    assert np.all(xy == exy) and np.all(status == estatus)
+    for w in windows[::101]:
+        assert indexed.decode_position(w) == plain.decode_position(w)
+
+    # Misses fall back to regular decoding
+    bad = np.zeros((4, 4, 2), dtype=np.int8)
+    with pytest.raises(DecodingError):
+        indexed.decode_position(bad)
+    _, status = indexed.decode_positions(bad[None])
+    assert status[0] == codec.DecodeStatus.DELTA_OUT_OF_RANGE
+
+
+def test_index_cache(tmp_path):
+    path = str(tmp_path / "index.npz")
+    a = make_codec(index_budget=2**20, index_cache=path)
+    b = make_codec(index_budget=2**20, index_cache=path)
+    assert np.all(a.window_index.values == b.window_index.values)
+
+    # A cache of a different codec is not used
+    other = codec.AnotoCodec(
+        mini_sequences.MNS, 4, [mini_sequences.A1, mini_sequences.A2], [3, 5], (2, 16)
+    )
+    assert WindowIndex.load(path, other.fingerprint()) is None
@@ -0,0 +1,64 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from microdots import defaults
+from microdots.workload import (
+    STROKE_DTYPE,
+    Sheet,
+    load_strokes,
+    make_frames,
+    replay,
+    synthesize_strokes,
+)
+
+
+@pytest.fixture(scope="module")
+def sheet():
+    return Sheet.create(defaults.anoto_6x6_a4_fixed, (128, 96), (2, 2))
+
+
+def test_make_frames(sheet, tmp_path):
+    samples = synthesize_strokes(
+        sheet, num_pens=4, duration=2.0, rotation_prob=0.5, seed=0
+    )
+    assert (np.diff(samples["t"]) >= 0).all()
+    assert set(samples["pen"]) == {0, 1, 2, 3}
+    assert (samples["rotation"] != 0).any()
+
+    np.save(tmp_path / "strokes.npy", samples)
+    samples = load_strokes(str(tmp_path / "strokes.npy"))
+    assert samples.dtype == STROKE_DTYPE
+
+    frames = make_frames(sheet, samples)
+    assert frames.bits.shape == (len(samples), 8, 8, 2)
+    assert len(np.unique(frames.truth[["u", "v"]])) > 1
+
+    report = replay(defaults.anoto_6x6_a4_fixed, frames)
+    assert report.num_decoded == len(samples) and report.num_dropped == 0
+    assert report.num_failed == 0 and report.num_wrong == 0
+    assert report.fps > 0 and len(report.latencies) == len(samples)
+
+    few = samples[:20]
+    frames = make_frames(sheet, few)
+    report = replay(defaults.anoto_6x6_a4_fixed, frames, method="single")
+    assert report.num_decoded == 20 and report.num_wrong == 0
+
+
+def test_replay_drops(sheet):
+    # 100 frames arriving at once, a decoder taking one second per batch
+    samples = np.zeros(100, dtype=STROKE_DTYPE)
+    samples["x"] = np.arange(100)
+    frames = make_frames(sheet, samples)
+    clock = itertools.count(step=1.0).__next__
+
+    report = replay(
+        defaults.anoto_6x6_a4_fixed, frames, max_batch=10, queue_size=30, clock=clock
+    )
+    assert report.num_dropped == 70 and report.num_decoded == 30
+    assert report.num_batches == 3
+    np.testing.assert_allclose(np.sort(report.latencies), np.repeat([1, 2, 3], 10))
+    assert report.fps == pytest.approx(10.0)
+    assert report.drop_rate == pytest.approx(0.7)
+    assert report.summary()["latency_max"] == pytest.approx(3.0)